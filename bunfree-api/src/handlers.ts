@@ -5,7 +5,7 @@ import { StringOutputParser } from "@langchain/core/output_parsers";
 import { RunnableSequence } from "@langchain/core/runnables";
 
 import { LLMResponse } from './types';
-import { searchBooths, searchItems, searchBoothByName, searchBoothByTwitter } from './search';
+import { searchBoothsAndItems, searchBoothByName, searchBoothByTwitter } from './search';
 import { vectorSearchPrompt, boothNameSearchPrompt, boothTwitterSearchPrompt, eventInfoPrompt, generalChatPrompt } from './prompts';
 // ベクトル検索処理
 async function handleVectorSearch(
@@ -15,9 +15,8 @@ async function handleVectorSearch(
     qdrantClient: QdrantClient,
     llm: ChatGoogleGenerativeAI
 ): Promise<LLMResponse> {
-    // 検索実行（最適化されたクエリを使用）
-    const boothResults = await searchBooths(searchQuery, embeddings, qdrantClient, 3);
-    const itemResults = await searchItems(searchQuery, embeddings, qdrantClient, 3);
+    // 検索実行（最適化されたクエリを使用。ベクトル化は1回で、ブースとアイテムを並行して検索）
+    const { boothResults, itemResults } = await searchBoothsAndItems(searchQuery, embeddings, qdrantClient, 3, 3);
 
     // 検索結果を統合
     const combinedResults = [
@@ -1,6 +1,7 @@
 import { VoyageEmbeddings } from "@langchain/community/embeddings/voyage";
 import { QdrantClient } from '@qdrant/js-client-rest';
 import { BoothResult, ItemResult } from './types';
+import { cachedSearch } from './searchCache';
 
 
 // ブース検索関数 - 意味的検索
@@ -11,18 +12,21 @@ async function searchBooths(
     limit = 5
 ): Promise<BoothResult[]> {
     try {
-        // ベクトル化
-        const queryEmbedding = await embeddings.embedQuery(query);
-
-        // Qdrantで検索
-        const searchResult = await qdrantClient.search('booths', {
-            vector: queryEmbedding,
-            limit: limit,
-            with_payload: true,
-            with_vector: false,
-        });
+        // 同じ検索はキャッシュから返す（ベクトル化も省ける）
+        return await cachedSearch(qdrantClient, 'booths', query, null, limit, async () => {
+            // ベクトル化
+            const queryEmbedding = await embeddings.embedQuery(query);
+
+            // Qdrantで検索
+            const searchResult = await qdrantClient.search('booths', {
+                vector: queryEmbedding,
+                limit: limit,
+                with_payload: true,
+                with_vector: false,
+            });
 
-        return searchResult as unknown as BoothResult[];
+            return searchResult as unknown as BoothResult[];
+        });
     } catch (error) {
         console.error('ブース検索でエラーが発生しました:', error);
         return [];
@@ -36,24 +40,27 @@ async function searchBoothByName(
     limit = 5
 ) {
     try {
-        // Qdrantで検索（フィルター付き）
-        const searchResult = await qdrantClient.scroll('booths', {
-            limit: limit,
-            with_payload: true,
-            filter: {
-                must: [
-                    {
-                        key: "name",
-                        match: {
-                            text: circleName,
-                        },
+        const filter = {
+            must: [
+                {
+                    key: "name",
+                    match: {
+                        text: circleName,
                     },
-                ],
-            },
-        });
+                },
+            ],
+        };
+        return await cachedSearch(qdrantClient, 'booths', '', filter, limit, async () => {
+            // Qdrantで検索（フィルター付き）
+            const searchResult = await qdrantClient.scroll('booths', {
+                limit: limit,
+                with_payload: true,
+                filter,
+            });
 
-        // 検索結果をそのまま返す
-        return searchResult.points as unknown as BoothResult[];
+            // 検索結果をそのまま返す
+            return searchResult.points as unknown as BoothResult[];
+        });
     } catch (error) {
         console.error('サークル名検索でエラーが発生しました:', error);
         return [];
@@ -80,13 +87,15 @@ async function searchBoothByTwitter(
             ],
         };
         // console.log(`[searchBoothByTwitter] Qdrant scroll params: collection='booths', limit=${limit}, with_payload=true, filter=${JSON.stringify(filter)}`);
-        const searchResult = await qdrantClient.scroll('booths', {
-            limit: limit,
-            with_payload: true,
-            filter,
+        return await cachedSearch(qdrantClient, 'booths', '', filter, limit, async () => {
+            const searchResult = await qdrantClient.scroll('booths', {
+                limit: limit,
+                with_payload: true,
+                filter,
+            });
+            // console.log(`[searchBoothByTwitter] Qdrant scroll result points:`, searchResult.points);
+            return searchResult.points as unknown as BoothResult[];
         });
-        // console.log(`[searchBoothByTwitter] Qdrant scroll result points:`, searchResult.points);
-        return searchResult.points as unknown as BoothResult[];
     } catch (error) {
         console.error('Twitterアカウント検索でエラーが発生しました:', error);
         return [];
@@ -101,18 +110,21 @@ async function searchItems(
     limit = 5
 ): Promise<ItemResult[]> {
     try {
-        // ベクトル化
-        const queryEmbedding = await embeddings.embedQuery(query);
-
-        // Qdrantで検索
-        const searchResult = await qdrantClient.search('items', {
-            vector: queryEmbedding,
-            limit: limit,
-            with_payload: true,
-            with_vector: false,
-        });
+        // 同じ検索はキャッシュから返す（ベクトル化も省ける）
+        return await cachedSearch(qdrantClient, 'items', query, null, limit, async () => {
+            // ベクトル化
+            const queryEmbedding = await embeddings.embedQuery(query);
+
+            // Qdrantで検索
+            const searchResult = await qdrantClient.search('items', {
+                vector: queryEmbedding,
+                limit: limit,
+                with_payload: true,
+                with_vector: false,
+            });
 
-        return searchResult as unknown as ItemResult[];
+            return searchResult as unknown as ItemResult[];
+        });
     } catch (error) {
         console.error('アイテム検索でエラーが発生しました:', error);
         return [];
@@ -128,33 +140,72 @@ async function searchItemsByBoothName(
     limit = 5
 ) {
     try {
-        // ベクトル化
-        const queryEmbedding = await embeddings.embedQuery(query);
-
-        // Qdrantで検索（フィルター付き）
-        const searchResult = await qdrantClient.search('items', {
-            vector: queryEmbedding,
-            limit: limit,
-            with_payload: true,
-            with_vector: false,
-            filter: {
-                must: [
-                    {
-                        key: "booth_name",
-                        match: {
-                            value: boothName,
-                        },
+        const filter = {
+            must: [
+                {
+                    key: "booth_name",
+                    match: {
+                        value: boothName,
                     },
-                ],
-            },
-        });
+                },
+            ],
+        };
+        return await cachedSearch(qdrantClient, 'items', query, filter, limit, async () => {
+            // ベクトル化
+            const queryEmbedding = await embeddings.embedQuery(query);
+
+            // Qdrantで検索（フィルター付き）
+            const searchResult = await qdrantClient.search('items', {
+                vector: queryEmbedding,
+                limit: limit,
+                with_payload: true,
+                with_vector: false,
+                filter,
+            });
 
-        // 検索結果をそのまま返す
-        return searchResult as unknown as ItemResult[];
+            // 検索結果をそのまま返す
+            return searchResult as unknown as ItemResult[];
+        });
     } catch (error) {
         console.error('サークル名でのアイテム検索でエラーが発生しました:', error);
         return [];
     }
 }
 
-export { searchBooths, searchBoothByName, searchBoothByTwitter, searchItems, searchItemsByBoothName };
\ No newline at end of file
+// ブースとアイテムの同時検索関数 - クエリのベクトル化は1回だけで、2つのコレクションを並行して検索する
+async function searchBoothsAndItems(
+    query: string,
+    embeddings: VoyageEmbeddings,
+    qdrantClient: QdrantClient,
+    boothLimit = 3,
+    itemLimit = 3
+): Promise<{ boothResults: BoothResult[]; itemResults: ItemResult[] }> {
+    // 両方の検索がキャッシュから返る場合はベクトル化しない。必要になったら1回だけベクトル化する
+    let queryEmbedding: Promise<number[]> | null = null;
+    const embedQuery = () => (queryEmbedding ??= embeddings.embedQuery(query));
+
+    const searchCollection = async <T>(collection: string, limit: number): Promise<T[]> => {
+        try {
+            return await cachedSearch(qdrantClient, collection, query, null, limit, async () => {
+                const searchResult = await qdrantClient.search(collection, {
+                    vector: await embedQuery(),
+                    limit: limit,
+                    with_payload: true,
+                    with_vector: false,
+                });
+                return searchResult as unknown as T[];
+            });
+        } catch (error) {
+            console.error(`${collection}の検索でエラーが発生しました:`, error);
+            return [];
+        }
+    };
+
+    const [boothResults, itemResults] = await Promise.all([
+        searchCollection<BoothResult>('booths', boothLimit),
+        searchCollection<ItemResult>('items', itemLimit),
+    ]);
+    return { boothResults, itemResults };
+}
+
+export { searchBooths, searchBoothByName, searchBoothByTwitter, searchItems, searchItemsByBoothName, searchBoothsAndItems };
\ No newline at end of file
@@ -0,0 +1,120 @@
+import { QdrantClient } from '@qdrant/js-client-rest';
+
+// 検索結果のキャッシュ（scripts/search_cache.py と同じ仕組み）
+// キーは（コレクション, 正規化したクエリ, フィルター, 件数）。
+// アップロードや同期のたびにQdrantのメタ情報用コレクションのデータバージョンが増えるので、
+// それが変わったらキャッシュをすべて捨てる（scripts/data_version.py）。
+
+const META_COLLECTION = 'bunfree_meta';
+const META_POINT_ID = 1;
+const VERSION_CHECK_INTERVAL_MS = 30 * 1000; // データバージョンの確認は30秒に1回だけ
+const MAX_ENTRIES = 500;
+const STATS_LOG_INTERVAL = 100; // この件数ごとにヒット率をログに出す
+
+type CacheEntry = {
+    version: number;
+    value: unknown;
+    elapsedMs: number;
+};
+
+const entries = new Map<string, CacheEntry>();
+let dataVersion: number | null = null;
+let checkedAt = 0;
+const stats = { hits: 0, misses: 0, savedMs: 0, invalidations: 0 };
+
+// クエリを正規化する（全角・半角の統一、大文字小文字、空白）
+function normalizeQuery(query: string): string {
+    return query.normalize('NFKC').replace(/\s+/g, ' ').trim().toLowerCase();
+}
+
+// Qdrantからデータバージョンを取得する（取れなければnull）
+async function fetchDataVersion(qdrantClient: QdrantClient): Promise<number | null> {
+    try {
+        const points = await qdrantClient.retrieve(META_COLLECTION, {
+            ids: [META_POINT_ID],
+            with_payload: true,
+            with_vector: false,
+        });
+        const version = points[0]?.payload?.data_version;
+        return typeof version === 'number' ? version : 0;
+    } catch (error) {
+        // メタ情報用コレクションがまだない場合など
+        return 0;
+    }
+}
+
+// データバージョンを確認し、変わっていればキャッシュを捨てる
+async function currentVersion(qdrantClient: QdrantClient): Promise<number | null> {
+    const now = Date.now();
+    if (dataVersion !== null && now - checkedAt < VERSION_CHECK_INTERVAL_MS) {
+        return dataVersion;
+    }
+    checkedAt = now;
+    const version = await fetchDataVersion(qdrantClient);
+    if (dataVersion !== null && version !== dataVersion) {
+        entries.clear();
+        stats.invalidations++;
+    }
+    dataVersion = version;
+    return version;
+}
+
+// キャッシュにあれば結果を返し、なければ検索して保存する（検索が例外を投げた場合は保存しない）
+async function cachedSearch<T>(
+    qdrantClient: QdrantClient,
+    collection: string,
+    query: string,
+    filter: unknown,
+    limit: number,
+    search: () => Promise<T>
+): Promise<T> {
+    const key = JSON.stringify([collection, normalizeQuery(query), filter ?? null, limit]);
+    const version = await currentVersion(qdrantClient);
+
+    const entry = entries.get(key);
+    if (entry && entry.version === version) {
+        // 最近使ったものとして末尾に移す
+        entries.delete(key);
+        entries.set(key, entry);
+        stats.hits++;
+        stats.savedMs += entry.elapsedMs;
+        logStats();
+        return entry.value as T;
+    }
+
+    stats.misses++;
+    const start = Date.now();
+    const value = await search();
+    if (version !== null) {
+        entries.set(key, { version, value, elapsedMs: Date.now() - start });
+        // 上限を超えたら最も古いものから捨てる
+        while (entries.size > MAX_ENTRIES) {
+            const oldest = entries.keys().next().value;
+            if (oldest === undefined) break;
+            entries.delete(oldest);
+        }
+    }
+    logStats();
+    return value;
+}
+
+// キャッシュの統計を返す
+function getSearchCacheStats() {
+    const requests = stats.hits + stats.misses;
+    return {
+        ...stats,
+        requests,
+        hitRate: requests ? stats.hits / requests : 0,
+        size: entries.size,
+        dataVersion,
+    };
+}
+
+function logStats() {
+    const { requests, hits, hitRate, savedMs, dataVersion } = getSearchCacheStats();
+    if (requests % STATS_LOG_INTERVAL === 0) {
+        console.log(`検索結果キャッシュ: ${requests}件中${hits}件ヒット（ヒット率${(hitRate * 100).toFixed(0)}%）, 省けた時間${savedMs}ms, データバージョン${dataVersion}`);
+    }
+}
+
+export { cachedSearch, getSearchCacheStats, normalizeQuery };
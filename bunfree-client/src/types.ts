@@ -1,4 +1,5 @@
 // ブース検索結果の型定義
+// Qdrantのペイロードは検索に必要なフィールドだけに絞っている（scripts/payload_projection.py と合わせる）
 type BoothResult = {
     type: string;
     id: number;
@@ -6,33 +7,25 @@ type BoothResult = {
     payload: {
         id: number;
         name: string;
-        yomi: string;
         category: string;
         area: string;
         area_number: string;
-        members: string | null;
-        twitter: string | null;
-        instagram: string | null;
-        website_url: string | null;
-        description: string;
         map_number: number;
         position_top: number;
         position_left: number;
+        twitter: string | null;
+        website_url: string | null;
         url: string;
+        description: string;
         items: {
         id: number;
-        booth_id: number;
         name: string;
-        yomi: string;
-        genre: string;
+        description: string;
         author: string;
-        item_type: string;
-        page_count: number;
-        release_date: string;
         price: number;
         url: string;
         page_url: string;
-        description: string;
+        page_count: number;
         }[];
     }
 };
@@ -46,12 +39,10 @@ payload: {
     id: number;
     booth_id: number;
     name: string;
-    yomi: string;
     genre: string;
     author: string;
     item_type: string;
     page_count: number;
-    release_date: string;
     price: number;
     url: string;
     page_url: string;
@@ -62,19 +53,14 @@ payload: {
     booth_details: {
     id: number;
     name: string;
-    yomi: string;
-    category: string;
     area: string;
     area_number: string;
     map_number: number;
     position_top: number;
     position_left: number;
-    members: string | null;
     twitter: string | null;
-    instagram: string | null;
-    website_url: string | null;
-    description: string;
     url: string;
+    description: string;
     }
 }
 };
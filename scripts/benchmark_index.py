@@ -0,0 +1,282 @@
+import os
+import time
+import argparse
+from clients import models
+
+from create_vector_db import (
+    qdrant,
+    voyage,
+    CACHE_DIR,
+    EMBEDDING_MODEL,
+    EMBEDDING_DIMENSION,
+    FULL_EMBEDDING_DIMENSION,
+    get_embeddings_from_cache,
+    save_embeddings_to_cache,
+    vector_file_path,
+)
+from vector_store import iter_vector_records, iter_truncated_records, truncate_vector
+from parallel_uploader import upload_stream, create_upload_client
+from index_config import build_collection_options, build_search_params, describe_settings
+from payload_indexes import ensure_payload_indexes
+from payload_projection import project_records
+
+# ベンチマークに使うクエリ（1行1クエリ）
+DEFAULT_QUERIES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_queries.txt')
+
+# ベンチマーク用コレクションの接頭辞（本番のコレクションと区別する）
+BENCH_PREFIX = "bench_"
+
+def load_queries(path=DEFAULT_QUERIES_FILE):
+    """ベンチマーク用のクエリを読み込む"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+def embed_queries(queries, dimension=EMBEDDING_DIMENSION):
+    """クエリをまとめてベクトル化する（結果はキャッシュして、何度ベンチマークしてもAPIは1回だけ）。
+    本番の検索（search_service.py）と同じくinput_type="query"でベクトル化する"""
+    embeddings = get_embeddings_from_cache(queries, EMBEDDING_MODEL, dimension, input_type="query")
+    if embeddings is None:
+        embeddings = voyage.embed(
+            texts=queries,
+            model=EMBEDDING_MODEL,
+            input_type="query",
+            output_dimension=dimension,
+            truncation=True
+        ).embeddings
+        save_embeddings_to_cache(queries, EMBEDDING_MODEL, dimension, embeddings, input_type="query")
+    return embeddings
+
+def parse_config(spec):
+    """'int8:m=32:ef_construct=200:on_disk' のような文字列から設定を作る"""
+    parts = spec.split(':')
+    settings = {
+        'quantization': parts[0],
+        'hnsw_m': None,
+        'hnsw_ef_construct': None,
+        'on_disk_vectors': False,
+    }
+    for part in parts[1:]:
+        if part == 'on_disk':
+            settings['on_disk_vectors'] = True
+        elif part.startswith('m='):
+            settings['hnsw_m'] = int(part[2:])
+        elif part.startswith('ef_construct='):
+            settings['hnsw_ef_construct'] = int(part[len('ef_construct='):])
+        else:
+            raise ValueError(f"不明な設定です: {part}")
+    return settings
+
+def config_collection_name(spec):
+    """設定からベンチマーク用のコレクション名を作る"""
+    return BENCH_PREFIX + spec.replace(':', '_').replace('=', '')
+
+def wait_until_indexed(client, collection_name, timeout=600):
+    """HNSWインデックスの構築が終わる（ステータスがgreenになる）まで待つ"""
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        info = client.get_collection(collection_name=collection_name)
+        if info.status == models.CollectionStatus.GREEN:
+            return True
+        time.sleep(1)
+    print(f"警告: {collection_name}のインデックス構築が{timeout}秒以内に終わりませんでした")
+    return False
+
+def build_bench_collection(client, collection_name, vectors_file, settings, dimension=None,
+                           collection=None, payload_indexes=False):
+    """ベクトルファイルからベンチマーク用のコレクションを作成してアップロード時間を返す。
+    dimensionを指定すると、ベクトルをその次元数に切り詰めてアップロードする。
+    collection（booths/items）を指定するとペイロードを本番と同じに絞り込み、
+    payload_indexesならアップロード前にそのコレクションのペイロードインデックスを作成する"""
+    first = next(iter_vector_records(vectors_file), None)
+    if first is None:
+        raise ValueError(f"{vectors_file} にレコードがありません")
+    if dimension:
+        records = iter_truncated_records(vectors_file, dimension)
+        size = min(dimension, len(first['vector']))
+    else:
+        records = iter_vector_records(vectors_file)
+        size = len(first['vector'])
+
+    if client.collection_exists(collection_name=collection_name):
+        client.delete_collection(collection_name=collection_name)
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config=models.VectorParams(
+            size=size,
+            distance=models.Distance.COSINE,
+            on_disk=settings['on_disk_vectors']
+        ),
+        **build_collection_options(settings)
+    )
+    if collection:
+        records = project_records(records, collection)
+        if payload_indexes:
+            # HNSWのグラフをフィルターに対応させるため、インデックスはアップロード前に作る
+            ensure_payload_indexes(client, collection_name, alias=collection)
+    stats = upload_stream(client, collection_name, records)
+    wait_until_indexed(client, collection_name)
+    return stats['seconds']
+
+def run_queries(client, collection_name, query_vectors, limit, search_params=None):
+    """クエリを順番に実行して、各クエリの結果IDと所要時間(ms)を返す"""
+    results = []
+    latencies = []
+    for query_vector in query_vectors:
+        start = time.perf_counter()
+        hits = client.search(
+            collection_name=collection_name,
+            query_vector=query_vector,
+            limit=limit,
+            search_params=search_params,
+            with_payload=False
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append([hit.id for hit in hits])
+    return results, latencies
+
+def recall_at_k(truth, results, k):
+    """正解（厳密検索）の上位k件のうち、結果の上位k件に含まれる割合の平均"""
+    recalls = []
+    for truth_ids, result_ids in zip(truth, results):
+        expected = set(truth_ids[:k])
+        if expected:
+            recalls.append(len(expected & set(result_ids[:k])) / len(expected))
+    return sum(recalls) / len(recalls) if recalls else 0.0
+
+def percentile(values, p):
+    """パーセンタイル値を返す"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def estimate_vector_memory(count, dimension, quantization):
+    """ベクトル（と量子化ベクトル）のおおよそのメモリ使用量(MB)を返す。HNSWグラフは含まない"""
+    float_bytes = count * dimension * 4
+    if quantization == 'int8':
+        return (count * dimension) / 1024 / 1024, float_bytes / 1024 / 1024
+    if quantization == 'binary':
+        return (count * dimension / 8) / 1024 / 1024, float_bytes / 1024 / 1024
+    return float_bytes / 1024 / 1024, 0.0
+
+def print_result_row(label, recall, latencies, extra=""):
+    """ベンチマーク結果を1行表示する"""
+    print(f"{label:<45} recall={recall:.3f}  p50={percentile(latencies, 50):7.2f}ms  "
+          f"p95={percentile(latencies, 95):7.2f}ms{extra}")
+
+def run_dimension_benchmark(client, vectors_file, point_count, queries, dimensions, ef_values, limit, created):
+    """元の次元数のベクトルを切り詰めて次元数ごとにコレクションを作り、
+    元の次元数での厳密検索を正解としてrecallとレイテンシを比較する（量子化はなし）"""
+    full_vectors = embed_queries(queries, FULL_EMBEDDING_DIMENSION)
+    full_dimension = len(next(iter_vector_records(vectors_file))['vector'])
+    if full_dimension != FULL_EMBEDDING_DIMENSION:
+        raise ValueError(f"{vectors_file} のベクトルは{full_dimension}次元です。"
+                         f"{FULL_EMBEDDING_DIMENSION}次元のベクトルファイルを指定してください")
+
+    settings = parse_config('none')
+    truth = None
+    for dimension in sorted(dimensions, reverse=True):
+        collection_name = f"{BENCH_PREFIX}dim{dimension}"
+        upload_seconds = build_bench_collection(client, collection_name, vectors_file, settings, dimension)
+        created.append(collection_name)
+        vector_mb, _ = estimate_vector_memory(point_count, dimension, 'none')
+        print(f"\n{dimension}次元: アップロードとインデックス作成 {upload_seconds:.1f}秒, vectors≈{vector_mb:.1f}MB")
+
+        query_vectors = [truncate_vector(vector, dimension) for vector in full_vectors]
+        results, latencies = run_queries(client, collection_name, query_vectors, limit,
+                                         build_search_params(exact=True))
+        if truth is None:
+            if dimension != FULL_EMBEDDING_DIMENSION:
+                raise ValueError(f"正解データ用に{FULL_EMBEDDING_DIMENSION}次元も--dimensionsに含めてください")
+            truth = results
+        # 厳密検索のrecallは次元を削ったことだけによる損失
+        print_result_row(f"dim={dimension}, exact", recall_at_k(truth, results, limit), latencies)
+        for ef in ef_values:
+            results, latencies = run_queries(client, collection_name, query_vectors, limit,
+                                             build_search_params(hnsw_ef=ef))
+            print_result_row(f"dim={dimension}, ef={ef}", recall_at_k(truth, results, limit), latencies)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='量子化・HNSW設定（または次元数）ごとにコレクションを作成し、厳密検索に対するrecallとレイテンシを計測します。')
+    parser.add_argument('--collection', choices=['booths', 'items'], default='booths',
+                        help='ベクトルファイルの種類（cache/<collection>のベクトルを使う）')
+    parser.add_argument('--configs', nargs='+', default=['none', 'int8', 'binary'],
+                        help="比較する設定（例: none int8 binary int8:m=32:ef_construct=200 int8:on_disk）")
+    parser.add_argument('--ef', nargs='+', type=int, default=[64, 128, 256],
+                        help='検索時のhnsw_ef')
+    parser.add_argument('--dimensions', nargs='+', type=int,
+                        help=f'次元数の比較モード（例: {FULL_EMBEDDING_DIMENSION} 1024 512 256）。'
+                        'キャッシュ済みの元ベクトルを切り詰めるので再ベクトル化は不要')
+    parser.add_argument('--oversampling', type=float, default=2.0,
+                        help='量子化時の再スコアリング前のオーバーサンプリング倍率')
+    parser.add_argument('--limit', type=int, default=10, help='recall@kのk')
+    parser.add_argument('--queries-file', default=DEFAULT_QUERIES_FILE, help='クエリファイル（1行1クエリ）')
+    parser.add_argument('--location', help='ベンチマーク先のQdrant（省略時はQDRANT_URL）。'
+                        'インメモリモードは常に全件探索になるので、Dockerのローカルコンテナなどを推奨')
+    parser.add_argument('--keep', action='store_true', help='ベンチマーク用コレクションを削除せずに残す')
+    args = parser.parse_args()
+
+    client = create_upload_client(args.location) if args.location else qdrant
+    kind = 'booth' if args.collection == 'booths' else 'item'
+    if args.dimensions:
+        # 次元数の比較は元の次元数のベクトルファイルから切り詰めて行う
+        vectors_file = os.path.join(CACHE_DIR, f'{kind}_vectors.pkl')
+    else:
+        vectors_file = vector_file_path(kind)
+    point_count = sum(1 for _ in iter_vector_records(vectors_file))
+
+    queries = load_queries(args.queries_file)
+    print(f"{len(queries)}件のクエリ, {point_count}件のベクトルでベンチマークします")
+
+    created = []
+    try:
+        if args.dimensions:
+            run_dimension_benchmark(client, vectors_file, point_count, queries,
+                                    args.dimensions, args.ef, args.limit, created)
+            return
+
+        query_vectors = embed_queries(queries)
+        # 正解データ: 量子化なしのコレクションで厳密検索
+        baseline = config_collection_name('none')
+        build_bench_collection(client, baseline, vectors_file, parse_config('none'))
+        created.append(baseline)
+        truth, exact_latencies = run_queries(client, baseline, query_vectors, args.limit,
+                                             build_search_params(exact=True))
+        print_result_row("exact (全件探索)", 1.0, exact_latencies)
+
+        for spec in args.configs:
+            settings = parse_config(spec)
+            collection_name = config_collection_name(spec)
+            if collection_name != baseline:
+                upload_seconds = build_bench_collection(client, collection_name, vectors_file, settings)
+                created.append(collection_name)
+                print(f"\n{collection_name}: アップロードとインデックス作成 {upload_seconds:.1f}秒")
+
+            vector_mb, original_mb = estimate_vector_memory(point_count, len(query_vectors[0]), settings['quantization'])
+            memory = f"  vectors≈{vector_mb:.1f}MB" + (f" (+元ベクトル{original_mb:.1f}MB)" if original_mb else "")
+
+            for ef in args.ef:
+                quantized = settings['quantization'] != 'none'
+                search_params = build_search_params(
+                    hnsw_ef=ef,
+                    rescore=True,
+                    oversampling=args.oversampling if quantized else None
+                )
+                results, latencies = run_queries(client, collection_name, query_vectors, args.limit, search_params)
+                label = f"{describe_settings(settings)}, ef={ef}"
+                print_result_row(label, recall_at_k(truth, results, args.limit), latencies, memory)
+
+                if quantized:
+                    # 再スコアリングなし（量子化ベクトルのスコアのみ）も比較
+                    search_params = build_search_params(hnsw_ef=ef, rescore=False)
+                    results, latencies = run_queries(client, collection_name, query_vectors, args.limit, search_params)
+                    print_result_row(label + ", rescore=off", recall_at_k(truth, results, args.limit), latencies, memory)
+    finally:
+        if not args.keep:
+            for collection_name in created:
+                client.delete_collection(collection_name=collection_name)
+
+if __name__ == "__main__":
+    main()
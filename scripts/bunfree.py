@@ -0,0 +1,127 @@
+import os
+import sys
+import time
+import argparse
+import importlib
+import subprocess
+
+# 各スクリプトをまとめて呼び出すCLI。
+#   python bunfree.py <サブコマンド> [オプション...]
+# サブコマンドのモジュールは実行するときに初めてimportし、残りの引数をそのモジュールのmain()に渡す。
+# QdrantやVoyageAIのクライアントも使うときに作られる（clients.py）ので、--helpなどはすぐに表示される。
+
+# サブコマンド: (モジュール名, 説明)
+COMMANDS = {
+    'search': ('search_db', 'ベクトル・ハイブリッド・テキスト検索、バッチ検索、類似検索'),
+    'serve': ('search_service', 'ブースとアイテムを同時に検索するHTTPサービス'),
+    'test-search': ('test_vector_search', '対話形式の検索テスト'),
+    'upload': ('create_vector_db', '全件をベクトル化して新しいコレクションにアップロード'),
+    'sync': ('sync_vectors', 'SQLiteの変更分だけをQdrantに同期'),
+    'sync-fields': ('field_sync', '指定したペイロードのフィールドだけをSQLiteから同期'),
+    'aliases': ('collection_aliases', 'コレクションのエイリアスとバージョンの管理'),
+    'indexes': ('payload_indexes', 'ペイロードインデックスの作成・照合・ベンチマーク'),
+    'check-indexes': ('check_qdrant_indexes', 'ペイロードインデックスと名前検索の確認'),
+    'payloads': ('payload_projection', 'ペイロードのサイズの計測'),
+    'local': ('local_index', 'メモリ上の全件探索インデックス'),
+    'lexical': ('lexical_index', '名前・読み・作者・SNSアカウントの部分一致検索'),
+    'neighbors': ('neighbor_tables', '似ているブース・アイテムの事前計算'),
+    'benchmark': ('benchmark_index', '量子化・HNSW・次元数のベンチマーク'),
+    'upload-bench': ('parallel_uploader', '並列アップロードのベンチマーク'),
+    'crawl': ('parallel_crawler_bunfree', 'ブース・アイテムの並列クロール'),
+    'update-items': ('item_updater', '新しいアイテムの取得とQdrantへの追加'),
+    'update-urls': ('update_qdrant_website_urls', 'website_urlをQdrantに同期'),
+    'tombstones': ('tombstones', 'サイトから消えたとして削除したブース・アイテムの確認と復元'),
+    'patch-urls': ('website_url_patch', 'ブースページからwebsite_urlを取り直してSQLiteとQdrantに反映'),
+    'crawl-bench': ('crawl_engine', 'モックサーバーでの並列取得のベンチマーク'),
+    'distributed': ('crawl_coordinator', '分散クロールのワーカーと、ワーカー数によるスケーリングのベンチマーク'),
+    'daemon': ('refresh_daemon', '常駐して差分更新を一定間隔で実行（ヘルスチェック・メトリクス付き）'),
+    'mock-server': ('mock_bunfree_server', 'c.bunfree.netを模したローカルのHTTPサーバー'),
+}
+
+# 起動時間のベンチマークで計測するコマンド（軽いコマンドは200ms以内に最初の出力を返したい）
+STARTUP_TARGET_MS = 200
+STARTUP_COMMANDS = [
+    ['--help'],
+    ['search', '--help'],
+    ['upload', '--help'],
+    ['sync', '--help'],
+    ['indexes', '--help'],
+    ['lexical', '--help'],
+    ['update-items', '--help'],
+]
+
+def run_command(name, argv):
+    """サブコマンドのモジュールをimportして、引数を渡してmain()を実行する"""
+    module_name, _ = COMMANDS[name]
+    module = importlib.import_module(module_name)
+    # argparseのprogが「bunfree <サブコマンド>」になるようにする
+    sys.argv = [f"bunfree {name}", *argv]
+    return module.main()
+
+def time_to_first_output(args):
+    """コマンドを別プロセスで実行し、最初の出力までの時間(ms)を返す"""
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), *args],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    process.stdout.read(1)
+    elapsed = (time.perf_counter() - start) * 1000
+    process.stdout.read()
+    process.wait()
+    return elapsed
+
+def slowest_imports(args, count=5):
+    """python -X importtime で実行し、累積時間の長いトップレベルのimportを返す"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', os.path.abspath(__file__), *args],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, self_us, cumulative_us, name = [part.strip() for part in line.replace('import time:', '').split('|')]
+        # トップレベル（インデントなし）のimportだけを対象にする
+        if name.startswith(' '):
+            continue
+        imports.append((int(cumulative_us) / 1000, name))
+    imports.sort(reverse=True)
+    return imports[:count]
+
+def startup_benchmark(repeat=5):
+    """軽いコマンドの起動時間（最初の出力までの時間）を計測する"""
+    print(f"起動時間（最初の出力まで, {repeat}回の中央値, 目標{STARTUP_TARGET_MS}ms以内）")
+    for args in STARTUP_COMMANDS:
+        times = sorted(time_to_first_output(args) for _ in range(repeat))
+        median = times[len(times) // 2]
+        mark = 'OK' if median <= STARTUP_TARGET_MS else '遅い'
+        print(f"  {'bunfree ' + ' '.join(args):<28} {median:7.1f}ms  {mark}")
+        if median > STARTUP_TARGET_MS:
+            for cumulative_ms, name in slowest_imports(args):
+                print(f"      {cumulative_ms:7.1f}ms  import {name}")
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='bunfree',
+        description='文学フリマのブース・アイテム検索のためのスクリプトをまとめたCLIです。',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='サブコマンド:\n' + '\n'.join(
+            f"  {name:<14} {description}" for name, (_, description) in COMMANDS.items()
+        ) + '\n  startup-bench  このCLIの起動時間を計測する\n\n'
+            '各サブコマンドのオプションは bunfree <サブコマンド> --help で確認できます。',
+    )
+    parser.add_argument('command', choices=[*COMMANDS, 'startup-bench'], metavar='command', help='サブコマンド')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help='サブコマンドに渡す引数')
+    args = parser.parse_args()
+
+    if args.command == 'startup-bench':
+        startup_benchmark()
+        return
+    return run_command(args.command, args.args)
+
+if __name__ == "__main__":
+    sys.exit(main())
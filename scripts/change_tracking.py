@@ -0,0 +1,95 @@
+import sqlite3
+import hashlib
+import json
+from datetime import datetime, timezone
+
+from create_db import migrate_change_tracking
+
+# 変更追跡に使うカラム（ハッシュの計算対象から除外する）
+TRACKING_COLUMNS = ('content_hash', 'updated_at')
+
+def now_iso():
+    """現在時刻をISO形式(UTC)で返す"""
+    return datetime.now(timezone.utc).isoformat(timespec='microseconds')
+
+def hash_value(value):
+    """任意の値(dict/list/str)から安定したハッシュ値を生成する"""
+    if not isinstance(value, str):
+        value = json.dumps(value, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(value.encode('utf-8')).hexdigest()
+
+def row_content_hash(row):
+    """行の内容（追跡用カラムを除く）からハッシュを計算する"""
+    content = {k: row[k] for k in row.keys() if k not in TRACKING_COLUMNS}
+    return hash_value(content)
+
+def fetch_by_ids(conn, query, ids, params=(), chunk_size=500):
+    """queryの {ids} をIDのプレースホルダーにして、IDで絞り込んだ行を返す（paramsはIDより前のパラメーター）。
+    SQLiteの変数の数の上限を超えないよう、chunk_size件ずつ問い合わせる"""
+    ids = list(ids)
+    rows = []
+    for i in range(0, len(ids), chunk_size):
+        chunk = ids[i:i+chunk_size]
+        rows.extend(conn.execute(query.format(ids=','.join('?' * len(chunk))), (*params, *chunk)).fetchall())
+    return rows
+
+def refresh_content_hashes(conn, table, ids=None):
+    """テーブルの全行（idsを指定した場合はその行だけ）のcontent_hashを再計算し、変わった行のupdated_atを更新する。
+    戻り値は変更された行のIDリスト"""
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    if ids is None:
+        rows = cursor.execute(f"SELECT * FROM {table}").fetchall()
+    else:
+        rows = fetch_by_ids(conn, f"SELECT * FROM {table} WHERE id IN ({{ids}})", ids)
+
+    changed = []
+    for row in rows:
+        content_hash = row_content_hash(row)
+        if content_hash != row['content_hash']:
+            changed.append((content_hash, row['id']))
+
+    if changed:
+        timestamp = now_iso()
+        cursor.executemany(
+            f"UPDATE {table} SET content_hash = ?, updated_at = ? WHERE id = ?",
+            [(content_hash, timestamp, row_id) for content_hash, row_id in changed]
+        )
+        conn.commit()
+
+    return [row_id for _, row_id in changed]
+
+def refresh_all(conn, booth_ids=None, item_ids=None):
+    """booths/itemsの両方の変更追跡情報を更新する（IDを指定した場合はその行だけ）"""
+    migrate_change_tracking(conn)
+    changed_booths = refresh_content_hashes(conn, 'booths', booth_ids)
+    changed_items = refresh_content_hashes(conn, 'items', item_ids)
+    return changed_booths, changed_items
+
+def get_sync_state(conn, collection, point_ids=None):
+    """Qdrantに反映済みのハッシュを {point_id: (text_hash, payload_hash, synced_at)} で返す
+    （point_idsを指定した場合はそのポイントだけ）"""
+    query = "SELECT point_id, text_hash, payload_hash, synced_at FROM vector_sync_state WHERE collection = ?"
+    if point_ids is None:
+        rows = conn.execute(query, (collection,)).fetchall()
+    else:
+        rows = fetch_by_ids(conn, f"{query} AND point_id IN ({{ids}})", point_ids, (collection,))
+    return {row[0]: (row[1], row[2], row[3]) for row in rows}
+
+def record_synced(conn, collection, entries):
+    """同期済みのハッシュを記録する。entriesは (point_id, text_hash, payload_hash) のリスト"""
+    timestamp = now_iso()
+    conn.executemany('''
+        INSERT OR REPLACE INTO vector_sync_state (collection, point_id, text_hash, payload_hash, synced_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(collection, point_id, text_hash, payload_hash, timestamp)
+          for point_id, text_hash, payload_hash in entries])
+    conn.commit()
+
+def forget_synced(conn, collection, point_ids):
+    """削除したポイントの同期状態を削除する"""
+    conn.executemany(
+        "DELETE FROM vector_sync_state WHERE collection = ? AND point_id = ?",
+        [(collection, point_id) for point_id in point_ids]
+    )
+    conn.commit()
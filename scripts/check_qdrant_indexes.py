@@ -1,21 +1,6 @@
-import os
-import sqlite3
-from dotenv import load_dotenv
-from qdrant_client import QdrantClient
-from qdrant_client.http import models
-
-# 環境変数の読み込み
-load_dotenv()
-
-# API KEYの取得
-QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
-QDRANT_URL = os.getenv("QDRANT_URL")
-
-# Qdrantクライアントの初期化
-qdrant = QdrantClient(
-    url=QDRANT_URL,
-    api_key=QDRANT_API_KEY,
-)
+import argparse
+from payload_indexes import PAYLOAD_INDEXES, ensure_payload_indexes, verify_payload_indexes
+from clients import qdrant, models
 
 def check_collection_indices(collection_name):
     """コレクションのインデックス情報を確認する"""
@@ -144,61 +129,6 @@ def test_partial_match(collection_name, field_name, query):
         print(f"検索エラー: {e}")
         return None
 
-def create_text_index(collection_name, field_name):
-    """TEXTタイプのインデックスを作成する"""
-    # フィールド名をパース
-    field_parts = field_name.split('.')
-    actual_field = field_parts[-1] if len(field_parts) > 1 else field_name
-    
-    print(f"フィールド '{actual_field}' にTEXTタイプのインデックスを作成します...")
-    
-    # 複数の方法を順番に試す
-    methods = [
-        # 方法1: 詳細なパラメータ指定
-        lambda: qdrant.create_payload_index(
-            collection_name=collection_name,
-            field_name=actual_field,
-            field_schema=models.TextIndexParams(
-                type="text",
-                tokenizer=models.TokenizerType.WORD,
-                min_token_len=2,
-                max_token_len=15,
-                lowercase=True,
-            )
-        ),
-        # 方法2: シンプルな文字列指定
-        lambda: qdrant.create_payload_index(
-            collection_name=collection_name,
-            field_name=actual_field,
-            field_schema="text"
-        ),
-        # 方法3: PayloadSchemaType定数を使用
-        lambda: qdrant.create_payload_index(
-            collection_name=collection_name,
-            field_name=actual_field,
-            field_schema=models.PayloadSchemaType.TEXT
-        ),
-        # 方法4: キーワードタイプでも試す
-        lambda: qdrant.create_payload_index(
-            collection_name=collection_name,
-            field_name=actual_field,
-            field_schema="keyword"
-        )
-    ]
-    
-    # 各方法を順番に試す
-    for i, method in enumerate(methods):
-        try:
-            print(f"方法{i+1}でインデックス作成を試みます...")
-            method()
-            print(f"方法{i+1}でインデックス作成に成功しました！")
-            return True
-        except Exception as e:
-            print(f"方法{i+1}のエラー: {e}")
-    
-    print("すべての方法が失敗しました。")
-    return False
-
 def test_keyword_match(collection_name, field_name, query):
     """キーワード検索（完全一致）をテストする"""
     try:
@@ -277,66 +207,45 @@ def list_available_fields(collection_name):
         print(f"フィールド一覧取得エラー: {e}")
         return []
 
-if __name__ == "__main__":
-    # ブースコレクションのみをチェック
-    collection = "booths"
-    original_field_name = "payload.name"
-    test_query = "点滅社"  # 特定のブース名を検索
-    
+def main():
+    parser = argparse.ArgumentParser(description='ペイロードインデックスを確認し、名前での完全一致・部分一致検索を試します。')
+    parser.add_argument('--collection', choices=list(PAYLOAD_INDEXES), default='booths', help='確認するコレクション')
+    parser.add_argument('--field', default='name', help='検索を試すフィールド')
+    parser.add_argument('--query', default='点滅社', help='検索を試す値')
+    parser.add_argument('--fix', action='store_true',
+                        help='定義（payload_indexes.py）どおりにインデックスを作成し、定義にないものを削除する')
+    args = parser.parse_args()
+
     print(f"\n{'='*50}")
-    print(f"コレクション: {collection}")
+    print(f"コレクション: {args.collection}")
     print(f"{'='*50}")
-    
+
     # 現在のインデックス情報を確認
-    indices = check_collection_indices(collection)
-    
+    check_collection_indices(args.collection)
+
     # 利用可能なフィールドを一覧表示
-    available_fields = list_available_fields(collection)
-    
-    # フィールド名をpayload.nameからnameに変換
-    field_parts = original_field_name.split('.')
-    field_name = field_parts[-1] if len(field_parts) > 1 else original_field_name
-    
-    print(f"\n検索フィールドを '{original_field_name}' から '{field_name}' に変更します")
-    
+    list_available_fields(args.collection)
+
+    # 定義したインデックスと実際のペイロードを照合
+    print()
+    problems = verify_payload_indexes(qdrant, args.collection)
+    if problems and args.fix:
+        print()
+        ensure_payload_indexes(qdrant, args.collection, drop_unknown=True)
+        verify_payload_indexes(qdrant, args.collection)
+
     # フィールドが存在するか確認
-    field_exists = check_field_existence(collection, field_name)
-    
-    if not field_exists and available_fields:
-        print(f"\n指定されたフィールド '{field_name}' が存在しません。")
-        print("代わりに利用可能なフィールドから選んでください。")
-        
-        # 利用可能なフィールドから最も有望なものを選ぶ
-        candidates = ["name", "title", "description", "text"]
-        for candidate in candidates:
-            if candidate in available_fields:
-                field_name = candidate
-                print(f"フィールド '{field_name}' を代わりに使用します。")
-                field_exists = True
-                break
-        
-        if not field_exists:
-            # 最初のフィールドを使用
-            field_name = available_fields[0]
-            print(f"フィールド '{field_name}' を代わりに使用します。")
-            field_exists = True
-    
-    # 通常のキーワード検索をテスト（現在のインデックスがKEYWORDタイプの場合）
-    keyword_results = test_keyword_match(collection, field_name, test_query)
-    
-    # 部分一致検索をテスト
-    partial_results = test_partial_match(collection, field_name, test_query)
-    
-    # 検索結果がなければ、TEXTインデックスを自動的に作成
+    if not check_field_existence(args.collection, args.field):
+        return
+
+    # 完全一致検索と部分一致検索を試す
+    keyword_results = test_keyword_match(args.collection, args.field, args.query)
+    partial_results = test_partial_match(args.collection, args.field, args.query)
     if not keyword_results and not partial_results:
-        print(f"\n'{test_query}'が見つかりませんでした。インデックスを作成します。")
-        
-        # フィールドが存在する場合のみインデックスを作成
-        if field_exists:
-            create_text_index(collection, field_name)
-            
-            # インデックス作成後に再度テスト
-            print("\nインデックス作成後のテスト:")
-            test_partial_match(collection, field_name, test_query)
+        print(f"\n'{args.query}'が見つかりませんでした。--fixでインデックスを定義どおりに作成するか、"
+              f"lexical_index.pyの部分一致検索を使ってください。")
     else:
-        print(f"\n'{test_query}'が見つかりました。インデックス作成は不要です。") 
\ No newline at end of file
+        print(f"\n'{args.query}'が見つかりました。")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import os
+import importlib
+import threading
+from dotenv import load_dotenv
+
+# QdrantとVoyageAIのクライアント、および読み込みに時間のかかるモジュールを、最初に使うときに作る。
+#   qdrant_client（models含む）とvoyageaiはそれぞれimportだけで1秒近くかかるので、
+#   import時や--helpの表示ではこれらを読み込まない。
+#   使い方は今までどおり: from clients import qdrant, voyage, models
+#   （qdrant.search(...) や models.Filter(...) のように属性に触れた時点で作られる）
+
+# 環境変数の読み込み
+load_dotenv()
+
+class Lazy:
+    """初めて属性に触れたときにfactoryで本体を作り、以降はそれに委譲するプロキシ"""
+
+    def __init__(self, factory, description):
+        self._factory = factory
+        self._description = description
+        self._target = None
+        self._lock = threading.Lock()
+
+    def resolve(self):
+        """本体を返す（まだなければ作る）"""
+        if self._target is None:
+            with self._lock:
+                if self._target is None:
+                    self._target = self._factory()
+        return self._target
+
+    @property
+    def resolved(self):
+        """本体がすでに作られているか"""
+        return self._target is not None
+
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
+
+    def __setattr__(self, name, value):
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self.resolve(), name, value)
+
+    def __repr__(self):
+        state = "作成済み" if self.resolved else "未作成"
+        return f"<Lazy {self._description}（{state}）>"
+
+def lazy_module(name):
+    """モジュールを最初に使うときにimportする"""
+    return Lazy(lambda: importlib.import_module(name), name)
+
+def create_qdrant_client(url=None, timeout=300.0):
+    """Qdrantクライアントを作成する（QDRANT_URL・QDRANT_API_KEY、gRPCはQDRANT_PREFER_GRPC=trueで有効化）"""
+    from qdrant_client import QdrantClient
+    return QdrantClient(
+        url=url or os.getenv("QDRANT_URL"),
+        api_key=os.getenv("QDRANT_API_KEY"),
+        prefer_grpc=os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true",
+        timeout=timeout
+    )
+
+def create_voyage_client():
+    """VoyageAIクライアントを作成する"""
+    import voyageai
+    return voyageai.Client(api_key=os.getenv("VOYAGE_API_KEY"))
+
+# Qdrantのモデル（フィルターやリクエストの型）
+models = lazy_module("qdrant_client.http.models")
+
+# 各スクリプトで共有するクライアント
+qdrant = Lazy(create_qdrant_client, "QdrantClient")
+voyage = Lazy(create_voyage_client, "voyageai.Client")
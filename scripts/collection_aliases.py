@@ -0,0 +1,171 @@
+import argparse
+import re
+from clients import models
+
+from data_version import bump_data_version
+
+# APIが参照するエイリアス名（= 従来のコレクション名）
+ALIAS_NAMES = ('booths', 'items')
+
+# 古いバージョンを何世代残すか（ロールバック用）
+DEFAULT_KEEP_VERSIONS = 2
+
+def version_collection_name(alias, version):
+    """バージョン付きのコレクション名を返す（例: booths_v3）"""
+    return f"{alias}_v{version}"
+
+def list_versions(qdrant, alias):
+    """エイリアスに対応するバージョン番号を昇順で返す"""
+    pattern = re.compile(rf"^{re.escape(alias)}_v(\d+)$")
+    versions = []
+    for collection in qdrant.get_collections().collections:
+        match = pattern.match(collection.name)
+        if match:
+            versions.append(int(match.group(1)))
+    return sorted(versions)
+
+def get_alias_target(qdrant, alias):
+    """エイリアスが指しているコレクション名を返す（なければNone）"""
+    for collection_alias in qdrant.get_aliases().aliases:
+        if collection_alias.alias_name == alias:
+            return collection_alias.collection_name
+    return None
+
+def next_version_name(qdrant, alias):
+    """次に作成するバージョンのコレクション名を返す"""
+    versions = list_versions(qdrant, alias)
+    return version_collection_name(alias, (versions[-1] + 1) if versions else 1)
+
+def verify_collection(qdrant, collection_name, expected_count, sample_id=None, sample_vector=None):
+    """ポイント数とサンプルクエリで新しいコレクションを検証する"""
+    actual_count = qdrant.count(collection_name=collection_name, exact=True).count
+    if actual_count != expected_count:
+        print(f"検証エラー: {collection_name}のポイント数が一致しません（期待値: {expected_count}, 実際: {actual_count}）")
+        return False
+
+    if sample_vector is not None:
+        hits = qdrant.search(
+            collection_name=collection_name,
+            query_vector=sample_vector,
+            limit=10
+        )
+        if not hits:
+            print(f"検証エラー: {collection_name}のサンプルクエリが結果を返しませんでした")
+            return False
+        # 同じテキストのポイントが先頭に来ることもあるので、上位に自分自身が含まれていればOK
+        if sample_id is not None and sample_id not in [hit.id for hit in hits]:
+            print(f"検証エラー: {collection_name}のサンプルクエリの上位に自分自身(ID={sample_id})が含まれていません")
+            return False
+
+    print(f"検証OK: {collection_name}（{actual_count}件）")
+    return True
+
+def create_alias_operation(alias, collection_name):
+    """エイリアスを作成する操作"""
+    return models.CreateAliasOperation(
+        create_alias=models.CreateAlias(collection_name=collection_name, alias_name=alias)
+    )
+
+def switch_aliases(qdrant, targets):
+    """エイリアスを新しいコレクションへ一括で切り替える（1リクエストでアトミックに実行）。
+    targetsは {エイリアス名: コレクション名}。
+    旧方式の実体コレクションが同名で残っている場合（初回移行時のみ）は、エイリアスを作る前に削除する必要がある。
+    Qdrantではコレクションの削除とエイリアスの操作を1つのリクエストにまとめられないので、
+    確認をすべて済ませてから削除し、直後のリクエストでエイリアスを作る（その間だけ、そのコレクションへの検索は失敗する）"""
+    operations = []
+    legacy = {}
+    for alias, collection_name in targets.items():
+        if get_alias_target(qdrant, alias) is not None:
+            operations.append(models.DeleteAliasOperation(
+                delete_alias=models.DeleteAlias(alias_name=alias)
+            ))
+            operations.append(create_alias_operation(alias, collection_name))
+        elif qdrant.collection_exists(collection_name=alias):
+            legacy[alias] = collection_name
+        else:
+            operations.append(create_alias_operation(alias, collection_name))
+
+    if operations:
+        qdrant.update_collection_aliases(change_aliases_operations=operations)
+    for alias, collection_name in legacy.items():
+        print(f"警告: 旧方式のコレクション'{alias}'を削除してエイリアスに置き換えます"
+              f"（初回移行時のみ。置き換えるリクエスト1回分の間、'{alias}'への検索は失敗します）")
+        qdrant.delete_collection(collection_name=alias)
+        qdrant.update_collection_aliases(change_aliases_operations=[create_alias_operation(alias, collection_name)])
+    for alias, collection_name in targets.items():
+        print(f"エイリアス'{alias}'を'{collection_name}'に切り替えました")
+    # 検索結果のキャッシュを無効にする
+    bump_data_version(qdrant, f"エイリアス切り替え: {', '.join(targets.values())}")
+
+def rollback(qdrant, aliases):
+    """エイリアスを1つ前のバージョンに戻す（複数指定時もまとめてアトミックに切り替える）"""
+    targets = {}
+    for alias in aliases:
+        current = get_alias_target(qdrant, alias)
+        current_version = int(current.rsplit('_v', 1)[1]) if current else None
+        previous = [v for v in list_versions(qdrant, alias)
+                    if current_version is None or v < current_version]
+        if not previous:
+            print(f"'{alias}'に戻せる古いバージョンがありません")
+            return False
+        targets[alias] = version_collection_name(alias, previous[-1])
+
+    switch_aliases(qdrant, targets)
+    return True
+
+def garbage_collect(qdrant, alias, keep=DEFAULT_KEEP_VERSIONS):
+    """現在のバージョンと、それ以前の直近keep世代を残して古いコレクションを削除する"""
+    current = get_alias_target(qdrant, alias)
+    if current is None:
+        print(f"'{alias}'のエイリアスがないため、古いバージョンの削除をスキップします")
+        return []
+
+    current_version = int(current.rsplit('_v', 1)[1])
+    versions = list_versions(qdrant, alias)
+    older = [v for v in versions if v < current_version]
+    # 現在より新しいバージョンは作成途中の可能性があるので残す
+    to_delete = older[:-keep] if keep > 0 else older
+
+    deleted = []
+    for version in to_delete:
+        collection_name = version_collection_name(alias, version)
+        qdrant.delete_collection(collection_name=collection_name)
+        deleted.append(collection_name)
+        print(f"古いコレクション'{collection_name}'を削除しました")
+    return deleted
+
+def print_status(qdrant):
+    """エイリアスとバージョンの状態を表示する"""
+    for alias in ALIAS_NAMES:
+        target = get_alias_target(qdrant, alias)
+        versions = list_versions(qdrant, alias)
+        print(f"{alias}: 現在 -> {target or '（エイリアスなし）'}")
+        for version in versions:
+            collection_name = version_collection_name(alias, version)
+            count = qdrant.count(collection_name=collection_name, exact=False).count
+            marker = " *" if collection_name == target else ""
+            print(f"  - {collection_name}: {count}件{marker}")
+
+def main():
+    from create_vector_db import qdrant
+
+    parser = argparse.ArgumentParser(description='バージョン付きコレクションとエイリアスを管理します。')
+    parser.add_argument('--status', action='store_true', help='エイリアスとバージョンの状態を表示する')
+    parser.add_argument('--rollback', choices=['booths', 'items', 'all'],
+                        help='エイリアスを1つ前のバージョンに戻す')
+    parser.add_argument('--gc', action='store_true', help='古いバージョンのコレクションを削除する')
+    parser.add_argument('--keep', type=int, default=DEFAULT_KEEP_VERSIONS,
+                        help='削除せずに残す古いバージョン数')
+    args = parser.parse_args()
+
+    if args.rollback:
+        aliases = ALIAS_NAMES if args.rollback == 'all' else (args.rollback,)
+        rollback(qdrant, aliases)
+    if args.gc:
+        for alias in ALIAS_NAMES:
+            garbage_collect(qdrant, alias, keep=args.keep)
+    if args.status or not (args.rollback or args.gc):
+        print_status(qdrant)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,612 @@
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import tempfile
+import importlib
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from crawl_engine import CrawlEngine, SITE_URL, DEFAULT_CONCURRENCY, DEFAULT_RATE
+
+# 複数のプロセス・マシンでクロールを分担するためのコーディネーターとワーカー。
+#   コーディネーター（ItemUpdaterなどを実行する1台）:
+#     タスクの一覧（フロンティア）を共有のSQLiteファイルのcrawl_frontierテーブルに置き、小さなHTTPサービスで配る。
+#     ワーカーはタスクを数件ずつ期限つきでリースし、期限までに結果が返ってこなければ別のワーカーに渡し直す。
+#     ワーカーがリクエストを送ってよい時刻もコーディネーターが割り当てるので、ワーカーが何台でも全体のレートは上限を守る。
+#     返ってきた結果をDBに書き込むのはコーディネーターの呼び出し元のスレッドだけ（crawl_engine.pyと同じ）。
+#   ワーカー（何台でも）:
+#     python crawl_coordinator.py worker --coordinator http://<コーディネーター>:8790
+#     DBには接続せず、ページの取得と解析だけを行って結果をコーディネーターに返す。
+#   POST /lease {worker, count}          … タスクをリースする {'tasks': [...], 'remaining': 未完了の件数}
+#                                          （ジョブが終わった後は {'done': true} を返し、ワーカーは終了する）
+#   POST /complete {worker, key, result|error, requests} … 結果と、前回の報告以降に送ったリクエストの時刻を返す
+#                                          （同じワーカーの他のリースも延長する）
+#   POST /reserve {count}                … リクエストを送ってよいまでの待ち時間と、その時刻 {'delays': [...], 'times': [...]}
+#   GET  /status                         … タスクの件数・レート・ワーカーの一覧
+
+DEFAULT_PORT = 8790
+LEASE_SECONDS = float(os.getenv("CRAWL_LEASE_SECONDS", "120"))
+MAX_ATTEMPTS = 3
+
+# タスクの種類 → ワーカーで実行する関数（モジュール名, 関数名）。関数は (payload, engine) を受け取り、JSONにできる結果を返す
+TASK_HANDLERS = {
+    'item_update': ('item_updater', 'scan_booth_task'),
+    'bench': ('crawl_coordinator', 'count_item_links_task'),
+}
+
+class CrawlFrontier:
+    """共有のSQLiteファイルに置くジョブのタスクの一覧（pending → leased → done / failed）"""
+
+    def __init__(self, db_path, job, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.job = job
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # HTTPサービスの各スレッドから使うので、接続は1つにしてロックで順番に使う
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self.lock = threading.Lock()
+        with self.lock:
+            # 結果が返ってくるたびにコミットするので、WALにしてfsyncの回数を減らす
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS crawl_frontier (
+                    job TEXT NOT NULL,
+                    task_key TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    payload_json TEXT,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    worker TEXT,
+                    lease_expires REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    result_json TEXT,
+                    error TEXT,
+                    PRIMARY KEY (job, task_key)
+                )
+            ''')
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_crawl_frontier_status ON crawl_frontier (job, status)")
+            self.conn.commit()
+
+    def add(self, kind, tasks):
+        """タスク（(キー, payload)のリスト）を追加する。前回失敗したタスクは未処理に戻す"""
+        with self.lock:
+            self.conn.executemany('''
+                INSERT INTO crawl_frontier (job, task_key, kind, payload_json) VALUES (?, ?, ?, ?)
+                ON CONFLICT (job, task_key) DO UPDATE SET status = 'pending', attempts = 0, error = NULL
+                WHERE status = 'failed'
+            ''', [(self.job, str(key), kind, json.dumps(payload, ensure_ascii=False)) for key, payload in tasks])
+            self.conn.commit()
+
+    def lease(self, worker, count):
+        """未処理のタスクを最大count件リースする（期限切れのリースは先に未処理に戻す）"""
+        now = time.time()
+        with self.lock:
+            self.conn.execute('''
+                UPDATE crawl_frontier SET status = 'pending', worker = NULL
+                WHERE job = ? AND status = 'leased' AND lease_expires < ?
+            ''', (self.job, now))
+            rows = self.conn.execute('''
+                SELECT task_key, kind, payload_json FROM crawl_frontier
+                WHERE job = ? AND status = 'pending' ORDER BY attempts, rowid LIMIT ?
+            ''', (self.job, count)).fetchall()
+            self.conn.executemany('''
+                UPDATE crawl_frontier SET status = 'leased', worker = ?, lease_expires = ?
+                WHERE job = ? AND task_key = ?
+            ''', [(worker, now + self.lease_seconds, self.job, row[0]) for row in rows])
+            self.conn.commit()
+        return [{'key': row[0], 'kind': row[1], 'payload': json.loads(row[2])} for row in rows]
+
+    def complete(self, worker, key, result=None, error=None):
+        """ワーカーから返ってきた結果を記録する。エラーならMAX_ATTEMPTS回までは未処理に戻す。
+        別のワーカーが先に終えていた場合（リースの期限切れ後に両方が処理した場合）はFalseを返す"""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT status, attempts FROM crawl_frontier WHERE job = ? AND task_key = ?",
+                (self.job, str(key))).fetchone()
+            accepted = row is not None and row[0] in ('pending', 'leased')
+            if accepted and error is None:
+                self.conn.execute('''
+                    UPDATE crawl_frontier SET status = 'done', worker = ?, result_json = ?, error = NULL
+                    WHERE job = ? AND task_key = ?
+                ''', (worker, json.dumps(result, ensure_ascii=False), self.job, str(key)))
+            elif accepted:
+                status = 'failed' if row[1] + 1 >= self.max_attempts else 'pending'
+                self.conn.execute('''
+                    UPDATE crawl_frontier SET status = ?, worker = NULL, attempts = attempts + 1, error = ?
+                    WHERE job = ? AND task_key = ?
+                ''', (status, error, self.job, str(key)))
+            # 結果を返してきたワーカーは動いているので、残りのリースを延長する
+            self.conn.execute('''
+                UPDATE crawl_frontier SET lease_expires = ?
+                WHERE job = ? AND status = 'leased' AND worker = ?
+            ''', (now + self.lease_seconds, self.job, worker))
+            self.conn.commit()
+        return accepted
+
+    def take_done(self, limit=100):
+        """完了したタスクを (キー, payload, 結果) で返す（反映したらremoveで消す）"""
+        with self.lock:
+            rows = self.conn.execute('''
+                SELECT task_key, payload_json, result_json FROM crawl_frontier
+                WHERE job = ? AND status = 'done' LIMIT ?
+            ''', (self.job, limit)).fetchall()
+        return [(row[0], json.loads(row[1]), json.loads(row[2])) for row in rows]
+
+    def remove(self, keys):
+        """反映したタスクを消す"""
+        with self.lock:
+            self.conn.executemany("DELETE FROM crawl_frontier WHERE job = ? AND task_key = ?",
+                                  [(self.job, str(key)) for key in keys])
+            self.conn.commit()
+
+    def counts(self):
+        """状態ごとのタスクの件数"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT status, COUNT(*) FROM crawl_frontier WHERE job = ? GROUP BY status", (self.job,)).fetchall()
+        return dict(rows)
+
+    def failed(self):
+        """MAX_ATTEMPTS回失敗したタスクを (キー, エラー) で返す"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT task_key, error FROM crawl_frontier WHERE job = ? AND status = 'failed'",
+                (self.job,)).fetchall()
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM crawl_frontier WHERE job = ?", (self.job,))
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+class SlotScheduler:
+    """全ワーカー合計のリクエストを1秒あたりrate件に抑えるため、各リクエストに送ってよい時刻を割り当てる
+    （GCRA。burst件までは間隔を空けずに送れるトークンバケットと同じ。既定では1/rate秒ずつ間隔を空ける）"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+        self.reserved = 0
+
+    def reserve(self, count=1):
+        """count件のリクエストについて、送ってよくなるまでの待ち時間（秒）のリストを返す"""
+        now = time.monotonic()
+        with self.lock:
+            self.reserved += count
+            if self.rate <= 0:
+                return [0.0] * count
+            delays = []
+            for _ in range(count):
+                slot = max(self.next_slot, now - (self.burst - 1) / self.rate)
+                self.next_slot = slot + 1 / self.rate
+                delays.append(max(0.0, slot - now))
+            return delays
+
+class CoordinatorServer:
+    """フロンティアとレートの割り当てをHTTPでワーカーに提供する（別スレッドで動く）"""
+
+    def __init__(self, frontier, scheduler, host='127.0.0.1', port=DEFAULT_PORT):
+        self.frontier = frontier
+        self.scheduler = scheduler
+        self.workers = {}  # ワーカーID -> 最後にリクエストが来た時刻
+        # ワーカーが送ったリクエストの数（レートの上限がなくても数えられるよう、ワーカーからの報告で数える）
+        self.requests = 0
+        self.request_times = None  # リストにすると各リクエストの時刻も記録する（ベンチマーク用）
+        self.lock = threading.Lock()
+        # ジョブが終わったら、リースの代わりに終了を伝える
+        self.finished = threading.Event()
+        self.server = ThreadingHTTPServer((host, port), self.make_handler())
+        # 止めるときは処理中のリクエストを待つ（フロンティアを閉じた後にSQLiteを使わないように）
+        self.server.daemon_threads = False
+        self.server.block_on_close = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        if host in ('0.0.0.0', ''):
+            host = socket.gethostname()
+        return f"http://{host}:{port}"
+
+    def status(self):
+        counts = self.frontier.counts()
+        return {
+            'job': self.frontier.job,
+            'counts': counts,
+            'remaining': counts.get('pending', 0) + counts.get('leased', 0),
+            'rate': self.scheduler.rate,
+            'requests': self.requests,
+            'reserved': self.scheduler.reserved,
+            'workers': {worker: round(time.time() - seen, 1) for worker, seen in self.workers.items()},
+        }
+
+    def record_requests(self, times):
+        """ワーカーが送ったリクエストの時刻を記録する"""
+        with self.lock:
+            self.requests += len(times)
+            if self.request_times is not None:
+                self.request_times.extend(times)
+
+    def make_handler(self):
+        coordinator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def send_json(self, status, body):
+                data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path != '/status':
+                    self.send_json(404, {'error': 'not found'})
+                    return
+                self.send_json(200, coordinator.status())
+
+            def do_POST(self):
+                try:
+                    body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                except ValueError:
+                    self.send_json(400, {'error': 'JSONを送ってください'})
+                    return
+                worker = body.get('worker')
+                if worker:
+                    coordinator.workers[worker] = time.time()
+                try:
+                    if self.path == '/lease' and coordinator.finished.is_set():
+                        self.send_json(200, {'tasks': [], 'remaining': 0, 'done': True})
+                    elif self.path == '/lease':
+                        tasks = coordinator.frontier.lease(worker, int(body.get('count', 1)))
+                        counts = coordinator.frontier.counts()
+                        self.send_json(200, {'tasks': tasks,
+                                             'remaining': counts.get('pending', 0) + counts.get('leased', 0)})
+                    elif self.path == '/complete':
+                        coordinator.record_requests(body.get('requests') or [])
+                        accepted = coordinator.frontier.complete(
+                            worker, body['key'], body.get('result'), body.get('error'))
+                        self.send_json(200, {'accepted': accepted})
+                    elif self.path == '/reserve':
+                        now = time.time()
+                        delays = coordinator.scheduler.reserve(int(body.get('count', 1)))
+                        self.send_json(200, {'delays': delays, 'times': [now + delay for delay in delays]})
+                    else:
+                        self.send_json(404, {'error': 'not found'})
+                except Exception as e:
+                    print(f"コーディネーターでエラー: {self.path} - {e}")
+                    self.send_json(500, {'error': str(e)})
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """ワーカーに終了を伝えてHTTPサービスを止める（処理中のリクエストが終わるまで待つ）"""
+        self.finished.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+class CrawlCoordinator:
+    """コーディネーターを起動してタスクを配り、返ってきた結果を呼び出し元のスレッドで反映する
+    （CrawlEngine.runの分散版。ワーカーは別のプロセス・マシンで起動する）"""
+
+    def __init__(self, db_path, job, rate=DEFAULT_RATE, host='127.0.0.1', port=DEFAULT_PORT,
+                 lease_seconds=LEASE_SECONDS):
+        self.frontier = CrawlFrontier(db_path, job, lease_seconds)
+        self.scheduler = SlotScheduler(rate)
+        self.server = CoordinatorServer(self.frontier, self.scheduler, host, port)
+        self.stats = {'task_errors': 0, 'seconds': 0.0}
+
+    @property
+    def base_url(self):
+        return self.server.base_url
+
+    def start(self):
+        self.server.start()
+        print(f"コーディネーターを起動しました: {self.base_url}"
+              f"（ワーカーは python crawl_coordinator.py worker --coordinator {self.base_url} で起動します）")
+        return self
+
+    def close(self):
+        """HTTPサービスを止めてからフロンティアを閉じる（ワーカーは終了を伝えられるか、接続できなくなった時点で終了する）"""
+        self.server.stop()
+        self.frontier.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def run(self, kind, tasks, apply, progress=None, desc="処理中", poll_seconds=0.2, show_progress=True):
+        """tasks（(キー, JSONにできるpayload)のリスト）をワーカーに配り、終わったものからapply(キー, payload, 結果)に渡す。
+        applyの戻り値をprogressに記録し、記録済みのタスクは配らない。前回の分も含めて {キー: applyの戻り値} を返す"""
+        from tqdm import tqdm
+        results = progress.load() if progress else {}
+        pending = [(key, payload) for key, payload in tasks if str(key) not in results]
+        if results:
+            print(f"{len(results)}件は前回の実行で処理済みのためスキップします（残り{len(pending)}件）")
+        self.frontier.add(kind, pending)
+
+        # 前回中断したときにフロンティアに残っていたタスクも含めて数える
+        progress_bar = tqdm(total=sum(self.frontier.counts().values()), desc=desc, disable=not show_progress)
+        start = time.perf_counter()
+        while True:
+            done = self.frontier.take_done()
+            for key, payload, result in done:
+                try:
+                    recorded = apply(key, payload, result)
+                except Exception as e:
+                    print(f"タスクの処理でエラー: {key} - {e}")
+                    self.stats['task_errors'] += 1
+                else:
+                    if progress:
+                        progress.mark(key, recorded)
+                    results[key] = recorded
+                progress_bar.update(1)
+            if done:
+                self.frontier.remove([key for key, _, _ in done])
+            counts = self.frontier.counts()
+            if not done and not counts.get('pending') and not counts.get('leased'):
+                break
+            if not done:
+                time.sleep(poll_seconds)
+        progress_bar.close()
+        self.stats['seconds'] = time.perf_counter() - start
+        # 残りのタスクはないので、次にリースしに来たワーカーから終了させる
+        self.server.finished.set()
+
+        for key, error in self.frontier.failed():
+            print(f"タスクが{MAX_ATTEMPTS}回失敗しました: {key} - {error}")
+            self.stats['task_errors'] += 1
+        return results
+
+    def describe_stats(self):
+        return (f"ワーカー{len(self.server.workers)}台, リクエスト{self.server.requests}件, "
+                f"タスクのエラー{self.stats['task_errors']}件, 全体の上限{self.scheduler.rate:g}件/秒")
+
+class CoordinatorClient:
+    """ワーカーからコーディネーターへのリクエスト"""
+
+    def __init__(self, base_url, worker_id):
+        self.base_url = base_url.rstrip('/')
+        self.worker_id = worker_id
+        self.local = threading.local()
+
+    @property
+    def session(self):
+        """スレッドごとのHTTPセッション"""
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            import requests
+            session = self.local.session = requests.Session()
+        return session
+
+    def post(self, path, body):
+        response = self.session.post(f"{self.base_url}{path}", json={'worker': self.worker_id, **body}, timeout=30)
+        response.raise_for_status()
+        return response.json()
+
+    def status(self):
+        response = self.session.get(f"{self.base_url}/status", timeout=30)
+        response.raise_for_status()
+        return response.json()
+
+    def lease(self, count):
+        return self.post('/lease', {'count': count})
+
+    def complete(self, key, result=None, error=None, requests=()):
+        return self.post('/complete', {'key': key, 'result': result, 'error': error,
+                                       'requests': list(requests)})['accepted']
+
+    def reserve(self, count=1):
+        """割り当てられた待ち時間と送る時刻（コーディネーターの時計）を返す"""
+        reserved = self.post('/reserve', {'count': count})
+        return reserved['delays'], reserved['times']
+
+class RemoteRateLimiter:
+    """コーディネーターに割り当てられた時刻まで待つ（CrawlEngineのlimiterとして使う）。
+    リクエストを送る時刻を記録しておき、結果と一緒にコーディネーターに報告する（take_sent）"""
+
+    def __init__(self, client, rate):
+        self.client = client
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.sent = []
+
+    def acquire(self):
+        delay, sent_at = 0.0, time.time()
+        if self.rate > 0:
+            delays, times = self.client.reserve(1)
+            delay, sent_at = delays[0], times[0]
+        with self.lock:
+            self.sent.append(sent_at)
+        if delay > 0:
+            time.sleep(delay)
+
+    def take_sent(self):
+        """まだ報告していないリクエストの時刻を返す"""
+        with self.lock:
+            sent, self.sent = self.sent, []
+        return sent
+
+def count_item_links_task(payload, engine):
+    """ベンチマーク用のタスク: ブースページを取得して商品リンクの数を返す"""
+    page = engine.get_soup(payload['url'])
+    if page is None:
+        raise RuntimeError("ブースページを取得できませんでした")
+    return len(page.select('a[href*="/p/"]'))
+
+def load_handler(kind):
+    module_name, function_name = TASK_HANDLERS[kind]
+    return getattr(importlib.import_module(module_name), function_name)
+
+def run_worker(coordinator_url, worker_id=None, concurrency=DEFAULT_CONCURRENCY, batch_size=1,
+               wait_seconds=60, quiet=False):
+    """コーディネーターからタスクをリースして処理し、結果を返す。コーディネーターが終了したら終わる"""
+    import requests
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    client = CoordinatorClient(coordinator_url, worker_id)
+
+    # コーディネーターより先に起動した場合はwait_seconds秒まで待つ
+    deadline = time.monotonic() + wait_seconds
+    while True:
+        try:
+            status = client.status()
+            break
+        except requests.ConnectionError:
+            if time.monotonic() > deadline:
+                print(f"コーディネーターに接続できません: {coordinator_url}")
+                return 0
+            time.sleep(1)
+
+    limiter = RemoteRateLimiter(client, status['rate'])
+    engine = CrawlEngine(concurrency=concurrency, limiter=limiter)
+    handlers = {}
+    stop = threading.Event()
+    lock = threading.Lock()
+    processed = [0]
+    if not quiet:
+        print(f"ワーカー{worker_id}: {coordinator_url} のジョブ'{status['job']}'を処理します（並列数{concurrency}）")
+
+    def work(task):
+        # 失敗もコーディネーターに返せるように、例外は結果にして返す
+        try:
+            if task['kind'] not in handlers:
+                handlers[task['kind']] = load_handler(task['kind'])
+            return {'result': handlers[task['kind']](task['payload'], engine)}
+        except Exception as e:
+            return {'error': f"{type(e).__name__}: {e}"}
+
+    def loop():
+        # 各スレッドがリース → 処理 → 結果の送信を繰り返す（他のスレッドの終わりを待たずに次のタスクに進む）
+        while not stop.is_set():
+            try:
+                leased = client.lease(batch_size)
+                if leased.get('done'):
+                    stop.set()
+                    break
+                if not leased['tasks']:
+                    # 他のワーカーが処理中か、まだタスクが追加されていない
+                    time.sleep(0.2)
+                    continue
+                for task in leased['tasks']:
+                    outcome = work(task)
+                    client.complete(task['key'], requests=limiter.take_sent(), **outcome)
+                    with lock:
+                        processed[0] += 1
+            except requests.ConnectionError:
+                stop.set()
+            except requests.RequestException as e:
+                print(f"コーディネーターとの通信でエラー: {e}")
+                time.sleep(1)
+
+    threads = [threading.Thread(target=loop, daemon=True) for _ in range(engine.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if not quiet:
+        print(f"ワーカー{worker_id}: コーディネーターが終了したため終わります（{processed[0]}件処理, {engine.describe_stats()}）")
+    return processed[0]
+
+def start_local_workers(coordinator_url, count, concurrency=DEFAULT_CONCURRENCY, env=None, quiet=False):
+    """このマシンでワーカーのプロセスを起動する（コーディネーターが終了すると各プロセスも終わる）"""
+    command = [sys.executable, os.path.abspath(__file__), 'worker',
+               '--coordinator', coordinator_url, '--concurrency', str(concurrency)]
+    if quiet:
+        command.append('--quiet')
+    return [subprocess.Popen(command, env=env) for _ in range(count)]
+
+def max_requests_per_second(times):
+    """リクエストの時刻のリストから、任意の1秒間に送ったリクエスト数の最大値を求める"""
+    times = sorted(times)
+    best = start = 0
+    for end, t in enumerate(times):
+        # ちょうど1秒間隔の2件は同じ1秒に数えない（時刻を測るタイミングの誤差として1msまでは許す）
+        while t - times[start] >= 1.0 - 0.001:
+            start += 1
+        best = max(best, end - start + 1)
+    return best
+
+def run_benchmark(booth_count, worker_counts, concurrency, latency, rate):
+    """モックサーバーに対して、ワーカーのプロセス数を変えてブースページを取得し、スケーリングとレートの上限を確認する"""
+    from crawl_engine import start_mock_server
+    mock, mock_url = start_mock_server(latency)
+    booth_urls = [f"{SITE_URL}/c/tokyo40/{booth_id}" for booth_id in range(1, booth_count + 1)]
+    print(f"モックサーバー（待ち時間{latency * 1000:.0f}ms）のブースページ{booth_count}件を、"
+          f"ワーカー1台あたり並列数{concurrency}で取得します（全体の上限: {rate:g}件/秒）")
+
+    baseline = None
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for workers in worker_counts:
+                coordinator = CrawlCoordinator(os.path.join(tmp, 'frontier.db'), f"bench-{workers}", rate=rate, port=0)
+                # ワーカーから報告された各リクエストの時刻で、全体のレートの上限が守られているかを確認する
+                coordinator.server.request_times = request_times = []
+                coordinator.start()
+
+                processes = start_local_workers(coordinator.base_url, workers, concurrency,
+                                                env=dict(os.environ, BUNFREE_BASE_URL=mock_url), quiet=True)
+                # 全ワーカーの起動（import）が終わってからタスクを追加して計測する
+                while len(coordinator.server.workers) < workers:
+                    time.sleep(0.1)
+                results = coordinator.run('bench', [(url, {'url': url}) for url in booth_urls],
+                                          lambda key, payload, result: result, show_progress=False)
+                seconds = coordinator.stats['seconds']
+                coordinator.close()
+                for process in processes:
+                    process.wait()
+
+                baseline = baseline or seconds * worker_counts[0]
+                speedup = baseline / seconds
+                print(f"ワーカー{workers:>2}台: {seconds:6.2f}秒  {len(results) / seconds:6.1f}ページ/秒  "
+                      f"{speedup:5.1f}倍（効率{speedup / workers:.0%}）  "
+                      f"最大{max_requests_per_second(request_times)}件/1秒  （{coordinator.describe_stats()}）")
+    finally:
+        mock.terminate()
+        mock.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description='複数のプロセス・マシンでクロールを分担するためのワーカーとベンチマーク。')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    worker_parser = subparsers.add_parser('worker', help='コーディネーターからタスクを受け取って処理する')
+    worker_parser.add_argument('--coordinator', default=f"http://127.0.0.1:{DEFAULT_PORT}", help='コーディネーターのURL')
+    worker_parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help='このワーカーの並列数')
+    worker_parser.add_argument('--batch-size', type=int, default=1, help='各スレッドが1回にリースするタスクの数')
+    worker_parser.add_argument('--worker-id', help='ワーカーの名前（既定は ホスト名-PID）')
+    worker_parser.add_argument('--wait', type=float, default=60, help='コーディネーターの起動を待つ秒数')
+    worker_parser.add_argument('--quiet', action='store_true', help='開始・終了のメッセージを表示しない')
+
+    bench_parser = subparsers.add_parser('bench', help='モックサーバーで、ワーカーの数を増やしたときのスケーリングを計測する')
+    bench_parser.add_argument('--booths', type=int, default=120, help='取得するブースページの数')
+    bench_parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='比較するワーカーのプロセス数')
+    bench_parser.add_argument('--concurrency', type=int, default=1, help='ワーカー1台あたりの並列数')
+    bench_parser.add_argument('--latency', type=float, default=0.2, help='モックサーバーの1リクエストごとの待ち時間（秒）')
+    bench_parser.add_argument('--rate', type=float, default=0, help='全体の1秒あたりのリクエスト数の上限（0で無制限）')
+    args = parser.parse_args()
+
+    if args.command == 'worker':
+        run_worker(args.coordinator, args.worker_id, args.concurrency, args.batch_size, args.wait, args.quiet)
+    else:
+        run_benchmark(args.booths, args.workers, args.concurrency, args.latency, args.rate)
+
+if __name__ == "__main__":
+    main()
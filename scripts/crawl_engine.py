@@ -0,0 +1,281 @@
+import os
+import json
+import time
+import random
+import argparse
+import threading
+import concurrent.futures
+
+from change_tracking import now_iso
+
+# ブースページ・商品ページを並列に取得するための共通の仕組み（ItemUpdater・WebsiteURLPatcherで使う）。
+#   - 並列数（CRAWL_CONCURRENCY）と、全スレッド合計のリクエスト数の上限（CRAWL_RATE 件/秒）を設定できる
+#   - ページの取得と解析はワーカースレッドで行い、SQLite・Qdrantへの書き込みは呼び出し元のスレッドだけで行う
+#   - 処理済みのタスクはcrawl_progressテーブルに記録し、中断しても再実行すると続きから再開する
+#   - BUNFREE_BASE_URLを指定すると c.bunfree.net の代わりにそのサーバー（mock_bunfree_server.py）から取得する
+
+SITE_URL = "https://c.bunfree.net"
+DEFAULT_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "8"))
+DEFAULT_RATE = float(os.getenv("CRAWL_RATE", "10"))  # 0なら無制限
+MAX_RETRIES = 3
+REQUEST_TIMEOUT = 30
+
+class RateLimiter:
+    """トークンバケットで、全スレッド合計のリクエスト数を1秒あたりrate件に抑える"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """リクエストを1件送ってよくなるまで待つ"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class CrawlProgress:
+    """ジョブごとに処理済みのタスクとその結果を記録する（再実行時に続きから再開するため）"""
+
+    def __init__(self, conn, job):
+        self.conn = conn
+        self.job = job
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS crawl_progress (
+                job TEXT NOT NULL,
+                task_key TEXT NOT NULL,
+                result_json TEXT,
+                done_at TEXT,
+                PRIMARY KEY (job, task_key)
+            )
+        ''')
+        self.conn.commit()
+
+    def load(self):
+        """処理済みのタスクを {task_key: 結果} で返す"""
+        cursor = self.conn.execute(
+            "SELECT task_key, result_json FROM crawl_progress WHERE job = ?", (self.job,))
+        return {row[0]: json.loads(row[1]) if row[1] else None for row in cursor.fetchall()}
+
+    def mark(self, key, result):
+        """タスクを処理済みとして記録する"""
+        self.conn.execute('''
+            INSERT OR REPLACE INTO crawl_progress (job, task_key, result_json, done_at) VALUES (?, ?, ?, ?)
+        ''', (self.job, str(key), json.dumps(result, ensure_ascii=False), now_iso()))
+        self.conn.commit()
+
+    def clear(self):
+        """ジョブの記録を削除する（最後まで終わったとき、または最初からやり直すとき）"""
+        self.conn.execute("DELETE FROM crawl_progress WHERE job = ?", (self.job,))
+        self.conn.commit()
+
+class CrawlEngine:
+    """並列数とレートの上限を守りながらページを取得し、タスクを並列に処理する"""
+
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE, base_url=None,
+                 retries=MAX_RETRIES, session_factory=None, limiter=None):
+        # limiter: acquire()とrateを持つもの（分散クロールではコーディネーターが全体のレートを管理する）
+        self.concurrency = max(1, concurrency)
+        self.limiter = limiter or RateLimiter(rate)
+        self.base_url = (base_url or os.getenv("BUNFREE_BASE_URL") or '').rstrip('/') or None
+        self.retries = retries
+        self.session_factory = session_factory
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'retries': 0, 'failures': 0, 'task_errors': 0}
+        # スレッドプールは実行のたびに作り直さず使い回す（スレッドごとのHTTPセッションを温かいまま保つため）
+        self.executor = None
+        self.stopping = threading.Event()
+
+    def session(self):
+        """スレッドごとのHTTPセッション（CloudScraperのセッションはスレッド間で共有しない）"""
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            if self.session_factory is None:
+                import cloudscraper
+                self.session_factory = cloudscraper.create_scraper
+            session = self.local.session = self.session_factory()
+        return session
+
+    def resolve_url(self, url):
+        """BUNFREE_BASE_URLが指定されていれば、c.bunfree.netのURLをそのサーバーのURLにする"""
+        if self.base_url and url.startswith(SITE_URL):
+            return self.base_url + url[len(SITE_URL):]
+        return url
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def fetch_text(self, url):
+        """ページのHTMLを取得する（429・5xx・通信エラーは待ってから再試行。取得できなければNone）"""
+        for attempt in range(1, self.retries + 1):
+            self.limiter.acquire()
+            self.count('requests')
+            try:
+                response = self.session().get(self.resolve_url(url), timeout=REQUEST_TIMEOUT)
+                if response.status_code == 429 or response.status_code >= 500:
+                    raise RuntimeError(f"HTTP {response.status_code}")
+                if response.status_code >= 400:
+                    print(f"Error fetching {url}: HTTP {response.status_code}")
+                    self.count('failures')
+                    return None
+                return response.text
+            except Exception as e:
+                if attempt == self.retries:
+                    print(f"Error fetching {url}: {e}")
+                    self.count('failures')
+                    return None
+                self.count('retries')
+                time.sleep(0.5 * 2 ** (attempt - 1) + random.random() * 0.1)
+
+    def get_soup(self, url):
+        """URLからBeautifulSoupオブジェクトを取得"""
+        from bs4 import BeautifulSoup
+        text = self.fetch_text(url)
+        if text is None:
+            return None
+        return BeautifulSoup(text, 'html.parser')
+
+    def run(self, tasks, worker, apply, progress=None, desc="処理中"):
+        """tasks（(キー, タスク)のリスト）をworker(タスク)で並列に処理する。
+        結果はこのメソッドを呼んだスレッドでapply(キー, タスク, 結果)に渡す（DBへの書き込みはapplyだけで行う）。
+        applyの戻り値（JSONにできるもの）をprogressに記録し、記録済みのタスクは飛ばす。
+        前回の分も含めて {キー: applyの戻り値} を返す。
+        stop()が呼ばれたら新しいタスクは投入せず、処理中のタスクの結果を反映してから戻る"""
+        from tqdm import tqdm
+        results = progress.load() if progress else {}
+        pending = [(key, task) for key, task in tasks if str(key) not in results]
+        if results:
+            print(f"{len(results)}件は前回の実行で処理済みのためスキップします（残り{len(pending)}件）")
+
+        progress_bar = tqdm(total=len(pending), desc=desc)
+        start = time.perf_counter()
+        if self.executor is None:
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency)
+        in_flight = {}
+        remaining = iter(pending)
+
+        def submit_next():
+            if self.stopping.is_set():
+                return False
+            for key, task in remaining:
+                in_flight[self.executor.submit(worker, task)] = (key, task)
+                return True
+            return False
+
+        # 中断したときに待つタスクが少なくて済むよう、投入するのは並列数の2倍まで
+        for _ in range(self.concurrency * 2):
+            if not submit_next():
+                break
+        while in_flight:
+            done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                key, task = in_flight.pop(future)
+                try:
+                    recorded = apply(key, task, future.result())
+                except Exception as e:
+                    print(f"タスクの処理でエラー: {key} - {e}")
+                    self.count('task_errors')
+                else:
+                    if progress:
+                        progress.mark(key, recorded)
+                    results[str(key)] = recorded
+                progress_bar.update(1)
+                submit_next()
+        progress_bar.close()
+        self.stats['seconds'] = time.perf_counter() - start
+        return results
+
+    def stop(self):
+        """実行中のrun()に、新しいタスクを投入せずに終わるよう伝える（シグナルハンドラーから呼べる）"""
+        self.stopping.set()
+
+    def close(self):
+        """スレッドプールを終了する"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def describe_stats(self):
+        stats = self.stats
+        return (f"リクエスト{stats['requests']}件（再試行{stats['retries']}件, 失敗{stats['failures']}件）, "
+                f"タスクのエラー{stats['task_errors']}件, 並列数{self.concurrency}, "
+                f"上限{self.limiter.rate:g}件/秒")
+
+def start_mock_server(latency, port=8799):
+    """モックサーバーを別プロセスで起動する（同じプロセスだとGILを取り合って計測がゆがむため）"""
+    import subprocess
+    import sys
+    import urllib.request
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mock_bunfree_server.py'),
+         '--port', str(port), '--latency', str(latency)],
+        stdout=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f"{base_url}/p/tokyo40/1", timeout=1).read()
+            return process, base_url
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("モックサーバーを起動できませんでした")
+
+def run_benchmark(booth_count, concurrencies, latency, rate):
+    """モックサーバーに対して、ブースページの取得と解析を並列数を変えて実行し、直列との速度を比較する"""
+    process, base_url = start_mock_server(latency)
+    try:
+        lister = CrawlEngine(concurrency=1, rate=0, base_url=base_url)
+        soup = lister.get_soup(f"{SITE_URL}/c/tokyo40/all/booth")
+        booth_urls = sorted({
+            f"{SITE_URL}{link['href']}" for link in soup.find_all('a', href=True)
+            if link['href'].startswith('/c/tokyo40/') and link['href'].rsplit('/', 1)[-1].isdigit()
+        })[:booth_count]
+        print(f"モックサーバー（待ち時間{latency * 1000:.0f}ms）で{len(booth_urls)}件のブースページを取得・解析します")
+
+        baseline = None
+        for concurrency in concurrencies:
+            engine = CrawlEngine(concurrency=concurrency, rate=rate, base_url=base_url)
+
+            def worker(url):
+                page = engine.get_soup(url)
+                return len(page.select('a[href*="/p/"]')) if page else None
+
+            found = []
+            engine.run([(url, url) for url in booth_urls], worker,
+                       lambda key, task, result: found.append(result), desc=f"並列数{concurrency}")
+            engine.close()
+            seconds = engine.stats['seconds']
+            baseline = baseline or seconds
+            print(f"並列数{concurrency:>3}: {seconds:6.2f}秒  {len(booth_urls) / seconds:7.1f}ページ/秒  "
+                  f"直列の{baseline / seconds:5.1f}倍  （{engine.describe_stats()}）")
+    finally:
+        process.terminate()
+        process.wait()
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='ローカルのモックサーバーで、ブースページの並列取得が直列に比べてどれだけ速いかを計測します。')
+    parser.add_argument('--booths', type=int, default=200, help='取得するブースページの数')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8, 16], help='比較する並列数')
+    parser.add_argument('--latency', type=float, default=0.05, help='モックサーバーの1リクエストごとの待ち時間（秒）')
+    parser.add_argument('--rate', type=float, default=0, help='1秒あたりのリクエスト数の上限（0で無制限）')
+    args = parser.parse_args()
+
+    run_benchmark(args.booths, args.concurrency, args.latency, args.rate)
+
+if __name__ == "__main__":
+    main()
@@ -22,7 +22,9 @@ def create_database():
         map_number INTEGER,
         position_top REAL,
         position_left REAL,
-        url TEXT UNIQUE
+        url TEXT UNIQUE,
+        content_hash TEXT,
+        updated_at TEXT
     )
     ''')
 
@@ -42,13 +44,77 @@ def create_database():
         url TEXT,
         page_url TEXT UNIQUE,
         description TEXT,
+        content_hash TEXT,
+        updated_at TEXT,
         FOREIGN KEY (booth_id) REFERENCES booths (id)
     )
     ''')
 
+    # ブースごとにアイテムを読む処理（create_vector_db.pyのストリーミングなど）用のインデックス
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_items_booth_id ON items (booth_id, id)')
+
+    # 変更追跡用のカラムとテーブルを用意（既存DBにも追加）
+    migrate_change_tracking(conn)
+
+    # 掲載が終わったブース・アイテムの記録用テーブル
+    migrate_tombstones(conn)
+
     # 変更を保存
     conn.commit()
     conn.close()
 
+def migrate_change_tracking(conn):
+    """変更追跡用のカラムと同期状態テーブルを作成する（既存DB向けのマイグレーション）"""
+    cursor = conn.cursor()
+
+    # booths/itemsにcontent_hashとupdated_atがなければ追加
+    for table in ('booths', 'items'):
+        cursor.execute(f"PRAGMA table_info({table})")
+        columns = {row[1] for row in cursor.fetchall()}
+        for column in ('content_hash', 'updated_at'):
+            if column not in columns:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} TEXT")
+
+    # Qdrantに反映済みの内容を記録するテーブル
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS vector_sync_state (
+        collection TEXT NOT NULL,
+        point_id INTEGER NOT NULL,
+        text_hash TEXT,
+        payload_hash TEXT,
+        synced_at TEXT,
+        PRIMARY KEY (collection, point_id)
+    )
+    ''')
+
+    # アイテムの削除・追加・移動では、ブースのテキストとペイロード（頒布物の一覧）が変わるので、
+    # 所属していた・所属するブースのupdated_atも進めて差分同期の候補にする（now_isoと同じ形式の時刻）
+    touch_booth = "UPDATE booths SET updated_at = strftime('%Y-%m-%dT%H:%M:%f', 'now') || '000+00:00' WHERE id = {}"
+    triggers = {
+        'items_delete_touch_booth': ('AFTER DELETE ON items', [touch_booth.format('OLD.booth_id')]),
+        'items_insert_touch_booth': ('AFTER INSERT ON items', [touch_booth.format('NEW.booth_id')]),
+        'items_move_touch_booth': ('AFTER UPDATE OF booth_id ON items',
+                                   [touch_booth.format('OLD.booth_id'), touch_booth.format('NEW.booth_id')]),
+    }
+    for name, (event, statements) in triggers.items():
+        body = ' '.join(f"{statement};" for statement in statements)
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END")
+    conn.commit()
+
+def migrate_tombstones(conn):
+    """サイトから消えたブース・アイテムを記録するテーブルを作成する（tombstones.py参照）。
+    消えた行はbooths/itemsから削除し、元の行をJSONで残す（誤って消した場合に戻せるように）"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS tombstones (
+        table_name TEXT NOT NULL,
+        row_id INTEGER NOT NULL,
+        url TEXT,
+        row_json TEXT,
+        deleted_at TEXT,
+        PRIMARY KEY (table_name, row_id)
+    )
+    ''')
+    conn.commit()
+
 if __name__ == "__main__":
     create_database() 
\ No newline at end of file
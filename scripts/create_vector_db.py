@@ -1,50 +1,68 @@
 import os
 import sqlite3
 import json
-from dotenv import load_dotenv
-from qdrant_client import QdrantClient
-from qdrant_client.http import models
-import voyageai
 import pickle
 import hashlib
-
-# 環境変数の読み込み
-load_dotenv()
-
-# API KEYの取得
-QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
-VOYAGE_API_KEY = os.getenv("VOYAGE_API_KEY")
-QDRANT_URL = os.getenv("QDRANT_URL")
-
-# Qdrantクライアントの初期化
-qdrant = QdrantClient(
-    url=QDRANT_URL,
-    api_key=QDRANT_API_KEY,
-    timeout=300.0  # タイムアウトを5分に設定
+import itertools
+import threading
+from change_tracking import TRACKING_COLUMNS, hash_value
+from collection_aliases import (
+    ALIAS_NAMES,
+    next_version_name,
+    verify_collection,
+    switch_aliases,
+    garbage_collect,
 )
+from vector_store import (
+    append_vector_records,
+    iter_vector_records,
+    vector_file_for,
+    FULL_EMBEDDING_DIMENSION,
+)
+from parallel_uploader import UploadProgressLog, upload_stream
+from embedding_pipeline import EmbeddingPipeline, iter_batches, peak_rss_mb
+from embedding_dedupe import DedupingEmbedder
+from index_config import load_index_settings, build_collection_options, describe_settings
+from payload_projection import project_booth_payload, project_item_payload, project_records
+from payload_indexes import ensure_payload_indexes
+from clients import qdrant, voyage, models
 
-# VoyageAIクライアントの初期化
-voyage = voyageai.Client(api_key=VOYAGE_API_KEY)
+# QdrantとVoyageAIのクライアントは最初に使うときに作られる（clients.py）
 
 # 使用するモデルとディメンションの設定
 EMBEDDING_MODEL = "voyage-3-large"
-EMBEDDING_DIMENSION = 2048
+# voyage-3-largeの最大次元数はFULL_EMBEDDING_DIMENSION(2048)。EMBEDDING_DIMENSIONで1024/512/256などに縮められる（Matryoshka）
+EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", str(FULL_EMBEDDING_DIMENSION)))
+
+# アップロードの設定（gRPCはQDRANT_PREFER_GRPC=trueで有効化）
+UPLOAD_BATCH_SIZE = int(os.getenv("QDRANT_UPLOAD_BATCH_SIZE", "256"))
+UPLOAD_PARALLEL = int(os.getenv("QDRANT_UPLOAD_PARALLEL", "4"))
+
+# ベクトル化の設定（トークン制限(120,000)に引っかからないよう、バッチサイズは小さめにする）
+EMBED_BATCH_SIZE = 400
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "2"))
+# 各段の間のキューの長さ（バッチ数）。メモリに載るベクトルの数の上限を決める（embedding_pipeline.py参照）
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "2"))
 
 # キャッシュ関連の設定
 CACHE_DIR = "cache"
-# キャッシュディレクトリがなければ作成
-if not os.path.exists(CACHE_DIR):
-    os.makedirs(CACHE_DIR)
 
-def get_cache_key(texts, model, output_dimension):
-    """キャッシュのキーを生成する"""
+def ensure_cache_dir():
+    """キャッシュディレクトリがなければ作成する（import時には作らない）"""
+    if not os.path.exists(CACHE_DIR):
+        os.makedirs(CACHE_DIR)
+
+def get_cache_key(texts, model, output_dimension, input_type=None):
+    """キャッシュのキーを生成する（input_typeを指定してベクトル化したものは別のキーにする）"""
     # テキストと設定からハッシュを生成
     text_hash = hashlib.md5("".join(texts).encode()).hexdigest()
+    if input_type:
+        return f"{model}_{output_dimension}_{input_type}_{text_hash}"
     return f"{model}_{output_dimension}_{text_hash}"
 
-def get_embeddings_from_cache(texts, model, output_dimension):
+def get_embeddings_from_cache(texts, model, output_dimension, input_type=None):
     """キャッシュから埋め込みベクトルを取得する"""
-    cache_key = get_cache_key(texts, model, output_dimension)
+    cache_key = get_cache_key(texts, model, output_dimension, input_type)
     cache_file = os.path.join(CACHE_DIR, f"{cache_key}.pkl")
     
     if os.path.exists(cache_file):
@@ -58,12 +76,13 @@ def get_embeddings_from_cache(texts, model, output_dimension):
     
     return None
 
-def save_embeddings_to_cache(texts, model, output_dimension, embeddings):
+def save_embeddings_to_cache(texts, model, output_dimension, embeddings, input_type=None):
     """埋め込みベクトルをキャッシュに保存する"""
-    cache_key = get_cache_key(texts, model, output_dimension)
+    cache_key = get_cache_key(texts, model, output_dimension, input_type)
     cache_file = os.path.join(CACHE_DIR, f"{cache_key}.pkl")
     
     try:
+        ensure_cache_dir()
         with open(cache_file, 'wb') as f:
             pickle.dump(embeddings, f)
         print(f"{len(embeddings)}件の埋め込みベクトルをキャッシュに保存しました")
@@ -78,569 +97,290 @@ def get_database_connection():
     conn.row_factory = sqlite3.Row
     return conn
 
-def fetch_booths():
-    """ブースデータを取得する"""
-    conn = get_database_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT * FROM booths
-    ''')
-    booths = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return booths
-
-def fetch_items():
-    """アイテムデータを取得する"""
+def iter_booths_with_items(conn):
+    """ブースを1件ずつ、所属するアイテムのリストと一緒に返す。
+    ブースとアイテムをそれぞれID順に読むカーソルを突き合わせるので、全件をメモリに載せない"""
+    booths = conn.execute('SELECT * FROM booths ORDER BY id')
+    items = conn.execute('SELECT * FROM items WHERE booth_id IS NOT NULL ORDER BY booth_id, id')
+    item = next(items, None)
+    for booth in booths:
+        # 存在しないブースのアイテムは読み飛ばす（以前のJOINと同じ扱い）
+        while item is not None and item['booth_id'] < booth['id']:
+            item = next(items, None)
+        booth_items = []
+        while item is not None and item['booth_id'] == booth['id']:
+            booth_items.append(dict(item))
+            item = next(items, None)
+        yield dict(booth), booth_items
+
+def iter_booth_entries():
+    """ブースのベクトル化用のエントリ（ID・テキストとそのハッシュ・ペイロード）を1件ずつ返す"""
     conn = get_database_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT i.*, b.name as booth_name, b.area as booth_area, b.area_number as booth_area_number 
-        FROM items i
-        JOIN booths b ON i.booth_id = b.id
-    ''')
-    items = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return items
-
-def fetch_booth_items(booth_id):
-    """指定されたブースのアイテムを取得する"""
+    try:
+        for booth, booth_items in iter_booths_with_items(conn):
+            text = build_booth_text(booth, booth_items)
+            yield {
+                'id': booth['id'],
+                'text': text,
+                'text_hash': hash_value(text),
+                'payload': build_booth_payload(booth, booth_items),
+            }
+    finally:
+        conn.close()
+
+def iter_item_entries():
+    """アイテムのベクトル化用のエントリ（ID・テキストとそのハッシュ・ペイロード）を1件ずつ返す"""
     conn = get_database_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT * FROM items WHERE booth_id = ?
-    ''', (booth_id,))
-    items = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return items
-
-def prepare_booth_vectors(booths):
-    """ブースデータをベクトル化する準備をする"""
-    # APIの上限を考慮してバッチサイズを設定
-    # トークン制限(120,000)に引っかからないよう、バッチサイズを縮小
-    batch_size = 400
-    vectorized_booths = []
-    
-    # 全ブースIDをファイルに保存（中断時の対策）
-    booth_ids = [b['id'] for b in booths]
-    with open(os.path.join(CACHE_DIR, 'booth_ids.json'), 'w') as f:
-        json.dump(booth_ids, f)
-    
-    # 保存済みベクトルがあれば読み込む
-    saved_vectors_file = os.path.join(CACHE_DIR, 'booth_vectors.pkl')
-    if os.path.exists(saved_vectors_file):
-        try:
-            with open(saved_vectors_file, 'rb') as f:
-                saved_vectors = pickle.load(f)
-                print(f"{len(saved_vectors)}件の保存済みブースベクトルを読み込みました")
-                
-                # 処理済みのIDを取得
-                processed_ids = [v['id'] for v in saved_vectors]
-                
-                # 未処理のブースだけを抽出
-                booths = [b for b in booths if b['id'] not in processed_ids]
-                
-                # 既に処理済みのベクトルを追加
-                vectorized_booths.extend(saved_vectors)
-                
-                print(f"残り{len(booths)}件のブースを処理します")
-        except Exception as e:
-            print(f"保存済みベクトルの読み込みエラー: {e}")
-    
-    # ブースをバッチに分割して処理
-    for i in range(0, len(booths), batch_size):
-        batch_booths = booths[i:i+batch_size]
-        print(f"ブースバッチ処理中: {i+1}～{min(i+batch_size, len(booths))}/{len(booths)}")
-        
-        booth_texts = []
-        for booth in batch_booths:
-            # ベクトル化するテキストを作成（極力短くする）
-            text = f"ブース名: {booth['name'] or ''}\n"
-            text += f"読み: {booth['yomi'] or ''}\n"
-            text += f"カテゴリ: {booth['category'] or ''}\n"
-            text += f"エリア: {booth['area'] or ''} {booth['area_number'] or ''}\n"
-            
-            # 説明文は長くなりがちなので、適度に切り詰める
-            description = booth['description'] or ''
-            if len(description) > 500:  # 長すぎる説明文は切り詰める
-                description = description[:500] + "..."
-            text += f"説明: {description}\n"
-            
-            # 関連アイテムの情報も追加（少なめに）
-            booth_items = fetch_booth_items(booth['id'])
-            if booth_items:
-                text += "主な頒布物:\n"
-                for item in booth_items[:3]:  # 最大3つまでに制限
-                    text += f"- {item['name'] or ''}\n"
-            
-            booth_texts.append(text)
-        
-        # 最大トークン数をチェック（概算）
-        estimated_tokens = sum(len(text.split()) for text in booth_texts)
-        print(f"推定トークン数: 約{estimated_tokens}（実際はこれより多い可能性あり）")
-        
-        # キャッシュから埋め込みベクトルを取得を試みる
-        embeddings = get_embeddings_from_cache(booth_texts, EMBEDDING_MODEL, EMBEDDING_DIMENSION)
-        
-        # キャッシュになければVoyage AIでベクトル化
-        if embeddings is None:
-            print(f"Voyage APIで{len(booth_texts)}件のテキストをベクトル化します")
-            try:
-                embeddings = voyage.embed(
-                    texts=booth_texts, 
-                    model=EMBEDDING_MODEL,
-                    output_dimension=EMBEDDING_DIMENSION,  # スペースを削除して正しいパラメータ名を使用
-                    truncation=True  # 長いテキストも切り捨てずに処理
-                ).embeddings
-                
-                # キャッシュに保存
-                save_embeddings_to_cache(booth_texts, EMBEDDING_MODEL, EMBEDDING_DIMENSION, embeddings)
-            except Exception as e:
-                print(f"Voyage API呼び出しエラー: {e}")
-                print("バッチサイズをさらに半分に縮小して再試行します")
-                
-                # バッチを半分に分割して再試行
-                half_size = len(batch_booths) // 2
-                for j in range(0, len(batch_booths), half_size):
-                    sub_batch = batch_booths[j:j+half_size]
-                    sub_texts = booth_texts[j:j+half_size]
-                    print(f"小さいバッチで処理: {j+1}～{min(j+half_size, len(batch_booths))}/{len(batch_booths)}")
-                    
-                    # 小さいバッチでキャッシュをチェック
-                    sub_embeddings = get_embeddings_from_cache(sub_texts, EMBEDDING_MODEL, EMBEDDING_DIMENSION)
-                    
-                    if sub_embeddings is None:
-                        try:
-                            sub_embeddings = voyage.embed(
-                                texts=sub_texts, 
-                                model=EMBEDDING_MODEL,
-                                output_dimension=EMBEDDING_DIMENSION,
-                                truncation=True
-                            ).embeddings
-                            
-                            # キャッシュに保存
-                            save_embeddings_to_cache(sub_texts, EMBEDDING_MODEL, EMBEDDING_DIMENSION, sub_embeddings)
-                        except Exception as sub_e:
-                            print(f"サブバッチでもエラー発生: {sub_e}")
-                            # さらに小さいバッチに分割して処理
-                            for k, text in enumerate(sub_texts):
-                                print(f"1件ずつ処理: {k+1}/{len(sub_texts)}")
-                                try:
-                                    single_embedding = voyage.embed(
-                                        texts=[text], 
-                                        model=EMBEDDING_MODEL,
-                                        output_dimension=EMBEDDING_DIMENSION,
-                                        truncation=True
-                                    ).embeddings[0]
-                                    
-                                    # 一時的に保存
-                                    temp_file = os.path.join(CACHE_DIR, f"temp_booth_{batch_booths[j+k]['id']}.pkl")
-                                    with open(temp_file, 'wb') as f:
-                                        pickle.dump(single_embedding, f)
-                                    
-                                    # ブースデータを処理
-                                    booth = batch_booths[j+k]
-                                    booth_items = fetch_booth_items(booth['id'])
-                                    booth_with_items = booth.copy()
-                                    booth_with_items['items'] = booth_items
-                                    
-                                    vectorized_booths.append({
-                                        "id": booth["id"],
-                                        "vector": single_embedding,
-                                        "payload": booth_with_items
-                                    })
-                                    
-                                    # 途中結果を保存
-                                    with open(saved_vectors_file, 'wb') as f:
-                                        pickle.dump(vectorized_booths, f)
-                                    print(f"現在までの{len(vectorized_booths)}件のブースベクトルを一時保存しました")
-                                    
-                                except Exception as e:
-                                    print(f"個別処理でエラー発生（ブースID: {batch_booths[j+k]['id']}）: {e}")
-                                    continue
-                            continue
-                        
-                        # サブバッチ処理
-                        for k, booth in enumerate(sub_batch):
-                            booth_items = fetch_booth_items(booth['id'])
-                            booth_with_items = booth.copy()
-                            booth_with_items['items'] = booth_items
-                            
-                            vectorized_booths.append({
-                                "id": booth["id"],
-                                "vector": sub_embeddings[k],
-                                "payload": booth_with_items
-                            })
-                        
-                        # 途中結果を保存
-                        with open(saved_vectors_file, 'wb') as f:
-                            pickle.dump(vectorized_booths, f)
-                        print(f"現在までの{len(vectorized_booths)}件のブースベクトルを一時保存しました")
-                    else:
-                        # キャッシュから取得したベクトルを使用
-                        for k, booth in enumerate(sub_batch):
-                            booth_items = fetch_booth_items(booth['id'])
-                            booth_with_items = booth.copy()
-                            booth_with_items['items'] = booth_items
-                            
-                            vectorized_booths.append({
-                                "id": booth["id"],
-                                "vector": sub_embeddings[k],
-                                "payload": booth_with_items
-                            })
-                        
-                        # 途中結果を保存
-                        with open(saved_vectors_file, 'wb') as f:
-                            pickle.dump(vectorized_booths, f)
-                        print(f"現在までの{len(vectorized_booths)}件のブースベクトルを一時保存しました")
-                
-                # 次のメインバッチへ
-                continue
-        
-        # ベクトルデータとブースデータを紐づける
-        batch_vectorized_booths = []
-        for j, booth in enumerate(batch_booths):
-            # ブースの関連アイテムを取得
-            booth_items = fetch_booth_items(booth['id'])
-            # ペイロードに関連アイテム情報を追加
-            booth_with_items = booth.copy()
-            booth_with_items['items'] = booth_items
-            
-            batch_vectorized_booths.append({
-                "id": booth["id"],
-                "vector": embeddings[j],
-                "payload": booth_with_items
-            })
-        
-        # バッチごとに結果をリストに追加
-        vectorized_booths.extend(batch_vectorized_booths)
-        
-        # 途中結果を保存（中断時の対策）
-        with open(saved_vectors_file, 'wb') as f:
-            pickle.dump(vectorized_booths, f)
-        print(f"現在までの{len(vectorized_booths)}件のブースベクトルを一時保存しました")
-    
-    return vectorized_booths
-
-def prepare_item_vectors(items):
-    """アイテムデータをベクトル化する準備をする"""
-    # APIの上限を考慮してバッチサイズを設定
-    # トークン制限(120,000)に引っかからないよう、バッチサイズを縮小
-    batch_size = 400
-    vectorized_items = []
-    
-    # 全アイテムIDをファイルに保存（中断時の対策）
-    item_ids = [i['id'] for i in items]
-    with open(os.path.join(CACHE_DIR, 'item_ids.json'), 'w') as f:
-        json.dump(item_ids, f)
-    
-    # 保存済みベクトルがあれば読み込む
-    saved_vectors_file = os.path.join(CACHE_DIR, 'item_vectors.pkl')
-    if os.path.exists(saved_vectors_file):
-        try:
-            with open(saved_vectors_file, 'rb') as f:
-                saved_vectors = pickle.load(f)
-                print(f"{len(saved_vectors)}件の保存済みアイテムベクトルを読み込みました")
-                
-                # 処理済みのIDを取得
-                processed_ids = [v['id'] for v in saved_vectors]
-                
-                # 未処理のアイテムだけを抽出
-                items = [i for i in items if i['id'] not in processed_ids]
-                
-                # 既に処理済みのベクトルを追加
-                vectorized_items.extend(saved_vectors)
-                
-                print(f"残り{len(items)}件のアイテムを処理します")
-        except Exception as e:
-            print(f"保存済みベクトルの読み込みエラー: {e}")
+    try:
+        for booth, booth_items in iter_booths_with_items(conn):
+            for item in booth_items:
+                item = {
+                    **item,
+                    'booth_name': booth['name'],
+                    'booth_area': booth['area'],
+                    'booth_area_number': booth['area_number'],
+                }
+                text = build_item_text(item)
+                yield {
+                    'id': item['id'],
+                    'text': text,
+                    'text_hash': hash_value(text),
+                    'payload': build_item_payload(item, booth),
+                }
+    finally:
+        conn.close()
+
+def truncate_description(description, max_length=500):
+    """説明文は長くなりがちなので、適度に切り詰める"""
+    description = description or ''
+    if len(description) > max_length:
+        description = description[:max_length] + "..."
+    return description
+
+# ベクトル化用テキストに入れるカラム（build_booth_text・build_item_textを変えたら合わせる）
+BOOTH_TEXT_FIELDS = ('name', 'yomi', 'category', 'area', 'area_number', 'description')
+ITEM_TEXT_FIELDS = ('name', 'yomi', 'genre', 'author', 'item_type', 'description')
+
+def build_booth_text(booth, booth_items):
+    """ブースのベクトル化用テキストを作成する（極力短くする）"""
+    text = f"ブース名: {booth['name'] or ''}\n"
+    text += f"読み: {booth['yomi'] or ''}\n"
+    text += f"カテゴリ: {booth['category'] or ''}\n"
+    text += f"エリア: {booth['area'] or ''} {booth['area_number'] or ''}\n"
+    text += f"説明: {truncate_description(booth['description'])}\n"
+
+    # 関連アイテムの情報も追加（少なめに）
+    if booth_items:
+        text += "主な頒布物:\n"
+        for item in booth_items[:3]:  # 最大3つまでに制限
+            text += f"- {item['name'] or ''}\n"
+    return text
+
+def build_item_text(item):
+    """アイテムのベクトル化用テキストを作成する（item['booth_name']が必要）"""
+    text = f"アイテム名: {item['name'] or ''}\n"
+    text += f"読み: {item['yomi'] or ''}\n"
+    text += f"ジャンル: {item['genre'] or ''}\n"
+    text += f"著者: {item['author'] or ''}\n"
+    text += f"アイテムタイプ: {item['item_type'] or ''}\n"
+    text += f"説明: {truncate_description(item['description'])}\n"
+    text += f"ブース名: {item['booth_name'] or ''}\n"
+    return text
+
+def strip_tracking_columns(row):
+    """変更追跡用のカラムをペイロードから除外する"""
+    return {k: v for k, v in dict(row).items() if k not in TRACKING_COLUMNS}
+
+def build_booth_payload(booth, booth_items):
+    """ブースのペイロードを作成する（関連アイテムの要約を含む。フィールドはpayload_projection.py参照）"""
+    payload = strip_tracking_columns(booth)
+    payload['items'] = [strip_tracking_columns(item) for item in booth_items]
+    return project_booth_payload(payload)
+
+def build_item_payload(item, booth):
+    """アイテムのペイロードを作成する（所属ブースの要約を含む。フィールドはpayload_projection.py参照）"""
+    payload = strip_tracking_columns(item)
+    if booth:
+        payload['booth_details'] = strip_tracking_columns(booth)
+    return project_item_payload(payload)
+
+def embed_texts(texts, batch_size=128):
+    """テキストをバッチに分けてベクトル化する（キャッシュを利用）"""
+    embeddings = []
+    for i in range(0, len(texts), batch_size):
+        batch_texts = texts[i:i+batch_size]
+        batch_embeddings = get_embeddings_from_cache(batch_texts, EMBEDDING_MODEL, EMBEDDING_DIMENSION)
+        if batch_embeddings is None:
+            print(f"Voyage APIで{len(batch_texts)}件のテキストをベクトル化します")
+            batch_embeddings = voyage.embed(
+                texts=batch_texts,
+                model=EMBEDDING_MODEL,
+                output_dimension=EMBEDDING_DIMENSION,
+                truncation=True
+            ).embeddings
+            save_embeddings_to_cache(batch_texts, EMBEDDING_MODEL, EMBEDDING_DIMENSION, batch_embeddings)
+        embeddings.extend(batch_embeddings)
+    return embeddings
+
+def embed_batch_with_fallback(texts):
+    """テキストのバッチをベクトル化する。
+    APIエラー時はバッチを半分に縮小しながら再試行し、それでも失敗したテキストの位置にはNoneを返す"""
+    # キャッシュから埋め込みベクトルを取得を試みる
+    embeddings = get_embeddings_from_cache(texts, EMBEDDING_MODEL, EMBEDDING_DIMENSION)
+    if embeddings is not None:
+        return embeddings
     
-    # アイテムをバッチに分割して処理
-    for i in range(0, len(items), batch_size):
-        batch_items = items[i:i+batch_size]
-        print(f"アイテムバッチ処理中: {i+1}～{min(i+batch_size, len(items))}/{len(items)}")
-        
-        item_texts = []
-        for item in batch_items:
-            # ベクトル化するテキストを作成（極力短くする）
-            text = f"アイテム名: {item['name'] or ''}\n"
-            text += f"読み: {item['yomi'] or ''}\n"
-            text += f"ジャンル: {item['genre'] or ''}\n"
-            text += f"著者: {item['author'] or ''}\n"
-            text += f"アイテムタイプ: {item['item_type'] or ''}\n"
-            
-            # 説明文は長くなりがちなので、適度に切り詰める
-            description = item['description'] or ''
-            if len(description) > 500:  # 長すぎる説明文は切り詰める
-                description = description[:500] + "..."
-            text += f"説明: {description}\n"
-            
-            text += f"ブース名: {item['booth_name'] or ''}\n"
-            
-            item_texts.append(text)
-        
-        # 最大トークン数をチェック（概算）
-        estimated_tokens = sum(len(text.split()) for text in item_texts)
-        print(f"推定トークン数: 約{estimated_tokens}（実際はこれより多い可能性あり）")
-        
-        # キャッシュから埋め込みベクトルを取得を試みる
-        embeddings = get_embeddings_from_cache(item_texts, EMBEDDING_MODEL, EMBEDDING_DIMENSION)
-        
-        # キャッシュになければVoyage AIでベクトル化
-        if embeddings is None:
-            print(f"Voyage APIで{len(item_texts)}件のテキストをベクトル化します")
-            try:
-                embeddings = voyage.embed(
-                    texts=item_texts, 
-                    model=EMBEDDING_MODEL,
-                    output_dimension=EMBEDDING_DIMENSION,  # スペースを削除して正しいパラメータ名を使用
-                    truncation=True  # 長いテキストも切り捨てずに処理
-                ).embeddings
-                
-                # キャッシュに保存
-                save_embeddings_to_cache(item_texts, EMBEDDING_MODEL, EMBEDDING_DIMENSION, embeddings)
-            except Exception as e:
-                print(f"Voyage API呼び出しエラー: {e}")
-                print("バッチサイズをさらに半分に縮小して再試行します")
-                
-                # バッチを半分に分割して再試行
-                half_size = len(batch_items) // 2
-                for j in range(0, len(batch_items), half_size):
-                    sub_batch = batch_items[j:j+half_size]
-                    sub_texts = item_texts[j:j+half_size]
-                    print(f"小さいバッチで処理: {j+1}～{min(j+half_size, len(batch_items))}/{len(batch_items)}")
-                    
-                    # 小さいバッチでキャッシュをチェック
-                    sub_embeddings = get_embeddings_from_cache(sub_texts, EMBEDDING_MODEL, EMBEDDING_DIMENSION)
-                    
-                    if sub_embeddings is None:
-                        try:
-                            sub_embeddings = voyage.embed(
-                                texts=sub_texts, 
-                                model=EMBEDDING_MODEL,
-                                output_dimension=EMBEDDING_DIMENSION,
-                                truncation=True
-                            ).embeddings
-                            
-                            # キャッシュに保存
-                            save_embeddings_to_cache(sub_texts, EMBEDDING_MODEL, EMBEDDING_DIMENSION, sub_embeddings)
-                        except Exception as sub_e:
-                            print(f"サブバッチでもエラー発生: {sub_e}")
-                            # さらに小さいバッチに分割して処理
-                            for k, text in enumerate(sub_texts):
-                                print(f"1件ずつ処理: {k+1}/{len(sub_texts)}")
-                                try:
-                                    single_embedding = voyage.embed(
-                                        texts=[text], 
-                                        model=EMBEDDING_MODEL,
-                                        output_dimension=EMBEDDING_DIMENSION,
-                                        truncation=True
-                                    ).embeddings[0]
-                                    
-                                    # 一時的に保存
-                                    temp_file = os.path.join(CACHE_DIR, f"temp_item_{batch_items[j+k]['id']}.pkl")
-                                    with open(temp_file, 'wb') as f:
-                                        pickle.dump(single_embedding, f)
-                                    
-                                    # アイテムデータを処理
-                                    item = batch_items[j+k]
-                                    conn = get_database_connection()
-                                    cursor = conn.cursor()
-                                    cursor.execute('''
-                                        SELECT * FROM booths WHERE id = ?
-                                    ''', (item['booth_id'],))
-                                    booth = dict(cursor.fetchone()) if cursor.rowcount != 0 else None
-                                    conn.close()
-                                    
-                                    item_with_booth = item.copy()
-                                    if booth:
-                                        item_with_booth['booth_details'] = booth
-                                    
-                                    vectorized_items.append({
-                                        "id": item["id"],
-                                        "vector": single_embedding,
-                                        "payload": item_with_booth
-                                    })
-                                    
-                                    # 途中結果を保存
-                                    with open(saved_vectors_file, 'wb') as f:
-                                        pickle.dump(vectorized_items, f)
-                                    print(f"現在までの{len(vectorized_items)}件のアイテムベクトルを一時保存しました")
-                                    
-                                except Exception as e:
-                                    print(f"個別処理でエラー発生（アイテムID: {batch_items[j+k]['id']}）: {e}")
-                                    continue
-                            continue
-                        
-                        # サブバッチ処理
-                        for k, item in enumerate(sub_batch):
-                            conn = get_database_connection()
-                            cursor = conn.cursor()
-                            cursor.execute('''
-                                SELECT * FROM booths WHERE id = ?
-                            ''', (item['booth_id'],))
-                            booth = dict(cursor.fetchone()) if cursor.rowcount != 0 else None
-                            conn.close()
-                            
-                            item_with_booth = item.copy()
-                            if booth:
-                                item_with_booth['booth_details'] = booth
-                            
-                            vectorized_items.append({
-                                "id": item["id"],
-                                "vector": sub_embeddings[k],
-                                "payload": item_with_booth
-                            })
-                        
-                        # 途中結果を保存
-                        with open(saved_vectors_file, 'wb') as f:
-                            pickle.dump(vectorized_items, f)
-                        print(f"現在までの{len(vectorized_items)}件のアイテムベクトルを一時保存しました")
-                    else:
-                        # キャッシュから取得したベクトルを使用
-                        for k, item in enumerate(sub_batch):
-                            conn = get_database_connection()
-                            cursor = conn.cursor()
-                            cursor.execute('''
-                                SELECT * FROM booths WHERE id = ?
-                            ''', (item['booth_id'],))
-                            booth = dict(cursor.fetchone()) if cursor.rowcount != 0 else None
-                            conn.close()
-                            
-                            item_with_booth = item.copy()
-                            if booth:
-                                item_with_booth['booth_details'] = booth
-                            
-                            vectorized_items.append({
-                                "id": item["id"],
-                                "vector": sub_embeddings[k],
-                                "payload": item_with_booth
-                            })
-                        
-                        # 途中結果を保存
-                        with open(saved_vectors_file, 'wb') as f:
-                            pickle.dump(vectorized_items, f)
-                        print(f"現在までの{len(vectorized_items)}件のアイテムベクトルを一時保存しました")
-                
-                # 次のメインバッチへ
-                continue
-        
-        # ベクトルデータとアイテムデータを紐づける
-        batch_vectorized_items = []
-        for j, item in enumerate(batch_items):
-            # アイテムが所属するブースの情報を取得
-            conn = get_database_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT * FROM booths WHERE id = ?
-            ''', (item['booth_id'],))
-            booth = dict(cursor.fetchone()) if cursor.rowcount != 0 else None
-            conn.close()
-            
-            # ペイロードにブース情報を追加
-            item_with_booth = item.copy()
-            if booth:
-                item_with_booth['booth_details'] = booth
-            
-            batch_vectorized_items.append({
-                "id": item["id"],
-                "vector": embeddings[j],
-                "payload": item_with_booth
-            })
+    # キャッシュになければVoyage AIでベクトル化
+    print(f"Voyage APIで{len(texts)}件のテキストをベクトル化します")
+    try:
+        embeddings = voyage.embed(
+            texts=texts,
+            model=EMBEDDING_MODEL,
+            output_dimension=EMBEDDING_DIMENSION,
+            truncation=True  # 長いテキストも切り捨てずに処理
+        ).embeddings
         
-        # バッチごとに結果をリストに追加
-        vectorized_items.extend(batch_vectorized_items)
+        # キャッシュに保存
+        save_embeddings_to_cache(texts, EMBEDDING_MODEL, EMBEDDING_DIMENSION, embeddings)
+        return embeddings
+    except Exception as e:
+        print(f"Voyage API呼び出しエラー: {e}")
+        if len(texts) == 1:
+            return [None]
         
-        # 途中結果を保存（中断時の対策）
-        with open(saved_vectors_file, 'wb') as f:
-            pickle.dump(vectorized_items, f)
-        print(f"現在までの{len(vectorized_items)}件のアイテムベクトルを一時保存しました")
-    
-    return vectorized_items
+        # バッチを半分に分割して再試行
+        print("バッチサイズをさらに半分に縮小して再試行します")
+        half_size = (len(texts) + 1) // 2
+        return embed_batch_with_fallback(texts[:half_size]) + embed_batch_with_fallback(texts[half_size:])
 
-def create_collections():
-    """Qdrantにコレクションを作成する"""
-    # ブースコレクションの作成
-    # 古いrecreate_collectionの代わりに新しいAPIを使用
-    if qdrant.collection_exists(collection_name="booths"):
-        qdrant.delete_collection(collection_name="booths")
-    
-    qdrant.create_collection(
-        collection_name="booths",
-        vectors_config=models.VectorParams(
-            size=EMBEDDING_DIMENSION,  # voyage-3-largeのベクトルサイズ(2048)
-            distance=models.Distance.COSINE
-        ),
-        on_disk_payload=True
+def vector_file_path(kind):
+    """ベクトルファイルのパスを返す（kindはbooth/item。既定以外の次元数ではファイルを分ける）"""
+    return vector_file_for(kind, EMBEDDING_DIMENSION, CACHE_DIR)
+
+# コレクション（エイリアス名）ごとのベクトルファイルの種類とエントリの読み込み元
+VECTOR_KINDS = {'booths': 'booth', 'items': 'item'}
+ENTRY_STREAMS = {'booths': iter_booth_entries, 'items': iter_item_entries}
+
+def current_entry_hashes(alias):
+    """SQLiteの現在の内容から {id: (テキストのハッシュ, ペイロードのハッシュ)} を作る（保存済みベクトルの照合用）"""
+    return {entry['id']: (entry['text_hash'], hash_value(entry['payload'])) for entry in ENTRY_STREAMS[alias]()}
+
+def is_reusable_record(record, current):
+    """保存済みのレコードが、SQLiteの現在の行と同じテキスト・ペイロードから作ったものかどうか
+    （text_hashを持たない古い形式のレコードは照合できないので使わない）"""
+    hashes = current.get(record['id'])
+    return hashes is not None and hashes == (record.get('text_hash'), hash_value(record['payload']))
+
+def iter_reusable_records(vectors_file, alias, current):
+    """保存済みのレコードのうち、今もそのまま使えるものを1件ずつ返す（同じIDは最初の1件だけ）"""
+    seen = set()
+    for record in project_records(iter_vector_records(vectors_file), alias):
+        if record['id'] not in seen and is_reusable_record(record, current):
+            seen.add(record['id'])
+            yield record
+
+def stream_collection(alias, collection_name):
+    """SQLiteから読みながらベクトル化し、できたものから順にアップロードする。
+    ベクトルはファイルにも追記するので、中断しても再実行すれば続きから再開できる。
+    保存済みのベクトルは、削除された行や、保存後にテキスト・ペイロードが変わった行のものを捨ててから使う。
+    アップロードしたレコードのハッシュ（sync_vectors.pyの同期済みの基準）と件数・検証用のサンプルも返す"""
+    vectors_file = vector_file_path(VECTOR_KINDS[alias])
+    sources = []
+    reusable_ids = set()
+    stale_ids = set()
+    current = None
+    if os.path.exists(vectors_file):
+        current = current_entry_hashes(alias)
+        for record in project_records(iter_vector_records(vectors_file), alias):
+            if is_reusable_record(record, current):
+                reusable_ids.add(record['id'])
+            else:
+                stale_ids.add(record['id'])
+        stale_ids -= reusable_ids
+    if reusable_ids or stale_ids:
+        # 前回保存したベクトルを先にアップロードする（読み終わってからパイプラインが追記を始める）
+        print(f"{alias}: {len(reusable_ids)}件の保存済みベクトルを使います"
+              f"（削除・変更された行の{len(stale_ids)}件は使わず、ベクトル化は残りだけ行います）")
+        sources.append(iter_reusable_records(vectors_file, alias, current))
+
+    file_lock = threading.Lock()
+
+    def save_records(records):
+        with file_lock:
+            append_vector_records(vectors_file, records)
+
+    # 同じテキストは1回だけベクトル化する（embedding_dedupe.py参照。EMBED_DEDUPE=nearで類似テキストもまとめる）
+    embedder = DedupingEmbedder(embed_batch_with_fallback)
+    pipeline = EmbeddingPipeline(
+        iter_batches(ENTRY_STREAMS[alias](), EMBED_BATCH_SIZE, skip_ids=reusable_ids),
+        embedder,
+        on_embedded=save_records,
+        queue_size=PIPELINE_QUEUE_SIZE,
+        embed_workers=EMBED_WORKERS,
+        label=alias,
     )
+
+    # アップロードに流したレコードのハッシュを覚えておく（IDとハッシュだけなので全件でも小さい）
+    synced = []
+    sample = []
+
+    def track(records):
+        for record in records:
+            synced.append((record['id'], record['text_hash'], hash_value(record['payload'])))
+            if not sample:
+                sample.append(record)
+            yield record
+
+    progress_log = UploadProgressLog(os.path.join(CACHE_DIR, f'upload_progress_{collection_name}.log'))
+    stats = upload_stream(
+        qdrant,
+        collection_name,
+        track(itertools.chain(*sources, pipeline.records())),
+        batch_size=UPLOAD_BATCH_SIZE,
+        parallel=UPLOAD_PARALLEL,
+        progress_log=progress_log,
+        # 前回の途中までに古い内容でアップロードしたものは、アップロード済みでも送り直す
+        redo_ids=stale_ids,
+    )
+    print(pipeline.describe_stats())
+    print(f"{alias}: {embedder.describe_stats()}")
+    stats['synced'] = synced
+    stats['sample'] = sample[0] if sample else None
+    return stats
+
+def create_collection(collection_name, alias, settings=None):
+    """Qdrantにコレクションを作成する（aliasはbooths/itemsのどちらの設定を使うか）。
+    量子化とHNSWの設定はsettings（省略時は環境変数, index_config.py参照）に従う"""
+    settings = settings or load_index_settings()
     
-    # アイテムコレクションの作成
     # 古いrecreate_collectionの代わりに新しいAPIを使用
-    if qdrant.collection_exists(collection_name="items"):
-        qdrant.delete_collection(collection_name="items")
+    if qdrant.collection_exists(collection_name=collection_name):
+        qdrant.delete_collection(collection_name=collection_name)
     
     qdrant.create_collection(
-        collection_name="items",
+        collection_name=collection_name,
         vectors_config=models.VectorParams(
-            size=EMBEDDING_DIMENSION,  # voyage-3-largeのベクトルサイズ(2048)
-            distance=models.Distance.COSINE
+            size=EMBEDDING_DIMENSION,  # voyage-3-largeのベクトルサイズ（デフォルト2048）
+            distance=models.Distance.COSINE,
+            on_disk=settings['on_disk_vectors']
         ),
-        on_disk_payload=True
+        on_disk_payload=True,
+        **build_collection_options(settings)
     )
+    print(f"コレクション'{collection_name}'を作成しました（{describe_settings(settings)}）")
     
-    # ペイロードインデックスの作成（テキスト検索用）
-    # ブースコレクション
-    try:
-        qdrant.create_payload_index(
-            collection_name="booths",
-            field_name="payload.name",
-            field_schema=models.PayloadSchemaType.KEYWORD
-        )
-        qdrant.create_payload_index(
-            collection_name="booths",
-            field_name="payload.twitter",
-            field_schema=models.PayloadSchemaType.KEYWORD
-        )
-        qdrant.create_payload_index(
-            collection_name="booths",
-            field_name="payload.instagram",
-            field_schema=models.PayloadSchemaType.KEYWORD
-        )
-        
-        # アイテムコレクション
-        qdrant.create_payload_index(
-            collection_name="items",
-            field_name="payload.name",
-            field_schema=models.PayloadSchemaType.KEYWORD
-        )
-        qdrant.create_payload_index(
-            collection_name="items",
-            field_name="payload.author",
-            field_schema=models.PayloadSchemaType.KEYWORD
-        )
-    except Exception as e:
-        print(f"インデックス作成中にエラーが発生しましたが、処理を続行します: {e}")
+    # ペイロードインデックスの作成（定義はpayload_indexes.py。アップロード前に作るとHNSWがフィルターに対応する）
+    ensure_payload_indexes(qdrant, collection_name, alias=alias)
+
+def create_collections(targets):
+    """新しいバージョンのコレクションを作成する。
+    エイリアスが指している稼働中のコレクションには触れないので、作成中も検索は止まらない"""
+    for alias, collection_name in targets.items():
+        create_collection(collection_name, alias)
 
 def upload_vectors():
     """ベクトルデータをQdrantにアップロードする"""
-    # ブースデータの取得
-    booths = fetch_booths()
-    print(f"{len(booths)}件のブースデータを取得しました")
-    
-    # アイテムデータの取得
-    items = fetch_items()
-    print(f"{len(items)}件のアイテムデータを取得しました")
-    
-    # ブースベクトルの作成
-    booth_vectors = prepare_booth_vectors(booths)
-    print(f"{len(booth_vectors)}件のブースベクトルを作成しました")
-    
-    # アイテムベクトルの作成
-    item_vectors = prepare_item_vectors(items)
-    print(f"{len(item_vectors)}件のアイテムベクトルを作成しました")
-    
-    # コレクションの作成
-    create_collections()
-    print("コレクションを作成しました")
+    ensure_cache_dir()
     
     # アップロード状態を記録するファイル
     upload_state_file = os.path.join(CACHE_DIR, 'upload_state.json')
@@ -654,128 +394,63 @@ def upload_vectors():
         except Exception as e:
             print(f"アップロード状態の読み込みエラー: {e}")
     
-    # ブースベクトルのアップロード（まだ完了していなければ）
-    if not upload_state.get('booths_uploaded', False):
-        try:
-            print("ブースベクトルをアップロード中...")
-            
-            # アップロード済みのIDをロード
-            uploaded_booth_ids = set(upload_state.get('uploaded_booth_ids', []))
-            
-            # アップロードするベクトルをフィルタリング
-            remaining_booth_vectors = [b for b in booth_vectors if b["id"] not in uploaded_booth_ids]
-            
-            # バッチサイズを小さく設定（大きなデータセットでもタイムアウトしないように）
-            batch_size = 200
-            
-            for i in range(0, len(remaining_booth_vectors), batch_size):
-                batch_vectors = remaining_booth_vectors[i:i+batch_size]
-                print(f"ブースバッチアップロード: {i+1}～{min(i+batch_size, len(remaining_booth_vectors))}/{len(remaining_booth_vectors)}")
-                
-                try:
-                    # 小さなバッチでアップロード
-                    qdrant.upload_points(
-                        collection_name="booths",
-                        points=[
-                            models.PointStruct(
-                                id=b["id"],
-                                vector=b["vector"],
-                                payload=b["payload"]
-                            ) for b in batch_vectors
-                        ]
-                    )
-                    
-                    # アップロード成功したIDを記録
-                    for b in batch_vectors:
-                        uploaded_booth_ids.add(b["id"])
-                    
-                    # 途中経過を保存
-                    upload_state['uploaded_booth_ids'] = list(uploaded_booth_ids)
-                    with open(upload_state_file, 'w') as f:
-                        json.dump(upload_state, f)
-                    
-                    print(f"ブースバッチ {i+1}～{min(i+batch_size, len(remaining_booth_vectors))} アップロード完了")
-                except Exception as e:
-                    print(f"ブースバッチ {i+1}～{min(i+batch_size, len(remaining_booth_vectors))} アップロードエラー: {e}")
-                    # エラーが発生しても続行する（次のバッチを試す）
-                    continue
-            
-            # すべてのブースがアップロードされたかチェック
-            if len(uploaded_booth_ids) == len(booth_vectors):
-                upload_state['booths_uploaded'] = True
-                with open(upload_state_file, 'w') as f:
-                    json.dump(upload_state, f)
-                print("すべてのブースベクトルをアップロードしました")
-            else:
-                print(f"{len(uploaded_booth_ids)}/{len(booth_vectors)}のブースベクトルをアップロードしました")
-        except Exception as e:
-            print(f"ブースベクトルのアップロードエラー: {e}")
-            raise
+    # 前回の途中のバージョンが残っていればそこに再開し、なければ新しいバージョンを作成
+    targets = upload_state.get('target_collections')
+    if targets and all(qdrant.collection_exists(collection_name=name) for name in targets.values()):
+        print(f"作成途中のコレクションに再開します: {targets}")
     else:
-        print("ブースベクトルは既にアップロード済みです")
+        targets = {alias: next_version_name(qdrant, alias) for alias in ALIAS_NAMES}
+        create_collections(targets)
+        upload_state = {'target_collections': targets}
+        with open(upload_state_file, 'w') as f:
+            json.dump(upload_state, f)
+        print(f"新しいバージョンのコレクションを作成しました: {targets}")
     
-    # アイテムベクトルのアップロード（まだ完了していなければ）
-    if not upload_state.get('items_uploaded', False):
-        try:
-            print("アイテムベクトルをアップロード中...")
-            
-            # アップロード済みのIDをロード
-            uploaded_item_ids = set(upload_state.get('uploaded_item_ids', []))
-            
-            # アップロードするベクトルをフィルタリング
-            remaining_item_vectors = [i for i in item_vectors if i["id"] not in uploaded_item_ids]
-            
-            # バッチサイズを小さく設定（大きなデータセットでもタイムアウトしないように）
-            batch_size = 200
-            
-            for i in range(0, len(remaining_item_vectors), batch_size):
-                batch_vectors = remaining_item_vectors[i:i+batch_size]
-                print(f"アイテムバッチアップロード: {i+1}～{min(i+batch_size, len(remaining_item_vectors))}/{len(remaining_item_vectors)}")
-                
-                try:
-                    # 小さなバッチでアップロード
-                    qdrant.upload_points(
-                        collection_name="items",
-                        points=[
-                            models.PointStruct(
-                                id=item["id"],
-                                vector=item["vector"],
-                                payload=item["payload"]
-                            ) for item in batch_vectors
-                        ]
-                    )
-                    
-                    # アップロード成功したIDを記録
-                    for item in batch_vectors:
-                        uploaded_item_ids.add(item["id"])
-                    
-                    # 途中経過を保存
-                    upload_state['uploaded_item_ids'] = list(uploaded_item_ids)
-                    with open(upload_state_file, 'w') as f:
-                        json.dump(upload_state, f)
-                    
-                    print(f"アイテムバッチ {i+1}～{min(i+batch_size, len(remaining_item_vectors))} アップロード完了")
-                except Exception as e:
-                    print(f"アイテムバッチ {i+1}～{min(i+batch_size, len(remaining_item_vectors))} アップロードエラー: {e}")
-                    # エラーが発生しても続行する（次のバッチを試す）
-                    continue
-            
-            # すべてのアイテムがアップロードされたかチェック
-            if len(uploaded_item_ids) == len(item_vectors):
-                upload_state['items_uploaded'] = True
-                with open(upload_state_file, 'w') as f:
-                    json.dump(upload_state, f)
-                print("すべてのアイテムベクトルをアップロードしました")
-            else:
-                print(f"{len(uploaded_item_ids)}/{len(item_vectors)}のアイテムベクトルをアップロードしました")
-        except Exception as e:
-            print(f"アイテムベクトルのアップロードエラー: {e}")
-            raise
-    else:
-        print("アイテムベクトルは既にアップロード済みです")
+    # SQLiteから読みながらベクトル化し、そのまま並列アップロード（アップロード済みIDは追記ログで管理）
+    results = {}
+    for alias in ALIAS_NAMES:
+        stats = stream_collection(alias, targets[alias])
+        if stats['failed']:
+            print(f"{targets[alias]}: {stats['failed']}件のアップロードに失敗しました。再実行すると続きから再開します")
+            return
+        results[alias] = stats
+    
+    print(f"埋め込みモデル: {EMBEDDING_MODEL}, 次元数: {EMBEDDING_DIMENSION}で処理完了（ピークRSS {peak_rss_mb():.0f}MB）")
+    
+    # ポイント数とサンプルクエリで検証してから、エイリアスをアトミックに切り替える
+    for alias in ALIAS_NAMES:
+        sample = results[alias]['sample']
+        expected_count = len({point_id for point_id, _, _ in results[alias]['synced']})
+        if not verify_collection(qdrant, targets[alias], expected_count,
+                                 sample_id=sample["id"] if sample else None,
+                                 sample_vector=sample["vector"] if sample else None):
+            print("検証に失敗したため、エイリアスは切り替えません（稼働中のコレクションはそのままです）")
+            return
     
-    print(f"埋め込みモデル: {EMBEDDING_MODEL}, 次元数: {EMBEDDING_DIMENSION}で処理完了")
+    switch_aliases(qdrant, targets)
+    for alias in ALIAS_NAMES:
+        garbage_collect(qdrant, alias)
     
+    # 次回の再構築は新しいバージョンから始める
+    os.remove(upload_state_file)
+    for collection_name in targets.values():
+        progress_file = os.path.join(CACHE_DIR, f'upload_progress_{collection_name}.log')
+        if os.path.exists(progress_file):
+            os.remove(progress_file)
+    
+    # 差分同期(sync_vectors.py)の基準として、実際にアップロードしたレコードのハッシュを同期済みとして記録する
+    # （アップロード中にSQLiteが変わっていても、その行は次の差分同期で反映される）
+    from change_tracking import refresh_all, record_synced
+    conn = get_database_connection()
+    try:
+        refresh_all(conn)
+        for alias in ALIAS_NAMES:
+            conn.execute("DELETE FROM vector_sync_state WHERE collection = ?", (alias,))
+            record_synced(conn, alias, results[alias]['synced'])
+            print(f"{alias}: {len(results[alias]['synced'])}件を同期済みとして記録しました")
+    finally:
+        conn.close()
+
     # 処理が完全に終わったらキャッシュを削除するかどうか（オプション）
     # cleanup_cache = input("キャッシュファイルを削除しますか？ (y/n): ").lower().strip() == 'y'
     # if cleanup_cache:
@@ -793,5 +468,12 @@ def cleanup_cache():
         shutil.rmtree(CACHE_DIR)
         print("キャッシュを削除しました")
 
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='SQLiteのブース・アイテムをベクトル化し、新しいバージョンのコレクションにアップロードしてエイリアスを切り替えます。')
+    parser.parse_args()
+    upload_vectors()
+
 if __name__ == "__main__":
-    upload_vectors() 
\ No newline at end of file
+    main() 
\ No newline at end of file
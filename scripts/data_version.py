@@ -0,0 +1,42 @@
+import time
+from clients import models
+
+# 検索データのバージョン（検索結果キャッシュの無効化に使う）。
+# アップロード・同期・ロールバックでQdrantの内容が変わるたびに1つ増やす。
+# PythonのツールとAPI（bunfree-api）の両方から読めるように、Qdrantのメタ情報用コレクションに保存する。
+
+META_COLLECTION = "bunfree_meta"
+META_POINT_ID = 1
+
+def ensure_meta_collection(qdrant):
+    """メタ情報用のコレクションがなければ作成する（ベクトルは使わないので1次元）"""
+    if not qdrant.collection_exists(collection_name=META_COLLECTION):
+        qdrant.create_collection(
+            collection_name=META_COLLECTION,
+            vectors_config=models.VectorParams(size=1, distance=models.Distance.DOT)
+        )
+
+def get_data_version(qdrant):
+    """現在のデータバージョンを返す（まだ記録がなければ0）"""
+    if not qdrant.collection_exists(collection_name=META_COLLECTION):
+        return 0
+    points = qdrant.retrieve(collection_name=META_COLLECTION, ids=[META_POINT_ID], with_payload=True)
+    if not points:
+        return 0
+    return points[0].payload.get('data_version', 0)
+
+def bump_data_version(qdrant, reason=""):
+    """データバージョンを1つ増やして新しいバージョンを返す"""
+    ensure_meta_collection(qdrant)
+    version = get_data_version(qdrant) + 1
+    qdrant.upsert(
+        collection_name=META_COLLECTION,
+        points=[models.PointStruct(
+            id=META_POINT_ID,
+            vector=[1.0],
+            payload={'data_version': version, 'reason': reason, 'updated_at': time.time()}
+        )],
+        wait=True
+    )
+    print(f"データバージョンを{version}に更新しました（{reason}）")
+    return version
@@ -0,0 +1,45 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+class ReadOnlyConnectionPool:
+    """SQLiteの読み取り専用接続を使い回すプール（検索結果の補完など、読み込みだけの処理用）"""
+
+    def __init__(self, db_path='bunfree.db', size=4):
+        self.db_path = db_path
+        self.size = size
+        self.idle = queue.Queue()
+        self.lock = threading.Lock()
+        self.opened = 0  # これまでに開いた接続の数（計測用）
+
+    def open_connection(self):
+        """読み取り専用で接続を開く（誤って書き込むとエラーになる）"""
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        with self.lock:
+            self.opened += 1
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """プールから接続を借りる（使い終わったら返す）"""
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            conn = self.open_connection()
+        try:
+            yield conn
+        finally:
+            if self.idle.qsize() < self.size:
+                self.idle.put(conn)
+            else:
+                conn.close()
+
+    def close(self):
+        """プールにある接続をすべて閉じる"""
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
@@ -0,0 +1,231 @@
+import os
+import array
+import hashlib
+import argparse
+import threading
+
+from lru_cache import LRUCache
+
+# ベクトル化の前に同じテキストをまとめ、ユニークなテキストだけをAPIに送る。
+#   exact: テキストのハッシュが同じものは1回だけベクトル化し、同じベクトルを使い回す
+#   near:  さらに、ベクトル化用のテキスト（build_booth_text / build_item_text で作ったもの）の
+#          文字3-gramのJaccard類似度をMinHashで推定し、NEAR_DUPLICATE_THRESHOLD以上のもの
+#          （説明文が同じで巻数だけが違うシリーズ・再版など）も同じベクトルにする。
+#          違うものをまとめてしまう可能性もあるので、既定では使わない（EMBED_DEDUPE=near）
+#   使い回すベクトルはfloat32で件数上限つきのLRUに置く（ストリーミング中のメモリを一定に保つため）。
+
+DEDUPE_MODE = os.getenv("EMBED_DEDUPE", "exact")  # off / exact / near
+DEDUPE_CACHE_SIZE = int(os.getenv("EMBED_DEDUPE_CACHE_SIZE", "5000"))
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.9"))
+
+# MinHashの設定（16バンド × 4行。Jaccard 0.9なら候補になる確率は99%以上）
+MINHASH_PERMUTATIONS = 64
+MINHASH_BANDS = 16
+SHINGLE_SIZE = 3
+_MERSENNE_PRIME = (1 << 61) - 1
+
+def text_key(text):
+    """テキストの完全一致用のキー"""
+    return hashlib.sha1(text.encode('utf-8')).digest()
+
+def estimate_tokens(text):
+    """トークン数の概算（ASCIIは4文字で1トークン、日本語などは1文字で1トークンとみなす）"""
+    ascii_chars = sum(1 for c in text if c.isascii())
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+class MinHasher:
+    """文字のshingleに対するMinHashの署名を作る"""
+
+    def __init__(self, permutations=MINHASH_PERMUTATIONS, seed=1):
+        import numpy as np
+        self.np = np
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, _MERSENNE_PRIME, size=permutations, dtype=np.uint64)
+        self.b = rng.integers(0, _MERSENNE_PRIME, size=permutations, dtype=np.uint64)
+
+    def signature(self, text):
+        np = self.np
+        shingles = {text[i:i + SHINGLE_SIZE] for i in range(max(len(text) - SHINGLE_SIZE + 1, 1))}
+        hashes = np.array(
+            [int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest(), 'little') >> 3
+             for s in shingles],
+            dtype=np.uint64,
+        )
+        # (a * h + b) mod p をすべての置換についてまとめて計算する（オーバーフローはmod 2^64で折り返す）
+        values = (self.a[:, None] * hashes[None, :] + self.b[:, None]) % np.uint64(_MERSENNE_PRIME)
+        return values.min(axis=1)
+
+    def band_keys(self, signature, bands=MINHASH_BANDS):
+        """LSHのバケットのキー（バンドごと）"""
+        rows = len(signature) // bands
+        return [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(bands)]
+
+class DedupingEmbedder:
+    """embed(texts) をラップし、同じ（似た）テキストは1回だけベクトル化してベクトルを使い回す"""
+
+    def __init__(self, embed, mode=DEDUPE_MODE, cache_size=DEDUPE_CACHE_SIZE,
+                 threshold=NEAR_DUPLICATE_THRESHOLD):
+        if mode not in ('off', 'exact', 'near'):
+            raise ValueError(f"未対応の重複除去の方法です: {mode}")
+        self.inner = embed
+        self.mode = mode
+        self.threshold = threshold
+        self.vectors = LRUCache(cache_size)  # キー -> float32のベクトル
+        self.buckets = {}                    # LSHのバケット -> 代表のキー
+        self.signatures = {}                 # 代表のキー -> MinHashの署名
+        self.hasher = MinHasher() if mode == 'near' else None
+        self.lock = threading.Lock()
+        self.stats = {'texts': 0, 'embedded': 0, 'exact': 0, 'near': 0,
+                      'calls': 0, 'calls_without_dedupe': 0, 'tokens': 0, 'tokens_saved': 0}
+
+    def embed_unique(self, texts):
+        """APIでベクトル化する（呼び出し回数を数える）"""
+        with self.lock:
+            self.stats['calls'] += 1
+        return self.inner(texts)
+
+    def find_near(self, text, batch_near):
+        """MinHashで似ている代表のキーを探す。
+        代表は登録済みのもの（ベクトルがLRUにあるもの）か、同じバッチでこれからベクトル化するもの。
+        (代表のキー, 登録用の署名とバケット) を返す（見つからなければキーはNone）"""
+        batch_buckets, batch_signatures = batch_near
+        signature = self.hasher.signature(text)
+        bands = self.hasher.band_keys(signature)
+        for band in bands:
+            for buckets, signatures in ((batch_buckets, batch_signatures), (self.buckets, self.signatures)):
+                candidate = buckets.get(band)
+                if candidate is None or (buckets is self.buckets and candidate not in self.vectors):
+                    continue
+                similarity = float((signatures[candidate] == signature).mean())
+                if similarity >= self.threshold:
+                    return candidate, (signature, bands)
+        return None, (signature, bands)
+
+    def remember(self, key, vector, near_info):
+        """ベクトル化した代表を登録する"""
+        self.vectors.put(key, array.array('f', vector))
+        if near_info is None:
+            return
+        signature, bands = near_info
+        self.signatures[key] = signature
+        for band in bands:
+            self.buckets[band] = key
+        # LRUから消えた代表の情報は、増えすぎたときにまとめて捨てる
+        if len(self.signatures) > 2 * self.vectors.maxsize:
+            self.prune()
+
+    def prune(self):
+        """LRUから消えた代表の署名・バケットを削除する"""
+        alive = set(self.vectors.data)
+        self.signatures = {k: v for k, v in self.signatures.items() if k in alive}
+        self.buckets = {k: v for k, v in self.buckets.items() if v in alive}
+
+    def __call__(self, texts):
+        tokens = [estimate_tokens(text) for text in texts]
+        with self.lock:
+            self.stats['texts'] += len(texts)
+            self.stats['calls_without_dedupe'] += 1
+            self.stats['tokens'] += sum(tokens)
+        if self.mode == 'off':
+            vectors = self.embed_unique(texts)
+            with self.lock:
+                self.stats['embedded'] += len(texts)
+            return vectors
+
+        results = [None] * len(texts)
+        pending = {}  # キー -> (このバッチでの位置のリスト, near用の情報)
+        batch_near = ({}, {})  # このバッチでベクトル化する代表のバケットと署名
+        with self.lock:
+            for position, text in enumerate(texts):
+                key = text_key(text)
+                if key in pending:
+                    pending[key][0].append(position)
+                    self.stats['exact'] += 1
+                    self.stats['tokens_saved'] += tokens[position]
+                    continue
+                cached = self.vectors.get(key)
+                if cached is not None:
+                    results[position] = cached.tolist()
+                    self.stats['exact'] += 1
+                    self.stats['tokens_saved'] += tokens[position]
+                    continue
+                near_info = None
+                if self.mode == 'near':
+                    representative, near_info = self.find_near(text, batch_near)
+                    if representative is not None:
+                        if representative in pending:
+                            pending[representative][0].append(position)
+                        else:
+                            results[position] = self.vectors.get(representative).tolist()
+                        self.stats['near'] += 1
+                        self.stats['tokens_saved'] += tokens[position]
+                        continue
+                    signature, bands = near_info
+                    batch_near[1][key] = signature
+                    for band in bands:
+                        batch_near[0].setdefault(band, key)
+                pending[key] = ([position], near_info)
+
+        if pending:
+            unique_positions = [positions[0] for positions, _ in pending.values()]
+            vectors = self.embed_unique([texts[position] for position in unique_positions])
+            with self.lock:
+                self.stats['embedded'] += len(unique_positions)
+                for (key, (positions, near_info)), vector in zip(pending.items(), vectors):
+                    if vector is None:
+                        continue
+                    for position in positions:
+                        results[position] = list(vector)
+                    self.remember(key, vector, near_info)
+        return results
+
+    def describe_stats(self):
+        """削減できたAPI呼び出し・トークン数を文字列で返す"""
+        stats = self.stats
+        saved_texts = stats['exact'] + stats['near']
+        saved_calls = stats['calls_without_dedupe'] - stats['calls']
+        ratio = stats['tokens_saved'] / stats['tokens'] * 100 if stats['tokens'] else 0.0
+        return (f"重複除去({self.mode}): {stats['texts']}件中{stats['embedded']}件をベクトル化 "
+                f"（完全一致{stats['exact']}件・類似{stats['near']}件を再利用し{saved_texts}件削減）、"
+                f"API呼び出し{stats['calls']}回（{saved_calls}回削減）、"
+                f"推定トークン{stats['tokens'] - stats['tokens_saved']}（{stats['tokens_saved']}・{ratio:.1f}%削減）")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='APIを呼ばずに、SQLiteのブース・アイテムのテキストでどれだけベクトル化を減らせるかを確認します。')
+    parser.add_argument('--collection', choices=['booths', 'items', 'all'], default='all', help='対象のコレクション')
+    parser.add_argument('--mode', choices=['exact', 'near'], default='near', help='重複除去の方法')
+    parser.add_argument('--threshold', type=float, default=NEAR_DUPLICATE_THRESHOLD, help='類似とみなすJaccard類似度')
+    parser.add_argument('--show', type=int, default=0, metavar='N', help='類似としてまとめたテキストの例をN件表示する')
+    args = parser.parse_args()
+
+    from create_vector_db import ENTRY_STREAMS, EMBED_BATCH_SIZE
+    from embedding_pipeline import iter_batches
+
+    collections = ('booths', 'items') if args.collection == 'all' else (args.collection,)
+    for collection in collections:
+        examples = []
+        placeholder = {}
+
+        def fake_embed(texts):
+            # ベクトルの代わりに代表のテキストの番号を返し、どのテキストとまとめられたかを表示できるようにする
+            vectors = []
+            for text in texts:
+                placeholder[len(placeholder)] = text
+                vectors.append([float(len(placeholder) - 1)])
+            return vectors
+
+        embedder = DedupingEmbedder(fake_embed, mode=args.mode, threshold=args.threshold)
+        for batch in iter_batches(ENTRY_STREAMS[collection](), EMBED_BATCH_SIZE):
+            texts = [entry['text'] for entry in batch]
+            vectors = embedder(texts)
+            for text, vector in zip(texts, vectors):
+                representative = placeholder[int(vector[0])]
+                if len(examples) < args.show and representative != text:
+                    examples.append((representative, text))
+        print(f"{collection}: {embedder.describe_stats()}")
+        for representative, text in examples[:args.show]:
+            print(f"  代表: {representative.splitlines()[0]}\n  類似: {text.splitlines()[0]}")
+
+if __name__ == "__main__":
+    main()
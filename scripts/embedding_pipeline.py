@@ -0,0 +1,216 @@
+import sys
+import time
+import queue
+import random
+import argparse
+import resource
+import threading
+
+# SQLite → テキスト作成 → ベクトル化 → アップロード をつなぐストリーミングのパイプライン。
+#   読み込み（1スレッド）とベクトル化（embed_workersスレッド）の間、ベクトル化とアップロードの間に
+#   上限つきのキューを置き、各段が先に進みすぎないようにする。メモリに載るのはキューと処理中のバッチだけなので、
+#   ピークのメモリ使用量はデータの件数によらずほぼ一定になり、最初のバッチからすぐにアップロードが始まる。
+#     メモリに載るベクトル ≒ (queue_size + embed_workers) × バッチサイズ + アップロード中のバッチ
+#   アップロードはrecords()を回す側（parallel_uploader.upload_stream）が行う。
+
+DEFAULT_QUEUE_SIZE = 2
+DEFAULT_EMBED_WORKERS = 2
+
+# キューの終わりの目印
+_DONE = object()
+
+def peak_rss_mb():
+    """このプロセスのピークRSS(MB)"""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linuxはキロバイト、macOSはバイトで返る
+    if sys.platform == 'darwin':
+        return usage / 1024 / 1024
+    return usage / 1024
+
+def iter_batches(entries, batch_size, skip_ids=None):
+    """{'id', 'text', 'payload', ...} のエントリをバッチにまとめる（skip_idsのIDは飛ばす）"""
+    batch = []
+    for entry in entries:
+        if skip_ids and entry['id'] in skip_ids:
+            continue
+        batch.append(entry)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+class EmbeddingPipeline:
+    """バッチの読み込みとベクトル化を別スレッドで進め、できたレコードを順に渡すパイプライン"""
+
+    def __init__(self, batches, embed, on_embedded=None, queue_size=DEFAULT_QUEUE_SIZE,
+                 embed_workers=DEFAULT_EMBED_WORKERS, label='pipeline'):
+        # batches: エントリのバッチを返すイテラブル（読み込みスレッドで回すので、SQLiteの接続もその中で開く）
+        # embed: テキストのリストからベクトルのリストを返す関数（失敗したテキストの位置はNone）
+        # on_embedded: ベクトル化したレコードのリストを受け取る関数（ファイルへの追記保存など）
+        self.batches = batches
+        self.embed = embed
+        self.on_embedded = on_embedded
+        self.embed_workers = embed_workers
+        self.label = label
+        self.text_queue = queue.Queue(maxsize=queue_size)
+        self.record_queue = queue.Queue(maxsize=queue_size)
+        self.stop = threading.Event()
+        self.error = None
+        self.lock = threading.Lock()
+        self.stats = {'read': 0, 'embedded': 0, 'failed': 0, 'batches': 0,
+                      'first_record_seconds': None, 'seconds': 0.0, 'peak_rss_mb': None}
+
+    def put(self, target_queue, item):
+        """キューに入れる（空きを待つ間も中止を確認する）"""
+        while not self.stop.is_set():
+            try:
+                target_queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, source_queue):
+        """キューから取り出す（待つ間も中止を確認する）"""
+        while not self.stop.is_set():
+            try:
+                return source_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def fail(self, error):
+        """最初のエラーを記録してパイプライン全体を止める"""
+        with self.lock:
+            if self.error is None:
+                self.error = error
+        self.stop.set()
+
+    def read_stage(self):
+        """バッチを読み込んでテキストのキューに入れる"""
+        try:
+            for batch in self.batches:
+                with self.lock:
+                    self.stats['read'] += len(batch)
+                if not self.put(self.text_queue, batch):
+                    return
+        except Exception as e:
+            self.fail(e)
+        finally:
+            for _ in range(self.embed_workers):
+                self.put(self.text_queue, _DONE)
+
+    def embed_stage(self):
+        """テキストのバッチをベクトル化してレコードのキューに入れる"""
+        try:
+            while True:
+                batch = self.get(self.text_queue)
+                if batch is _DONE:
+                    return
+                vectors = self.embed([entry['text'] for entry in batch])
+                # テキスト以外の項目（id・payload・text_hashなど）はそのままレコードに入れる
+                records = [
+                    {**{key: value for key, value in entry.items() if key != 'text'}, 'vector': vector}
+                    for entry, vector in zip(batch, vectors)
+                    if vector is not None
+                ]
+                if self.on_embedded:
+                    self.on_embedded(records)
+                with self.lock:
+                    self.stats['embedded'] += len(records)
+                    self.stats['failed'] += len(batch) - len(records)
+                    self.stats['batches'] += 1
+                if not self.put(self.record_queue, records):
+                    return
+        except Exception as e:
+            self.fail(e)
+        finally:
+            self.put(self.record_queue, _DONE)
+
+    def records(self):
+        """ベクトル化したレコードを1件ずつ返す（最初に呼ばれたときにスレッドを起動する）"""
+        start = time.perf_counter()
+        threads = [threading.Thread(target=self.read_stage, daemon=True)]
+        threads += [threading.Thread(target=self.embed_stage, daemon=True) for _ in range(self.embed_workers)]
+        for thread in threads:
+            thread.start()
+
+        finished_workers = 0
+        try:
+            while finished_workers < self.embed_workers:
+                records = self.get(self.record_queue)
+                if records is _DONE:
+                    if self.stop.is_set():
+                        break
+                    finished_workers += 1
+                    continue
+                if records and self.stats['first_record_seconds'] is None:
+                    self.stats['first_record_seconds'] = time.perf_counter() - start
+                yield from records
+        finally:
+            # 途中でやめた場合（アップロード側のエラーなど）も各スレッドを止める
+            self.stop.set()
+            for thread in threads:
+                thread.join()
+            self.stats['seconds'] = time.perf_counter() - start
+            self.stats['peak_rss_mb'] = peak_rss_mb()
+        if self.error is not None:
+            raise self.error
+
+    def describe_stats(self):
+        """処理件数・最初のレコードまでの時間・ピークメモリを文字列で返す"""
+        stats = self.stats
+        first = stats['first_record_seconds']
+        first_text = f"{first:.1f}秒" if first is not None else "-"
+        return (f"{self.label}: 読み込み{stats['read']}件 / ベクトル化{stats['embedded']}件 / 失敗{stats['failed']}件 "
+                f"/ {stats['seconds']:.1f}秒（最初のレコードまで{first_text}、ピークRSS {stats['peak_rss_mb']:.0f}MB）")
+
+def synthetic_entries(count, text_length=200):
+    """動作確認用のダミーのエントリを生成する"""
+    for entry_id in range(1, count + 1):
+        yield {'id': entry_id, 'text': 'あ' * text_length, 'payload': {'name': f"test-{entry_id}"}}
+
+def synthetic_embed(dimension, delay):
+    """ダミーのベクトル化関数（APIの待ち時間をdelay秒で模擬する）"""
+    def embed(texts):
+        time.sleep(delay)
+        return [[random.random() for _ in range(dimension)] for _ in texts]
+    return embed
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='ダミーのデータでストリーミングのパイプラインを動かし、件数を変えてもピークメモリが一定かを確認します。')
+    parser.add_argument('--self-test', type=int, nargs='+', default=[2000, 20000], metavar='N',
+                        help='流す件数（複数指定すると件数ごとに別プロセスで計測する）')
+    parser.add_argument('--dimension', type=int, default=2048, help='ベクトルの次元数')
+    parser.add_argument('--batch-size', type=int, default=400, help='ベクトル化のバッチサイズ')
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE, help='各段の間のキューの長さ（バッチ数）')
+    parser.add_argument('--embed-workers', type=int, default=DEFAULT_EMBED_WORKERS, help='ベクトル化の並列数')
+    parser.add_argument('--delay', type=float, default=0.05, help='ベクトル化1回あたりの模擬的な待ち時間（秒）')
+    args = parser.parse_args()
+
+    if len(args.self_test) > 1:
+        # ピークRSSはプロセス単位なので、件数ごとに別プロセスで計測する
+        import subprocess
+        for count in args.self_test:
+            subprocess.run([sys.executable, __file__, '--self-test', str(count),
+                            '--dimension', str(args.dimension), '--batch-size', str(args.batch_size),
+                            '--queue-size', str(args.queue_size), '--embed-workers', str(args.embed_workers),
+                            '--delay', str(args.delay)], check=True)
+        return
+
+    count = args.self_test[0]
+    pipeline = EmbeddingPipeline(
+        iter_batches(synthetic_entries(count), args.batch_size),
+        synthetic_embed(args.dimension, args.delay),
+        queue_size=args.queue_size,
+        embed_workers=args.embed_workers,
+        label=f"{count}件",
+    )
+    for _ in pipeline.records():
+        pass
+    print(pipeline.describe_stats())
+
+if __name__ == "__main__":
+    main()
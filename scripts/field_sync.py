@@ -0,0 +1,185 @@
+import argparse
+from clients import models
+
+from create_vector_db import qdrant, get_database_connection, BOOTH_TEXT_FIELDS, ITEM_TEXT_FIELDS
+from payload_projection import BOOTH_PAYLOAD_FIELDS, ITEM_PAYLOAD_FIELDS, BOOTH_ITEM_FIELDS, ITEM_BOOTH_FIELDS
+from data_version import bump_data_version
+
+# SQLiteのカラムの値をQdrantのペイロードに同期する（ベクトルは送らない）。
+# 対象はトップレベルにだけ入っているフィールド（website_urlなど）で、ほかの場所に写しているものはsync_vectors.pyで同期する。
+# Qdrantの現在値はscrollでまとめて取得し、差分だけをbatch_update_pointsでまとめて送る。
+
+# コレクションごとのSQLiteのテーブルとペイロードに入れているフィールド
+COLLECTION_TABLES = {
+    'booths': 'booths',
+    'items': 'items',
+}
+PROJECTED_FIELDS = {
+    'booths': BOOTH_PAYLOAD_FIELDS,
+    'items': ITEM_PAYLOAD_FIELDS,
+}
+
+# トップレベルのフィールド以外にも値が入っている場所（ここにあるフィールドはsync_vectors.pyで同期する）
+#   ブースの値はアイテムのペイロード（booth_name・booth_area・booth_area_number・booth_details）に、
+#   アイテムの値はブースのペイロード（items）に写している。ベクトル化用テキストに入る値はベクトルも作り直す
+COPIED_FIELDS = {'booths': {}, 'items': {}}
+for collection, field, place in (
+    [('booths', field, 'ブースのベクトル') for field in BOOTH_TEXT_FIELDS]
+    + [('booths', 'name', 'アイテムのベクトル')]
+    + [('booths', field, f"items.booth_{field}") for field in ('name', 'area', 'area_number')]
+    + [('booths', field, f"items.booth_details.{field}") for field in ITEM_BOOTH_FIELDS]
+    + [('items', field, 'アイテムのベクトル') for field in ITEM_TEXT_FIELDS]
+    + [('items', 'name', 'ブースのベクトル')]
+    + [('items', field, f"booths.items[].{field}") for field in BOOTH_ITEM_FIELDS]
+):
+    COPIED_FIELDS[collection].setdefault(field, []).append(place)
+
+# scrollで一度に取得するポイント数と、batch_update_pointsで一度に送る操作数
+SCROLL_PAGE_SIZE = 1000
+UPDATE_BATCH_SIZE = 500
+
+def get_table_columns(conn, table):
+    """テーブルのカラム名を取得する"""
+    cursor = conn.cursor()
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [row[1] for row in cursor.fetchall()]
+
+def validate_fields(conn, collection, fields):
+    """同期するフィールドがテーブルのカラムとして存在するか確認する"""
+    columns = get_table_columns(conn, COLLECTION_TABLES[collection])
+    unknown = [field for field in fields if field not in columns]
+    if unknown:
+        raise ValueError(f"{COLLECTION_TABLES[collection]}テーブルに存在しないカラムです: {', '.join(unknown)}")
+    if 'id' in fields:
+        raise ValueError("idは同期できません（ポイントIDです）")
+    # ほかのポイントのペイロードやベクトルにも入っている値は、トップレベルだけ書き換えると食い違うので扱わない
+    copied = [f"{field}（{', '.join(COPIED_FIELDS[collection][field])}）"
+              for field in fields if field in COPIED_FIELDS[collection]]
+    if copied:
+        raise ValueError(f"ほかのペイロードやベクトルにも入っているフィールドは同期できません"
+                         f"（sync_vectors.pyで同期してください）: {', '.join(copied)}")
+    extra = [field for field in fields if field not in PROJECTED_FIELDS[collection]]
+    if extra:
+        print(f"注意: {', '.join(extra)}は通常のペイロードに含めていないフィールドです（payload_projection.py参照）")
+
+def fetch_sqlite_values(conn, collection, fields):
+    """SQLiteから全行の指定フィールドの値を取得する（{id: {field: value}}）"""
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT id, {', '.join(fields)} FROM {COLLECTION_TABLES[collection]}")
+    return {row[0]: dict(zip(fields, row[1:])) for row in cursor.fetchall()}
+
+def fetch_qdrant_values(client, collection, fields, page_size=SCROLL_PAGE_SIZE):
+    """Qdrantから全ポイントの指定フィールドの値をページ単位で取得する（{id: {field: value}}）"""
+    values = {}
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection,
+            limit=page_size,
+            offset=offset,
+            with_payload=models.PayloadSelectorInclude(include=list(fields)),
+            with_vectors=False
+        )
+        for point in points:
+            payload = point.payload or {}
+            # ペイロードにキーがない場合はNULLと同じとみなす
+            values[point.id] = {field: payload.get(field) for field in fields}
+        if offset is None:
+            break
+    return values
+
+def diff_values(sqlite_values, qdrant_values):
+    """SQLiteとQdrantの値を比較して、ポイントごとに変更が必要なフィールドを返す"""
+    changes = {}
+    for point_id, expected in sqlite_values.items():
+        current = qdrant_values.get(point_id)
+        if current is None:
+            continue
+        changed = {field: value for field, value in expected.items() if current.get(field) != value}
+        if changed:
+            changes[point_id] = changed
+    return changes
+
+def group_changes(changes):
+    """同じ値に更新するポイントをまとめて、1つのset_payload操作にする"""
+    groups = {}
+    for point_id, changed in changes.items():
+        key = tuple(sorted(changed.items(), key=lambda item: item[0]))
+        groups.setdefault(key, []).append(point_id)
+    return [(dict(key), point_ids) for key, point_ids in groups.items()]
+
+def push_changes(client, collection, grouped_changes, batch_size=UPDATE_BATCH_SIZE):
+    """変更をbatch_update_pointsでまとめて送る。送ったリクエスト数を返す"""
+    operations = [
+        models.SetPayloadOperation(set_payload=models.SetPayload(payload=payload, points=point_ids))
+        for payload, point_ids in grouped_changes
+    ]
+    requests = 0
+    for i in range(0, len(operations), batch_size):
+        client.batch_update_points(
+            collection_name=collection,
+            update_operations=operations[i:i+batch_size],
+            wait=True
+        )
+        requests += 1
+    return requests
+
+def sync_fields(conn, collection, fields, dry_run=False, page_size=SCROLL_PAGE_SIZE,
+                batch_size=UPDATE_BATCH_SIZE, verbose=False, client=None):
+    """指定したフィールドの値をSQLiteからQdrantに同期して、件数をまとめたdictを返す
+    （clientを省略するとcreate_vector_dbのクライアントを使う）"""
+    client = client or qdrant
+    fields = list(dict.fromkeys(fields))
+    validate_fields(conn, collection, fields)
+
+    sqlite_values = fetch_sqlite_values(conn, collection, fields)
+    qdrant_values = fetch_qdrant_values(client, collection, fields, page_size)
+    changes = diff_values(sqlite_values, qdrant_values)
+    not_found = [point_id for point_id in sqlite_values if point_id not in qdrant_values]
+
+    print(f"{collection}: SQLite {len(sqlite_values)}件 / Qdrant {len(qdrant_values)}件, "
+          f"更新が必要 {len(changes)}件, Qdrantに存在しない {len(not_found)}件")
+    if verbose:
+        for point_id, changed in sorted(changes.items()):
+            for field, value in changed.items():
+                print(f"  ID={point_id} {field}: {qdrant_values[point_id].get(field)!r} -> {value!r}")
+
+    grouped = group_changes(changes)
+    requests = 0
+    if changes and not dry_run:
+        requests = push_changes(client, collection, grouped, batch_size)
+        bump_data_version(client, f"フィールド同期: {collection} {', '.join(fields)}")
+        print(f"{collection}: {len(changes)}件を{len(grouped)}個の操作・{requests}回のリクエストで更新しました")
+
+    return {
+        'checked': len(sqlite_values),
+        'updated': 0 if dry_run else len(changes),
+        'pending': len(changes),
+        'not_found': len(not_found),
+        'requests': requests,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='SQLiteのカラムの値をQdrantのペイロードにまとめて同期します（差分のみ）。')
+    parser.add_argument('--collection', choices=list(COLLECTION_TABLES), default='booths',
+                        help='同期するコレクション')
+    parser.add_argument('--fields', nargs='+', required=True,
+                        help='同期するカラム（例: website_url）。ほかのペイロードやベクトルにも入っているカラムはsync_vectors.pyで同期する')
+    parser.add_argument('--dry-run', action='store_true', help='Qdrantを更新せずに差分だけを表示する')
+    parser.add_argument('--verbose', action='store_true', help='変更内容を1件ずつ表示する')
+    parser.add_argument('--page-size', type=int, default=SCROLL_PAGE_SIZE, help='scrollで一度に取得する件数')
+    parser.add_argument('--batch-size', type=int, default=UPDATE_BATCH_SIZE, help='1リクエストで送る操作数')
+    args = parser.parse_args()
+
+    conn = get_database_connection()
+    try:
+        sync_fields(conn, args.collection, args.fields, args.dry_run,
+                    args.page_size, args.batch_size, args.verbose)
+    except ValueError as e:
+        print(f"エラー: {e}")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
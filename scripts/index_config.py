@@ -0,0 +1,105 @@
+import os
+from clients import models
+
+# コレクション作成時のインデックス設定（環境変数で切り替える）
+#   QDRANT_QUANTIZATION: none / int8 / binary
+#   QDRANT_HNSW_M, QDRANT_HNSW_EF_CONSTRUCT: HNSWグラフの設定（未指定ならQdrantのデフォルト）
+#   QDRANT_ON_DISK_VECTORS: trueで元のfloat32ベクトルをディスクに置く（量子化ベクトルはメモリに残す）
+# 検索時の設定
+#   QDRANT_HNSW_EF: 検索時の探索幅
+#   QDRANT_RESCORE: 量子化ベクトルで候補を絞った後、元のベクトルで再スコアリングするか
+#   QDRANT_OVERSAMPLING: 再スコアリング前に多めに取る候補の倍率
+
+QUANTIZATION_TYPES = ('none', 'int8', 'binary')
+
+def env_int(name):
+    """整数の環境変数を読み込む（未設定ならNone）"""
+    value = os.getenv(name)
+    return int(value) if value else None
+
+def env_float(name):
+    """小数の環境変数を読み込む（未設定ならNone）"""
+    value = os.getenv(name)
+    return float(value) if value else None
+
+def env_bool(name, default=False):
+    """真偽値の環境変数を読み込む"""
+    value = os.getenv(name)
+    if value is None or value == '':
+        return default
+    return value.lower() in ('1', 'true', 'yes')
+
+def load_index_settings():
+    """環境変数からコレクション作成時の設定を読み込む"""
+    return {
+        'quantization': os.getenv("QDRANT_QUANTIZATION", "none"),
+        'hnsw_m': env_int("QDRANT_HNSW_M"),
+        'hnsw_ef_construct': env_int("QDRANT_HNSW_EF_CONSTRUCT"),
+        'on_disk_vectors': env_bool("QDRANT_ON_DISK_VECTORS"),
+    }
+
+def load_search_settings():
+    """環境変数から検索時の設定を読み込む"""
+    return {
+        'hnsw_ef': env_int("QDRANT_HNSW_EF"),
+        'rescore': env_bool("QDRANT_RESCORE", default=True),
+        'oversampling': env_float("QDRANT_OVERSAMPLING"),
+    }
+
+def build_quantization_config(quantization):
+    """量子化の設定を作成する（noneならNone）"""
+    if quantization not in QUANTIZATION_TYPES:
+        raise ValueError(f"無効な量子化タイプです: {quantization}（{', '.join(QUANTIZATION_TYPES)}のいずれか）")
+    if quantization == 'int8':
+        # float32 -> int8で約1/4のメモリ。外れ値の影響を抑えるため上位1%をクリップ
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8,
+                quantile=0.99,
+                always_ram=True
+            )
+        )
+    if quantization == 'binary':
+        # 1次元あたり1bitで約1/32のメモリ。高次元のベクトルほど精度を保ちやすい
+        return models.BinaryQuantization(
+            binary=models.BinaryQuantizationConfig(always_ram=True)
+        )
+    return None
+
+def build_hnsw_config(hnsw_m=None, hnsw_ef_construct=None):
+    """HNSWの設定を作成する（どちらも未指定ならNoneでQdrantのデフォルトを使う）"""
+    if hnsw_m is None and hnsw_ef_construct is None:
+        return None
+    return models.HnswConfigDiff(m=hnsw_m, ef_construct=hnsw_ef_construct)
+
+def build_collection_options(settings=None):
+    """create_collectionに渡す追加の引数を作成する"""
+    settings = settings or load_index_settings()
+    return {
+        'hnsw_config': build_hnsw_config(settings['hnsw_m'], settings['hnsw_ef_construct']),
+        'quantization_config': build_quantization_config(settings['quantization']),
+    }
+
+def build_search_params(hnsw_ef=None, rescore=True, oversampling=None, exact=False):
+    """検索時のパラメータを作成する（すべてデフォルトならNone）"""
+    quantization = None
+    if oversampling is not None or not rescore:
+        quantization = models.QuantizationSearchParams(
+            rescore=rescore,
+            oversampling=oversampling
+        )
+    if hnsw_ef is None and quantization is None and not exact:
+        return None
+    return models.SearchParams(hnsw_ef=hnsw_ef, exact=exact, quantization=quantization)
+
+def default_search_params():
+    """環境変数の設定から検索時のパラメータを作成する"""
+    return build_search_params(**load_search_settings())
+
+def describe_settings(settings):
+    """設定を1行の文字列で表す（ログやベンチマークの表示用）"""
+    parts = [f"quantization={settings.get('quantization', 'none')}"]
+    for key in ('hnsw_m', 'hnsw_ef_construct', 'on_disk_vectors'):
+        if settings.get(key):
+            parts.append(f"{key}={settings[key]}")
+    return ", ".join(parts)
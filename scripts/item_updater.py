@@ -1,27 +1,32 @@
 import sqlite3
-import cloudscraper
-from bs4 import BeautifulSoup
-import time
 import re
 from urllib.parse import urljoin
 import os
-from dotenv import load_dotenv
-from qdrant_client import QdrantClient
-from qdrant_client.http import models
-import voyageai
-from tqdm import tqdm
+from data_version import bump_data_version
+from clients import create_qdrant_client
+from change_tracking import fetch_by_ids
+from tombstones import TOMBSTONE_MAX_RATIO, find_removed, find_booth_items, apply_tombstones
+from crawl_engine import CrawlEngine, CrawlProgress, DEFAULT_CONCURRENCY, DEFAULT_RATE
 
-# 環境変数の読み込み
-load_dotenv()
+# 掲載中のブースの一覧ページ（ここにないブースはサイトから消えたものとみなす）
+BOOTH_LIST_URL = "https://c.bunfree.net/c/tokyo40/all/booth"
 
 class ItemUpdater:
-    def __init__(self):
-        # CloudScraperの設定
-        self.scraper = cloudscraper.create_scraper()
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE, db_path='bunfree.db', engine=None):
+        # ブースページ・商品ページは並列に取得する（並列数とリクエスト数の上限はcrawl_engine.py参照）
+        self.engine = engine or CrawlEngine(concurrency=concurrency, rate=rate)
         self.base_url = "https://c.bunfree.net"
         
+        # 分散クロールのワーカー（crawl_coordinator.py）はページの解析だけを行うので、DBにもQdrantにも接続しない
+        self.db_path = db_path
+        self.conn = None
+        # 常駐するとき（refresh_daemon.py）は既存アイテムの一覧をメモリに持ち、毎回itemsテーブルを読み直さない
+        self.known_items = None
+        self.booth_website_urls = {}
+        if not db_path:
+            return
+        
         # データベース接続
-        self.db_path = 'bunfree.db'
         self.conn = sqlite3.connect(self.db_path)
         self.conn.row_factory = sqlite3.Row
         self.cursor = self.conn.cursor()
@@ -29,28 +34,13 @@ class ItemUpdater:
         # Qdrant接続設定
         self.qdrant_url = os.environ.get("QDRANT_URL")
         self.qdrant_api_key = os.environ.get("QDRANT_API_KEY")
-        self.qdrant = QdrantClient(
-            url=self.qdrant_url,
-            api_key=self.qdrant_api_key,
-            timeout=300.0  # タイムアウトを5分に設定
-        )
-        
-        # VoyageAI設定
-        self.voyage_api_key = os.environ.get("VOYAGE_API_KEY")
-        self.voyage = voyageai.Client(api_key=self.voyage_api_key)
+        self.qdrant = create_qdrant_client(url=self.qdrant_url, timeout=300.0)  # タイムアウトを5分に設定
         
-        # 埋め込みモデル設定
-        self.embedding_model = "voyage-3-large"
-        self.embedding_dimension = 2048
+        # ベクトル化（VoyageAI）とQdrantへのアップサートはsync_vectors.pyの差分同期でまとめて行う
     
     def get_soup(self, url):
         """URLからBeautifulSoupオブジェクトを取得"""
-        try:
-            response = self.scraper.get(url)
-            return BeautifulSoup(response.text, 'html.parser')
-        except Exception as e:
-            print(f"Error fetching {url}: {e}")
-            return None
+        return self.engine.get_soup(url)
     
     def extract_text(self, soup, selector, get_next=False):
         """セレクタから要素のテキストを抽出"""
@@ -100,17 +90,31 @@ class ItemUpdater:
                 item_links.append(full_url)
         return list(set(item_links))
     
+    def get_booth_links(self, list_url):
+        """ブース一覧ページからすべてのブースのリンクを取得（取得に失敗したらNone）"""
+        soup = self.get_soup(list_url)
+        if not soup:
+            return None
+        booth_links = set()
+        for link in soup.find_all('a', href=True):
+            href = link['href']
+            if '/c/tokyo' in href:  # ブースページへのリンクをフィルタリング
+                booth_links.add(urljoin(self.base_url, href))
+        return booth_links
+    
     def fetch_booths(self):
         """すべてのブースデータをSQLiteから取得"""
-        self.cursor.execute("SELECT id, url FROM booths")
+        self.cursor.execute("SELECT id, url, website_url FROM booths")
         return self.cursor.fetchall()
     
-    def fetch_existing_items_for_booth(self, booth_id):
-        """ブースのすべての既存アイテムのURLと名前を取得"""
-        self.cursor.execute("SELECT page_url, name FROM items WHERE booth_id = ?", (booth_id,))
-        results = self.cursor.fetchall()
-        # URL→名前のマッピングを辞書で返す
-        return {row['page_url']: row['name'] for row in results}
+    def fetch_existing_items_by_booth(self):
+        """すべての既存アイテムのIDと名前を、ブースごとに {page_url: (id, name)} で取得
+        （ワーカースレッドはSQLiteを読まないので、確認を始める前にまとめて読んでおく）"""
+        items_by_booth = {}
+        self.cursor.execute("SELECT id, booth_id, page_url, name FROM items")
+        for row in self.cursor.fetchall():
+            items_by_booth.setdefault(row['booth_id'], {})[row['page_url']] = (row['id'], row['name'])
+        return items_by_booth
     
     def parse_item_page(self, url, booth_id):
         """商品ページの情報を解析"""
@@ -231,188 +235,343 @@ class ItemUpdater:
             self.conn.commit()
             return (self.cursor.lastrowid, True)  # 新規アイテムの追加
     
-    def get_booth_details(self, booth_id):
-        """ブースの詳細情報を取得"""
-        self.cursor.execute("SELECT * FROM booths WHERE id = ?", (booth_id,))
-        return dict(self.cursor.fetchone()) if self.cursor.rowcount != 0 else None
+    def sync_updated_vectors(self, item_ids, booth_ids):
+        """追加・更新したアイテムと所属ブースのうち、テキストが変わったもの（新しいものを含む）を
+        バッチでベクトル化してQdrantにまとめてアップサートする。ブースの情報はブースごとに1回だけ読み込む。
+        前回の同期時のハッシュと比べるので、内容が変わっていないものはAPIもQdrantも呼ばない（sync_vectors.py参照）"""
+        from change_tracking import refresh_all
+        from sync_vectors import sync_collection
+
+        # 変更追跡のハッシュも、保存したアイテム・ブースの行だけを計算し直す
+        refresh_all(self.conn, booth_ids=booth_ids, item_ids=item_ids)
+        results = {}
+        for collection, ids in (('items', item_ids), ('booths', booth_ids)):
+            if ids:
+                results[collection] = sync_collection(self.conn, collection, ids=sorted(ids))
+        return results
     
-    def generate_item_embedding(self, item_data):
-        """アイテムのテキストからベクトル埋め込みを生成"""
-        # ベクトル化するテキストを作成
-        text = f"アイテム名: {item_data['name'] or ''}\n"
-        text += f"読み: {item_data['yomi'] or ''}\n"
-        text += f"ジャンル: {item_data['genre'] or ''}\n"
-        text += f"著者: {item_data['author'] or ''}\n"
-        text += f"アイテムタイプ: {item_data['item_type'] or ''}\n"
+    def scan_booth(self, task, all_existing_urls, refresh_existing, remove_missing):
+        """ブースページと商品ページを取得・解析する（ワーカースレッドで実行するので、DBには書き込まない）。
+        taskは (booth_id, ブースのURL, {既存アイテムのpage_url: (id, name)})"""
+        booth_id, booth_url, existing_items = task
+        soup = self.get_soup(booth_url)
+        if not soup:
+            raise RuntimeError(f"ブースページの取得に失敗: ID={booth_id}")
         
-        # 説明文は長くなりがちなので、適度に切り詰める
-        description = item_data['description'] or ''
-        if len(description) > 500:  # 長すぎる説明文は切り詰める
-            description = description[:500] + "..."
-        text += f"説明: {description}\n"
+        # 現在の商品リンクとWebサイトURLを取得（WebサイトURLの修正も同じページで行う）
+        current_item_links = self.get_item_links(soup)
+        result = {'new': [], 'refreshed': [], 'removed': [], 'messages': [], 'errors': 0,
+                  'links': current_item_links, 'website_url': self.extract_website_url(soup)}
         
-        # ブース情報を追加
-        booth = self.get_booth_details(item_data['booth_id'])
-        if booth:
-            text += f"ブース名: {booth['name'] or ''}\n"
+        # ブースページから消えたアイテム（リンクが1件もない場合はページの取得失敗かもしれないので削除しない）
+        if remove_missing and current_item_links:
+            links = set(current_item_links)
+            result['removed'] = [item_id for url, (item_id, _) in existing_items.items() if url and url not in links]
+        elif remove_missing and existing_items:
+            result['messages'].append(f"ブースID={booth_id}のページにアイテムがありません（取得失敗の可能性があるため削除しません）")
         
-        # Voyage AIでベクトル化
-        try:
-            embedding = self.voyage.embed(
-                texts=[text], 
-                model=self.embedding_model,
-                output_dimension=self.embedding_dimension,
-                truncation=True
-            ).embeddings[0]
-            return embedding
-        except Exception as e:
-            print(f"Error generating embedding: {e}")
-            return None
+        existing_names = {name for _, name in existing_items.values()}
+        for item_url in current_item_links:
+            # 全体のURLリストで確認し、既存のアイテムはrefresh_existingのときだけページを読み直す
+            is_new = item_url not in all_existing_urls
+            if not is_new and not refresh_existing:
+                continue
+            try:
+                # 商品ページの解析
+                item_data = self.parse_item_page(item_url, booth_id)
+                if not item_data:
+                    result['messages'].append(f"  - アイテムの解析に失敗: {item_url}")
+                    result['errors'] += 1
+                    continue
+                
+                # 名前による二重チェック - 同じ商品名があれば処理しない
+                if is_new and item_data['name'] and item_data['name'] in existing_names:
+                    result['messages'].append(f"  - 同名の商品が既に存在します: 「{item_data['name']}」")
+                    continue
+                result['new' if is_new else 'refreshed'].append(item_data)
+            except Exception as e:
+                result['messages'].append(f"  - アイテム処理でエラー: {item_url} - {e}")
+                result['errors'] += 1
+        return result
     
-    def upload_item_to_qdrant(self, item_id, item_data, vector):
-        """アイテムをQdrantにアップロード"""
-        # アイテムが所属するブースの情報を取得
-        booth = self.get_booth_details(item_data['booth_id'])
-        
-        # ペイロードにブース情報を追加
-        item_with_booth = item_data.copy()
-        if booth:
-            item_with_booth['booth_details'] = booth
-        
-        try:
-            self.qdrant.upload_points(
-                collection_name="items",
-                points=[
-                    models.PointStruct(
-                        id=item_id,
-                        vector=vector,
-                        payload=item_with_booth
-                    )
-                ]
-            )
-            return True
-        except Exception as e:
-            print(f"Error uploading to Qdrant: {e}")
-            return False
+    def apply_booth_result(self, booth_id, result):
+        """scan_boothの結果をSQLiteに保存する（呼び出し元のスレッドだけで実行する）。
+        追加・更新・削除の候補にしたIDを返す（crawl_progressに記録し、再開時に引き継ぐ）"""
+        for message in result['messages']:
+            print(message)
+        # 現在の商品リンクも記録する（別のブースに移ったアイテムを削除しないための確認に使う）
+        record = {'new': [], 'updated': [], 'removed': result['removed'], 'errors': result['errors'],
+                  'links': result.get('links', []), 'website_url': False}
+        website_url = result.get('website_url')
+        if website_url and website_url != self.booth_website_urls.get(booth_id):
+            self.cursor.execute("UPDATE booths SET website_url = ? WHERE id = ?", (website_url, booth_id))
+            self.conn.commit()
+            self.booth_website_urls[booth_id] = website_url
+            record['website_url'] = True
+        if result['new']:
+            print(f"\nブースID={booth_id}に{len(result['new'])}件の新しいアイテムを発見:")
+        for found_new, items in ((True, result['new']), (False, result['refreshed'])):
+            for item_data in items:
+                # データベースに保存（ベクトル化とQdrantへの追加は、全ブースを確認してからまとめて行う）
+                item_id, is_new_item = self.save_item(item_data)
+                record['new' if is_new_item else 'updated'].append(item_id)
+                if self.known_items is not None:
+                    self.known_items.setdefault(booth_id, {})[item_data['page_url']] = (item_id, item_data['name'])
+                if found_new:
+                    print(f"  + アイテム「{item_data['name']}」をDBに{('追加' if is_new_item else '更新')}しました")
+        return record
     
-    def check_and_update_items(self):
-        """すべてのブースをチェックして新しいアイテムを更新"""
+    def check_and_update_items(self, refresh_existing=True, remove_missing=True, list_url=BOOTH_LIST_URL,
+                               max_delete_ratio=TOMBSTONE_MAX_RATIO, force_delete=False, restart=False,
+                               coordinator=None):
+        """すべてのブースをチェックして新しいアイテムを更新する。
+        refresh_existingなら既存のアイテムのページも読み直し、内容が変わったものをQdrantに反映する。
+        remove_missingなら一覧から消えたブースと、ブースページから消えたアイテムを削除する（tombstones.py参照）。
+        ページの取得と解析は並列に行い、SQLiteへの保存はこのスレッドだけで行う。
+        途中で中断した場合は、次の実行で確認済みのブースを飛ばして続きから再開する（restartなら最初から）。
+        coordinator（crawl_coordinator.CrawlCoordinator）を渡すと、ページの取得と解析を別のプロセス・マシンのワーカーに任せる"""
+        progress = CrawlProgress(self.conn, 'item_update')
+        if restart:
+            progress.clear()
+            if coordinator is not None:
+                coordinator.frontier.clear()
         booths = self.fetch_booths()
-        print(f"{len(booths)}件のブースを確認します")
+        self.booth_website_urls = {booth['id']: booth['website_url'] for booth in booths}
         
-        new_items_total = 0
-        error_count = 0
+        # 一覧にないブースはページを確認せずに削除の候補にする（一覧の取得に失敗したらブースは削除しない）
+        removed_booth_ids = set()
+        if remove_missing:
+            listed_booth_urls = self.get_booth_links(list_url)
+            if listed_booth_urls:
+                removed_booth_ids = set(find_removed(self.conn, 'booths', listed_booth_urls))
+                booths = [booth for booth in booths if booth['id'] not in removed_booth_ids]
+            else:
+                print(f"ブース一覧を取得できなかったため、ブースの削除は行いません: {list_url}")
+        print(f"{len(booths)}件のブースを確認します")
         
-        # すべての既存の商品URLを一度だけ取得
-        self.cursor.execute("SELECT page_url FROM items")
-        all_existing_urls = set(row[0] for row in self.cursor.fetchall())
+        # すべての既存の商品URLを一度だけ取得（常駐している場合はメモリ上の一覧を使う）
+        items_by_booth = self.known_items if self.known_items is not None else self.fetch_existing_items_by_booth()
+        all_existing_urls = {url for items in items_by_booth.values() for url in items}
         print(f"現在のDBには{len(all_existing_urls)}件のアイテムURLが登録されています")
         
-        # プログレスバーの設定
-        progress_bar = tqdm(total=len(booths), desc="ブース処理中")
+        tasks = [(booth['id'], (booth['id'], booth['url'], items_by_booth.get(booth['id'], {}))) for booth in booths]
+        task_errors_before = self.engine.stats['task_errors']
+        if coordinator is None:
+            results = self.engine.run(
+                tasks,
+                lambda task: self.scan_booth(task, all_existing_urls, refresh_existing, remove_missing),
+                lambda booth_id, task, result: self.apply_booth_result(booth_id, result),
+                progress=progress,
+                desc="ブース処理中",
+            )
+            error_count = self.engine.stats['task_errors'] - task_errors_before
+        else:
+            # ワーカーにはブースごとの既存アイテムだけを渡す（全体のURLの一覧は大きいので送らない）
+            results = coordinator.run(
+                'item_update',
+                [(booth_id, {'booth': task, 'refresh_existing': refresh_existing, 'remove_missing': remove_missing})
+                 for booth_id, task in tasks],
+                lambda booth_id, payload, result: self.apply_booth_result(booth_id, result),
+                progress=progress,
+                desc="ブース処理中",
+            )
+            error_count = coordinator.stats['task_errors']
+        
+        # 新しく追加したアイテム、ページを読み直してSQLiteを更新した既存のアイテム、それらの所属ブース
+        # （前回中断した実行で処理したブースの分も含む）
+        new_item_ids = set()
+        updated_item_ids = set()
+        updated_booth_ids = set()
+        removed_item_ids = set()
+        for booth_id, record in results.items():
+            new_item_ids.update(record['new'])
+            updated_item_ids.update(record['updated'])
+            removed_item_ids.update(record['removed'])
+            if record['new'] or record['updated'] or record['removed'] or record.get('website_url'):
+                updated_booth_ids.add(int(booth_id))
+            error_count += record['errors']
         
-        for booth in booths:
-            booth_id = booth['id']
-            booth_url = booth['url']
-            
+        # 元のブースのページから消えても、確認したブースのページにリンクがあるアイテムは別のブースに移っただけなので
+        # 削除しない（--new-onlyや分散クロールでは読み直さないので、所属ブースをここで付け替える）
+        if removed_item_ids or removed_booth_ids:
+            candidates = removed_item_ids | find_booth_items(self.conn, removed_booth_ids)
+            moved, still_listed = self.reassign_moved_items(results, candidates)
+            removed_item_ids -= still_listed | new_item_ids | updated_item_ids
+            updated_item_ids.update(moved)
+            for old_booth_id, new_booth_id in moved.values():
+                updated_booth_ids.update((old_booth_id, new_booth_id))
+            if moved:
+                print(f"別のブースに移った{len(moved)}件のアイテムの所属ブースを付け替えました")
+        
+        # サイトから消えたブース・アイテムをQdrantとSQLiteから削除する（割合が多すぎる場合は削除しない）
+        # 停止を求められて途中で終わった場合は、確認できたブースの分だけ反映し、続きは次回に再開する
+        # （確認していないブースがあるので削除は行わない）
+        interrupted = self.engine.stopping.is_set()
+        deleted = {'booths': set(), 'items': set()}
+        failed_to_apply = interrupted
+        if interrupted:
+            print(f"停止を求められたため、{len(results)}/{len(tasks)}件のブースで中断しました（削除は次回に行います）")
+        elif removed_booth_ids or removed_item_ids:
             try:
-                # ブースページの取得
-                soup = self.get_soup(booth_url)
-                if not soup:
-                    print(f"ブースページの取得に失敗: ID={booth_id}")
-                    error_count += 1
-                    progress_bar.update(1)
-                    continue
-                
-                # 現在の商品リンクを取得
-                current_item_links = self.get_item_links(soup)
-                
-                # ブースの既存の商品URLと名前を取得（名前による重複チェック用）
-                existing_items = self.fetch_existing_items_for_booth(booth_id)
-                
-                # 新しい商品リンクの初期リスト
-                new_item_links = []
-                
-                # 各商品リンクを処理
-                for item_url in current_item_links:
-                    # 全体のURLリストで確認
-                    if item_url not in all_existing_urls:
-                        new_item_links.append(item_url)
-                        continue
-                    
-                    # 既に処理済みのURLなら次へ
-                
-                if new_item_links:
-                    print(f"\nブースID={booth_id}に{len(new_item_links)}件の新しいアイテムを発見:")
-                    
-                    for item_url in new_item_links:
-                        try:
-                            # 商品ページの解析
-                            item_data = self.parse_item_page(item_url, booth_id)
-                            if not item_data:
-                                print(f"  - アイテムの解析に失敗: {item_url}")
-                                error_count += 1
-                                continue
-                            
-                            # 名前による二重チェック - 同じ商品名があれば処理しない
-                            item_name = item_data['name']
-                            if item_name and item_name in existing_items.values():
-                                print(f"  - 同名の商品が既に存在します: 「{item_name}」")
-                                continue
-                            
-                            # データベースに保存
-                            item_id, is_new_item = self.save_item(item_data)
-                            
-                            print(f"  + アイテム「{item_data['name']}」をDBに{('追加' if is_new_item else '更新')}しました")
-                            
-                            # 新規アイテムの場合のみ埋め込みとQdrantアップロードを実行
-                            if is_new_item:
-                                # ベクトル埋め込みの生成
-                                vector = self.generate_item_embedding(item_data)
-                                if not vector:
-                                    print(f"  - ベクトル生成に失敗: {item_url}")
-                                    error_count += 1
-                                    continue
-                                
-                                # Qdrantにアップロード
-                                if self.upload_item_to_qdrant(item_id, item_data, vector):
-                                    print(f"  + アイテム「{item_data['name']}」をQdrantに追加しました")
-                                    new_items_total += 1
-                                else:
-                                    print(f"  - Qdrantへのアップロードに失敗: {item_url}")
-                                    error_count += 1
-                            else:
-                                print(f"  * アイテム「{item_data['name']}」は既存アイテムの更新のため、ベクトル処理はスキップします")
-                            
-                        except Exception as e:
-                            print(f"  - アイテム処理でエラー: {item_url} - {e}")
-                            error_count += 1
-
+                deleted = apply_tombstones(self.conn, removed_booth_ids, removed_item_ids,
+                                           max_ratio=max_delete_ratio, force=force_delete)
+            except Exception as e:
+                print(f"削除の反映でエラー: {e}")
+                error_count += 1
+                failed_to_apply = True
+            new_item_ids -= deleted['items']
+            updated_item_ids -= deleted['items']
+            updated_booth_ids -= deleted['booths']
+            if self.known_items is not None:
+                self.forget_known_items(deleted['booths'], deleted['items'])
+        
+        # 新しいアイテムと、読み直したアイテムのうちテキストが変わったものを、まとめてバッチでベクトル化して追加する
+        # （アイテム名はブースのテキストとペイロードにも含まれるので、所属ブースも確認する）
+        reembedded = payload_updated = 0
+        if new_item_ids or updated_item_ids or updated_booth_ids:
+            print(f"\n新しいアイテム{len(new_item_ids)}件と読み直した{len(updated_item_ids)}件のアイテムを"
+                  f"Qdrantに反映します")
+            try:
+                sync_results = self.sync_updated_vectors(new_item_ids | updated_item_ids, updated_booth_ids)
+                reembedded = sum(result['embedded'] for result in sync_results.values())
+                payload_updated = sum(result['payload_updated'] for result in sync_results.values())
             except Exception as e:
-                print(f"ブース処理でエラー: ID={booth_id} - {e}")
+                print(f"Qdrantへの反映でエラー（sync_vectors.pyで再同期できます）: {e}")
                 error_count += 1
-            
-            # プログレスバーを更新
-            progress_bar.update(1)
+                failed_to_apply = True
         
-        # プログレスバーを閉じる
-        progress_bar.close()
+        # 最後まで反映できたら進捗の記録を消す（失敗した場合は、次の実行で記録済みの分から反映し直す）
+        if not failed_to_apply:
+            progress.clear()
+            if coordinator is not None:
+                coordinator.frontier.clear()
+        
+        # Qdrantの内容を変えた場合は検索結果のキャッシュを無効にする
+        deleted_total = len(deleted['booths']) + len(deleted['items'])
+        if reembedded or payload_updated or deleted_total:
+            bump_data_version(self.qdrant, f"新しいアイテム{len(new_item_ids)}件, "
+                                           f"再ベクトル化{reembedded}件, ペイロード更新{payload_updated}件, "
+                                           f"削除{deleted_total}件")
         
         print("\n===== 更新完了 =====")
         print(f"確認したブース数: {len(booths)}")
-        print(f"追加した新しいアイテム数: {new_items_total}")
+        print(f"追加した新しいアイテム数: {len(new_item_ids)}")
+        print(f"読み直した既存アイテム数: {len(updated_item_ids)}")
+        print(f"WebサイトURLを更新したブース数: {sum(1 for record in results.values() if record.get('website_url'))}")
+        print(f"再ベクトル化したポイント数: {reembedded}（ペイロードのみ更新: {payload_updated}）")
+        print(f"削除したブース数: {len(deleted['booths'])}, アイテム数: {len(deleted['items'])}")
         print(f"エラーの発生数: {error_count}")
+        crawler = self.engine if coordinator is None else coordinator
+        print(f"取得: {crawler.describe_stats()}, {crawler.stats.get('seconds', 0):.1f}秒")
+        return {
+            'booths': len(booths),
+            'new_items': len(new_item_ids),
+            'refreshed_items': len(updated_item_ids),
+            'website_urls': sum(1 for record in results.values() if record.get('website_url')),
+            'reembedded': reembedded,
+            'payload_updated': payload_updated,
+            'deleted_booths': len(deleted['booths']),
+            'deleted_items': len(deleted['items']),
+            'errors': error_count,
+            'interrupted': interrupted,
+        }
+    
+    def reassign_moved_items(self, results, item_ids):
+        """削除の候補のうち、確認したブースのページにリンクがあるアイテムの所属ブースを付け替える。
+        付け替えたアイテムの {item_id: (元のbooth_id, 新しいbooth_id)} と、掲載が続いているアイテムのIDを返す"""
+        linked_booths = {}
+        removed_from = {}
+        for booth_id, record in results.items():
+            for url in record.get('links', ()):
+                linked_booths[url] = int(booth_id)
+            for item_id in record['removed']:
+                removed_from.setdefault(item_id, []).append(int(booth_id))
+        moved = {}
+        still_listed = set()
+        if not item_ids or not linked_booths:
+            return moved, still_listed
+        rows = fetch_by_ids(self.conn, "SELECT id, booth_id, page_url, name FROM items WHERE id IN ({ids})", item_ids)
+        for row in rows:
+            new_booth_id = linked_booths.get(row['page_url'])
+            if new_booth_id is None:
+                continue
+            still_listed.add(row['id'])
+            if new_booth_id != row['booth_id']:
+                self.cursor.execute("UPDATE items SET booth_id = ? WHERE id = ?", (new_booth_id, row['id']))
+                moved[row['id']] = (row['booth_id'], new_booth_id)
+            if self.known_items is not None:
+                # 元のブースに残った古い記録を除く（新しいブースで保存し直した場合も残っている）
+                for old_booth_id in {row['booth_id'], *removed_from.get(row['id'], ())} - {new_booth_id}:
+                    self.known_items.get(old_booth_id, {}).pop(row['page_url'], None)
+                self.known_items.setdefault(new_booth_id, {})[row['page_url']] = (row['id'], row['name'])
+        self.conn.commit()
+        return moved, still_listed
+    
+    def forget_known_items(self, booth_ids, item_ids):
+        """削除したブース・アイテムをメモリ上の既存アイテムの一覧から除く"""
+        for booth_id in booth_ids:
+            self.known_items.pop(booth_id, None)
+        item_ids = set(item_ids)
+        for items in self.known_items.values():
+            for url in [url for url, (item_id, _) in items.items() if item_id in item_ids]:
+                del items[url]
     
     def close(self):
         """リソースをクローズ"""
+        self.engine.close()
         if self.conn:
             self.conn.close()
 
+def scan_booth_task(payload, engine):
+    """分散クロールのワーカー（crawl_coordinator.py）で1件のブースを確認する"""
+    updater = ItemUpdater(db_path=None, engine=engine)
+    booth_id, booth_url, existing_items = payload['booth']
+    # 既存かどうかはブースごとの既存アイテムで判定する（別のブースから移ったアイテムはsave_itemで更新になる）
+    return updater.scan_booth((booth_id, booth_url, existing_items), set(existing_items),
+                              payload['refresh_existing'], payload['remove_missing'])
+
 def main():
-    updater = ItemUpdater()
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='ブースページから新しいアイテムを取得してSQLiteとQdrantに追加し、既存アイテムの変更も反映します。')
+    parser.add_argument('--new-only', action='store_true',
+                        help='既存のアイテムのページは読み直さず、新しいアイテムだけを追加する')
+    parser.add_argument('--keep-missing', action='store_true',
+                        help='サイトから消えたブース・アイテムを削除しない')
+    parser.add_argument('--list-url', default=BOOTH_LIST_URL, help='掲載中のブースの一覧ページ')
+    parser.add_argument('--max-delete-ratio', type=float, default=TOMBSTONE_MAX_RATIO,
+                        help='これより多くの割合が消えている場合は削除しない（クロール失敗の対策）')
+    parser.add_argument('--force-delete', action='store_true', help='割合の上限を超えていても削除する')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help='ページを同時に取得する数')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE, help='1秒あたりのリクエスト数の上限（0で無制限）')
+    parser.add_argument('--restart', action='store_true', help='前回中断した実行の続きからではなく、最初から確認する')
+    parser.add_argument('--coordinator-port', type=int,
+                        help='コーディネーターをこのポートで起動し、ページの取得と解析をワーカーに任せる'
+                             '（--rateは全ワーカー合計の上限になる）')
+    parser.add_argument('--coordinator-host', default='127.0.0.1',
+                        help='コーディネーターが待ち受けるアドレス（別のマシンのワーカーを使う場合は0.0.0.0）')
+    parser.add_argument('--local-workers', type=int, default=0,
+                        help='このマシンでもワーカーのプロセスをこの数だけ起動する（--coordinator-portと一緒に使う）')
+    args = parser.parse_args()
+
+    updater = ItemUpdater(concurrency=args.concurrency, rate=args.rate)
+    coordinator = None
+    workers = []
     try:
-        updater.check_and_update_items()
+        if args.coordinator_port is not None:
+            from crawl_coordinator import CrawlCoordinator, start_local_workers
+            coordinator = CrawlCoordinator(updater.db_path, 'item_update', rate=args.rate,
+                                           host=args.coordinator_host, port=args.coordinator_port).start()
+            workers = start_local_workers(coordinator.base_url, args.local_workers, args.concurrency)
+        updater.check_and_update_items(refresh_existing=not args.new_only, remove_missing=not args.keep_missing,
+                                       list_url=args.list_url, max_delete_ratio=args.max_delete_ratio,
+                                       force_delete=args.force_delete, restart=args.restart,
+                                       coordinator=coordinator)
     finally:
+        if coordinator is not None:
+            coordinator.close()
+        for worker in workers:
+            worker.wait()
         updater.close()
 
 if __name__ == "__main__":
@@ -0,0 +1,284 @@
+import os
+import re
+import heapq
+import time
+import pickle
+import sqlite3
+import argparse
+import unicodedata
+
+from change_tracking import hash_value
+
+# ブース・アイテムの名前などに対する部分一致検索用のローカルの転置インデックス。
+#   Qdrantのキーワードインデックスは完全一致のみで、WORDトークナイザーは日本語を分割しないため、
+#   「点滅社」のような部分一致はQdrantでは難しい。ここでは文字のbi-gram（1文字の検索にはuni-gram）で
+#   候補を絞り込み、正規化した文字列での部分一致で確認する。
+#   正規化: NFKC（全角・半角の統一）、小文字化、カタカナ→ひらがな、空白と@の除去
+#   インデックスはcache/lexical_index.pklに保存し、次回はSQLiteで内容が変わった行だけを更新する。
+
+DEFAULT_INDEX_FILE = os.path.join("cache", "lexical_index.pkl")
+INDEX_FORMAT_VERSION = 1
+
+# コレクションごとの対象フィールドと重み（名前の一致を最も高く評価する）
+LEXICAL_FIELDS = {
+    'booths': {'name': 3.0, 'yomi': 2.0, 'twitter': 1.5, 'instagram': 1.5},
+    'items': {'name': 3.0, 'yomi': 2.0, 'author': 1.5},
+}
+
+# 同じプロセスでSQLiteとの差分を確認する間隔（秒）
+REFRESH_INTERVAL = float(os.getenv("LEXICAL_REFRESH_INTERVAL", "60"))
+
+# RRFの定数（順位の低い結果の影響を抑える）
+RRF_K = 60
+
+def katakana_to_hiragana(text):
+    """カタカナをひらがなにする（読み仮名の表記揺れをなくす）"""
+    return ''.join(chr(ord(c) - 0x60) if 'ァ' <= c <= 'ヶ' else c for c in text)
+
+def normalize_text(text):
+    """検索用に文字列を正規化する"""
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    text = katakana_to_hiragana(text)
+    return re.sub(r'[\s@＠]+', '', text)
+
+def split_terms(query):
+    """クエリを空白で区切り、正規化した語のリストにする"""
+    query = unicodedata.normalize('NFKC', query or '')
+    return [term for term in (normalize_text(part) for part in query.split()) if term]
+
+def ngrams(text):
+    """文字のuni-gramとbi-gramの集合を返す"""
+    grams = set(text)
+    grams.update(text[i:i+2] for i in range(len(text) - 1))
+    return grams
+
+def query_grams(term):
+    """検索語の候補を絞り込むためのn-gram（2文字以上ならbi-gram、1文字ならuni-gram）"""
+    if len(term) == 1:
+        return {term}
+    return {term[i:i+2] for i in range(len(term) - 1)}
+
+class LexicalIndex:
+    """n-gramの転置インデックス"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.field_names = tuple(LEXICAL_FIELDS[collection])
+        self.weights = tuple(LEXICAL_FIELDS[collection].values())
+        self.fields = {}    # doc_id -> 正規化したフィールド値のタプル
+        self.hashes = {}    # doc_id -> 元の値のハッシュ
+        self.postings = {}  # n-gram -> doc_idの集合
+        self.refreshed_at = 0.0
+
+    def __len__(self):
+        return len(self.fields)
+
+    def add(self, doc_id, values):
+        """ドキュメントを追加する"""
+        normalized = tuple(normalize_text(value) for value in values)
+        self.fields[doc_id] = normalized
+        for gram in set().union(*(ngrams(value) for value in normalized)):
+            self.postings.setdefault(gram, set()).add(doc_id)
+
+    def remove(self, doc_id):
+        """ドキュメントを削除する"""
+        normalized = self.fields.pop(doc_id, None)
+        self.hashes.pop(doc_id, None)
+        if normalized is None:
+            return
+        for gram in set().union(*(ngrams(value) for value in normalized)):
+            doc_ids = self.postings.get(gram)
+            if doc_ids is not None:
+                doc_ids.discard(doc_id)
+                if not doc_ids:
+                    del self.postings[gram]
+
+    def refresh(self, conn):
+        """SQLiteと比べて、追加・変更・削除された行だけをインデックスに反映する"""
+        columns = ', '.join(self.field_names)
+        cursor = conn.execute(f"SELECT id, {columns} FROM {self.collection}")
+        seen = set()
+        added = updated = 0
+        for row in cursor:
+            doc_id = row[0]
+            values = tuple(row[1:])
+            seen.add(doc_id)
+            row_hash = hash_value(list(values))
+            if self.hashes.get(doc_id) == row_hash:
+                continue
+            if doc_id in self.fields:
+                self.remove(doc_id)
+                updated += 1
+            else:
+                added += 1
+            self.add(doc_id, values)
+            self.hashes[doc_id] = row_hash
+        removed = [doc_id for doc_id in self.fields if doc_id not in seen]
+        for doc_id in removed:
+            self.remove(doc_id)
+        self.refreshed_at = time.time()
+        return {'added': added, 'updated': updated, 'removed': len(removed)}
+
+    def candidates(self, term):
+        """検索語のn-gramをすべて含むドキュメントの集合"""
+        posting_lists = []
+        for gram in query_grams(term):
+            doc_ids = self.postings.get(gram)
+            if not doc_ids:
+                return set()
+            posting_lists.append(doc_ids)
+        posting_lists.sort(key=len)
+        result = set(posting_lists[0])
+        for doc_ids in posting_lists[1:]:
+            result &= doc_ids
+            if not result:
+                break
+        return result
+
+    def term_score(self, doc_id, term):
+        """1つの検索語に対するスコア（一致したフィールドのうち最も高いもの。完全一致・前方一致を優先する）"""
+        best = 0.0
+        for value, weight in zip(self.fields[doc_id], self.weights):
+            if term not in value:
+                continue
+            if value == term:
+                score = weight * 2.0
+            elif value.startswith(term):
+                score = weight * 1.5
+            else:
+                score = weight
+            best = max(best, score)
+        return best
+
+    def search(self, query, limit=10):
+        """部分一致検索（空白区切りの語はすべて含むものだけ）。[(doc_id, score), ...] をスコアの高い順に返す"""
+        terms = split_terms(query)
+        if not terms:
+            return []
+        doc_ids = None
+        for term in sorted(terms, key=len, reverse=True):
+            matched = self.candidates(term)
+            doc_ids = matched if doc_ids is None else doc_ids & matched
+            if not doc_ids:
+                return []
+        scored = []
+        for doc_id in doc_ids:
+            scores = [self.term_score(doc_id, term) for term in terms]
+            # n-gramがすべて含まれていても、連続していなければ一致ではない
+            if all(scores):
+                scored.append((doc_id, sum(scores), len(self.fields[doc_id][0])))
+        # 同じスコアなら名前が短いものを先にする
+        top = heapq.nsmallest(limit, scored, key=lambda entry: (-entry[1], entry[2], entry[0]))
+        return [(doc_id, score) for doc_id, score, _ in top]
+
+def load_index_file(path=DEFAULT_INDEX_FILE):
+    """保存済みのインデックスを {collection: LexicalIndex} で読み込む（なければ空）"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+    except (pickle.UnpicklingError, EOFError) as e:
+        print(f"部分一致インデックスのファイルが壊れています（作り直します）: {e}")
+        return {}
+    if data.get('version') != INDEX_FORMAT_VERSION:
+        return {}
+    for index in data['indexes'].values():
+        # 保存後にSQLiteが変わっているかもしれないので、読み込み直後は必ず差分を確認する
+        index.refreshed_at = 0.0
+    return data['indexes']
+
+def save_index_file(indexes, path=DEFAULT_INDEX_FILE):
+    """インデックスをファイルに保存する（書き込み途中で中断しても壊れないように置き換える）"""
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        pickle.dump({'version': INDEX_FORMAT_VERSION, 'indexes': indexes}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, path)
+
+# プロセス内で読み込んだインデックス
+_loaded_indexes = None
+
+def get_lexical_index(collection, conn, path=None, force_refresh=False):
+    """部分一致インデックスを返す（保存済みのものを読み込み、一定間隔でSQLiteとの差分を反映する）"""
+    global _loaded_indexes
+    path = path or os.getenv("LEXICAL_INDEX_FILE", DEFAULT_INDEX_FILE)
+    if _loaded_indexes is None:
+        _loaded_indexes = load_index_file(path)
+    index = _loaded_indexes.get(collection)
+    if index is None:
+        index = _loaded_indexes[collection] = LexicalIndex(collection)
+    if force_refresh or time.time() - index.refreshed_at >= REFRESH_INTERVAL:
+        changes = index.refresh(conn)
+        if any(changes.values()):
+            print(f"部分一致インデックスを更新しました: {collection}（追加{changes['added']}件, "
+                  f"変更{changes['updated']}件, 削除{changes['removed']}件）")
+            save_index_file(_loaded_indexes, path)
+    return index
+
+def rrf_fuse(rankings, k=RRF_K, weights=None):
+    """複数の順位リスト（IDのリスト）をReciprocal Rank Fusionで統合し、[(id, score), ...] を返す"""
+    weights = weights or [1.0] * len(rankings)
+    scores = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + weight / (k + rank)
+    return sorted(scores.items(), key=lambda entry: -entry[1])
+
+def run_benchmark(index, queries, limit, repeat=100):
+    """検索のレイテンシを計測する"""
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            hits = index.search(query, limit)
+        latencies.append((time.perf_counter() - start) * 1000 / repeat)
+        print(f"{latencies[-1]:8.4f}ms  {len(hits):3d}件  {query}")
+    latencies.sort()
+    print(f"{len(index)}件のインデックス, {len(index.postings)}種類のn-gram: "
+          f"中央値 {latencies[len(latencies) // 2]:.4f}ms, 最大 {latencies[-1]:.4f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='ブース・アイテムの名前・読み・作者・SNSアカウントを部分一致で検索します（n-gramの転置インデックス）。')
+    parser.add_argument('--collection', choices=list(LEXICAL_FIELDS), default='booths', help='検索するコレクション')
+    parser.add_argument('--query', action='append', help='検索語（複数指定可）')
+    parser.add_argument('--limit', type=int, default=10, help='結果の最大数')
+    parser.add_argument('--db', default='bunfree.db', help='SQLiteデータベースのパス')
+    parser.add_argument('--rebuild', action='store_true', help='保存済みのインデックスを使わずに作り直す')
+    parser.add_argument('--benchmark', action='store_true', help='検索のレイテンシを計測する')
+    args = parser.parse_args()
+
+    global _loaded_indexes
+    if args.rebuild:
+        _loaded_indexes = {}
+    conn = sqlite3.connect(args.db)
+    try:
+        start = time.perf_counter()
+        index = get_lexical_index(args.collection, conn, force_refresh=True)
+        print(f"インデックスの準備: {(time.perf_counter() - start) * 1000:.1f}ms（{len(index)}件）")
+
+        queries = args.query or []
+        if args.benchmark:
+            if not queries:
+                # 実データの名前の一部をクエリにする
+                rows = conn.execute(f"SELECT name FROM {args.collection} ORDER BY RANDOM() LIMIT 20").fetchall()
+                queries = [row[0][:3] for row in rows if row[0]]
+            run_benchmark(index, queries, args.limit)
+            return
+
+        names = dict(conn.execute(f"SELECT id, name FROM {args.collection}").fetchall())
+        for query in queries:
+            start = time.perf_counter()
+            hits = index.search(query, args.limit)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            print(f"「{query}」 {len(hits)}件（{elapsed_ms:.3f}ms）")
+            for doc_id, score in hits:
+                print(f"  {score:.1f} ID={doc_id} {names.get(doc_id)}")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+import os
+import time
+import argparse
+import threading
+import numpy as np
+
+from vector_store import iter_vector_records, vector_file_for
+from payload_projection import project_records
+
+# Qdrantの全ポイントのベクトルをメモリ上の行列に載せて、行列積で厳密なコサイン類似度検索を行う。
+# 数万件 x 2048次元程度ならQdrantへの往復より速い。
+#   データバージョン（data_version.py）が変わったら読み直すので、差分同期・ItemUpdater・デーモンの変更も反映される
+#   LOCAL_INDEX_SOURCE=file ならキャッシュ済みのベクトルファイルから読む（オフライン用。ファイルが更新されたら読み直す）
+#   float32: 1件あたり 次元数 x 4バイト
+#   float16: その半分（計算はチャンクごとにfloat32に戻して行う）
+
+# コレクションごとのフィルター用のペイロードのフィールド
+FILTER_FIELDS = {
+    'booths': {'area': 'area', 'category': 'category'},
+    'items': {'area': 'booth_area', 'category': 'genre'},
+}
+
+# float16の行列をfloat32に戻しながら計算するときの行数
+FLOAT16_CHUNK_ROWS = 8192
+
+# データバージョン（ファイルの場合は更新時刻）を確認する間隔（秒）
+VERSION_CHECK_INTERVAL = float(os.getenv("LOCAL_INDEX_VERSION_CHECK_INTERVAL", "30"))
+
+class LocalHit:
+    """検索結果（QdrantのScoredPointと同じくid, score, payloadを持つ）"""
+
+    __slots__ = ('id', 'score', 'payload')
+
+    def __init__(self, point_id, score, payload):
+        self.id = point_id
+        self.score = score
+        self.payload = payload
+
+def normalize_rows(matrix):
+    """各行をL2ノルムで正規化する（コサイン類似度を内積で計算するため）"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+class LocalVectorIndex:
+    """ベクトルを連続した行列に載せた全件探索のインデックス"""
+
+    def __init__(self, collection, ids, matrix, payloads):
+        self.collection = collection
+        self.ids = ids
+        self.matrix = matrix
+        self.payloads = payloads
+        # フィルター用に、値ごとの行番号をまとめておく
+        self.filter_rows = {}
+        for name, field in FILTER_FIELDS[collection].items():
+            rows = {}
+            for row, payload in enumerate(payloads):
+                rows.setdefault(payload.get(field), []).append(row)
+            self.filter_rows[name] = {value: np.array(indices, dtype=np.int64) for value, indices in rows.items()}
+
+    @classmethod
+    def from_records(cls, collection, records, dtype='float32', source=''):
+        """{'id', 'vector', 'payload'} のレコードからインデックスを作成する"""
+        ids = []
+        vectors = []
+        payloads = []
+        for record in records:
+            ids.append(record['id'])
+            vectors.append(record['vector'])
+            payloads.append(record['payload'])
+        if not vectors:
+            raise ValueError(f"{source} にレコードがありません")
+        matrix = normalize_rows(np.asarray(vectors, dtype=np.float32))
+        return cls(collection, np.asarray(ids, dtype=np.int64), np.ascontiguousarray(matrix, dtype=dtype), payloads)
+
+    @classmethod
+    def from_vector_file(cls, collection, path, dtype='float32'):
+        """ベクトルファイルからインデックスを作成する"""
+        return cls.from_records(collection, project_records(iter_vector_records(path), collection), dtype, path)
+
+    @classmethod
+    def from_qdrant(cls, collection, client, dtype='float32'):
+        """Qdrantのコレクション（エイリアス）の全ポイントからインデックスを作成する"""
+        return cls.from_records(collection, iter_qdrant_records(client, collection), dtype, f"Qdrantの{collection}")
+
+    @property
+    def memory_bytes(self):
+        """行列のメモリ使用量（バイト）"""
+        return self.matrix.nbytes
+
+    def filtered_rows(self, area=None, category=None):
+        """フィルター条件に合う行番号を返す（条件がなければNone = 全件）"""
+        rows = None
+        for name, value in (('area', area), ('category', category)):
+            if value is None:
+                continue
+            matched = self.filter_rows[name].get(value, np.empty(0, dtype=np.int64))
+            rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+        return rows
+
+    def scores(self, query_vector, rows=None):
+        """クエリとのコサイン類似度を計算する（rowsを指定するとその行だけ）"""
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        if matrix.dtype == np.float32:
+            return matrix @ query
+        # float16はBLASが使えないので、チャンクごとにfloat32に戻して計算する
+        result = np.empty(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), FLOAT16_CHUNK_ROWS):
+            chunk = matrix[start:start + FLOAT16_CHUNK_ROWS].astype(np.float32)
+            result[start:start + FLOAT16_CHUNK_ROWS] = chunk @ query
+        return result
+
+    def search(self, query_vector, limit=10, area=None, category=None):
+        """上位limit件をスコアの高い順に返す（area/categoryでペイロードを絞り込める）"""
+        rows = self.filtered_rows(area, category)
+        if rows is not None and len(rows) == 0:
+            return []
+        scores = self.scores(query_vector, rows)
+        limit = min(limit, len(scores))
+        if limit <= 0:
+            return []
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        if rows is not None:
+            top_rows = rows[top]
+        else:
+            top_rows = top
+        return [
+            LocalHit(int(self.ids[row]), float(score), self.payloads[row])
+            for row, score in zip(top_rows, scores[top])
+        ]
+
+    def search_batch(self, query_vectors, limit=10, area=None, category=None):
+        """複数のクエリをまとめて検索する（行列同士の積1回で全クエリのスコアを計算する）"""
+        if len(query_vectors) == 0:
+            return []
+        queries = normalize_rows(np.asarray(query_vectors, dtype=np.float32))
+        rows = self.filtered_rows(area, category)
+        if rows is not None and len(rows) == 0:
+            return [[] for _ in range(len(queries))]
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        if matrix.dtype == np.float32:
+            scores = matrix @ queries.T
+        else:
+            scores = np.empty((len(matrix), len(queries)), dtype=np.float32)
+            for start in range(0, len(matrix), FLOAT16_CHUNK_ROWS):
+                chunk = matrix[start:start + FLOAT16_CHUNK_ROWS].astype(np.float32)
+                scores[start:start + FLOAT16_CHUNK_ROWS] = chunk @ queries.T
+        limit = min(limit, len(matrix))
+        if limit <= 0:
+            return [[] for _ in range(len(queries))]
+        # クエリごと（列ごと）に上位limit件を取り出す
+        top = np.argpartition(-scores, limit - 1, axis=0)[:limit]
+        results = []
+        for column in range(len(queries)):
+            column_top = top[:, column]
+            column_top = column_top[np.argsort(-scores[column_top, column])]
+            top_rows = rows[column_top] if rows is not None else column_top
+            results.append([
+                LocalHit(int(self.ids[row]), float(score), self.payloads[row])
+                for row, score in zip(top_rows, scores[column_top, column])
+            ])
+        return results
+
+def iter_qdrant_records(client, collection, page_size=256):
+    """Qdrantのコレクションの全ポイントを {'id', 'vector', 'payload'} で1件ずつ返す"""
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection,
+            limit=page_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True
+        )
+        for point in points:
+            yield {'id': point.id, 'vector': point.vector, 'payload': point.payload}
+        if offset is None:
+            break
+
+# プロセス内で読み込んだインデックス（コレクション・精度ごとに {'index', 'version', 'checked_at'}）
+_loaded_indexes = {}
+_loaded_lock = threading.Lock()
+# 読み直し中のキー（読み直している間、他のスレッドは古いインデックスで検索を続ける）
+_reloading = set()
+
+def default_vector_file(collection):
+    """コレクションに対応するキャッシュ済みベクトルファイルのパス"""
+    kind = 'booth' if collection == 'booths' else 'item'
+    return vector_file_for(kind, int(os.getenv("EMBEDDING_DIMENSION", "2048")))
+
+def local_index_source():
+    """インデックスの読み込み元（qdrant または file）"""
+    return os.getenv("LOCAL_INDEX_SOURCE", "qdrant").lower()
+
+def current_source_version(collection):
+    """読み込み元の現在のバージョン（Qdrantはデータバージョン、ファイルは更新時刻）"""
+    if local_index_source() == 'file':
+        return os.path.getmtime(default_vector_file(collection))
+    from create_vector_db import qdrant
+    from data_version import get_data_version
+    return get_data_version(qdrant)
+
+def load_local_index(collection, dtype):
+    """読み込み元からインデックスを作成する"""
+    if local_index_source() == 'file':
+        return LocalVectorIndex.from_vector_file(collection, default_vector_file(collection), dtype)
+    from create_vector_db import qdrant
+    return LocalVectorIndex.from_qdrant(collection, qdrant, dtype)
+
+def get_local_index(collection, dtype=None):
+    """ローカルのインデックスを返す。VERSION_CHECK_INTERVAL秒ごとに読み込み元のバージョンを確認し、
+    変わっていれば読み直す（読み直せないときは読み込み済みのものを使い続ける）"""
+    dtype = dtype or os.getenv("LOCAL_INDEX_DTYPE", "float32")
+    key = (collection, dtype)
+    now = time.monotonic()
+    with _loaded_lock:
+        entry = _loaded_indexes.get(key)
+        if entry is not None:
+            if now - entry['checked_at'] < VERSION_CHECK_INTERVAL or key in _reloading:
+                return entry['index']
+            entry['checked_at'] = now
+        _reloading.add(key)
+    try:
+        start = time.perf_counter()
+        try:
+            version = current_source_version(collection)
+            if entry is not None and entry['version'] == version:
+                return entry['index']
+            index = load_local_index(collection, dtype)
+        except Exception as e:
+            if entry is None:
+                raise
+            print(f"ローカルインデックスを読み直せませんでした（読み込み済みのものを使います）: {e}")
+            return entry['index']
+        print(f"ローカルインデックスを読み込みました: {collection}（{len(index.ids)}件, {dtype}, "
+              f"バージョン{version}, {index.memory_bytes / 1024 / 1024:.1f}MB, {time.perf_counter() - start:.1f}秒）")
+        with _loaded_lock:
+            _loaded_indexes[key] = {'index': index, 'version': version, 'checked_at': time.monotonic()}
+        return index
+    finally:
+        with _loaded_lock:
+            _reloading.discard(key)
+
+def local_search_enabled():
+    """環境変数LOCAL_INDEX=trueならQdrantの代わりにローカルのインデックスで検索する"""
+    return os.getenv("LOCAL_INDEX", "false").lower() in ('1', 'true', 'yes')
+
+def qdrant_filter(collection, area=None, category=None):
+    """area/categoryの条件をQdrantのフィルターにする（ベンチマークで同じ条件を比べるため）"""
+    from qdrant_client.http import models
+    conditions = [
+        models.FieldCondition(key=FILTER_FIELDS[collection][name], match=models.MatchValue(value=value))
+        for name, value in (('area', area), ('category', category)) if value is not None
+    ]
+    return models.Filter(must=conditions) if conditions else None
+
+def run_benchmark(collection, queries_file, limit, area=None, category=None):
+    """Qdrantとローカルのインデックス（float32/float16）のレイテンシ・スループット・recallを比較する"""
+    from create_vector_db import qdrant
+    from benchmark_index import load_queries, embed_queries, recall_at_k, percentile
+    from index_config import default_search_params
+
+    queries = load_queries(queries_file)
+    query_vectors = embed_queries(queries)
+    query_filter = qdrant_filter(collection, area, category)
+
+    indexes = {dtype: get_local_index(collection, dtype) for dtype in ('float32', 'float16')}
+    # 正解データ: float32の全件探索（厳密）
+    truth = [[hit.id for hit in indexes['float32'].search(vector, limit, area, category)] for vector in query_vectors]
+
+    def measure(label, search_func):
+        results = []
+        latencies = []
+        start = time.perf_counter()
+        for vector in query_vectors:
+            query_start = time.perf_counter()
+            results.append([hit.id for hit in search_func(vector)])
+            latencies.append((time.perf_counter() - query_start) * 1000)
+        elapsed = time.perf_counter() - start
+        print(f"{label:<22} recall@{limit}={recall_at_k(truth, results, limit):.3f}  "
+              f"p50={percentile(latencies, 50):7.2f}ms  p95={percentile(latencies, 95):7.2f}ms  "
+              f"{len(query_vectors) / elapsed:8.1f} qps")
+
+    print(f"{len(queries)}件のクエリで比較します（フィルター: area={area}, category={category}）")
+    measure("qdrant", lambda vector: qdrant.search(
+        collection_name=collection,
+        query_vector=vector,
+        query_filter=query_filter,
+        limit=limit,
+        search_params=default_search_params(),
+        with_payload=False
+    ))
+    for dtype, index in indexes.items():
+        measure(f"local {dtype} ({index.memory_bytes / 1024 / 1024:.0f}MB)",
+                lambda vector, index=index: index.search(vector, limit, area, category))
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Qdrantの全ポイント（またはキャッシュ済みのベクトル）をメモリに載せて全件探索します（Qdrantとの比較ベンチマーク付き）。')
+    parser.add_argument('--collection', choices=list(FILTER_FIELDS), default='booths', help='検索するコレクション')
+    parser.add_argument('--dtype', choices=['float32', 'float16'], default='float32', help='行列の精度')
+    parser.add_argument('--query', help='検索クエリ')
+    parser.add_argument('--area', help='エリアで絞り込む（アイテムの場合は所属ブースのエリア）')
+    parser.add_argument('--category', help='カテゴリで絞り込む（アイテムの場合はジャンル）')
+    parser.add_argument('--limit', type=int, default=10, help='結果の最大数')
+    parser.add_argument('--benchmark', action='store_true', help='Qdrantとレイテンシ・スループット・recallを比較する')
+    parser.add_argument('--queries-file', help='ベンチマーク用のクエリファイル（1行1クエリ）')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        from benchmark_index import DEFAULT_QUERIES_FILE
+        run_benchmark(args.collection, args.queries_file or DEFAULT_QUERIES_FILE, args.limit, args.area, args.category)
+        return
+
+    if not args.query:
+        parser.error("--query か --benchmark のどちらかを指定してください")
+
+    from create_vector_db import voyage, EMBEDDING_MODEL, EMBEDDING_DIMENSION
+    from query_embedding_cache import QueryEmbeddingCache
+    index = get_local_index(args.collection, args.dtype)
+    query_vector = QueryEmbeddingCache(voyage, EMBEDDING_MODEL, EMBEDDING_DIMENSION).embed(args.query)
+    start = time.perf_counter()
+    hits = index.search(query_vector, args.limit, args.area, args.category)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    for i, hit in enumerate(hits, 1):
+        print(f"[{i}] {hit.score:.4f} ID={hit.id} {hit.payload.get('name')}")
+    print(f"{len(hits)}件（検索 {elapsed_ms:.2f}ms）")
+
+if __name__ == "__main__":
+    main()
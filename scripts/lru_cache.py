@@ -0,0 +1,57 @@
+import threading
+from collections import OrderedDict
+
+class LRUCache:
+    """最近使われていないものから捨てる、件数上限つきのキャッシュ（スレッドセーフ）"""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """値を取得する（見つかったら最近使ったものとして先頭に移す）"""
+        with self.lock:
+            if key in self.data:
+                self.data.move_to_end(key)
+                self.hits += 1
+                return self.data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        """値を保存する（上限を超えたら最も古いものを捨てる）"""
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """値を削除して返す"""
+        with self.lock:
+            return self.data.pop(key, default)
+
+    def clear(self):
+        """すべての値を削除する"""
+        with self.lock:
+            self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def stats(self):
+        """ヒット数・ミス数・ヒット率を返す"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self.data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
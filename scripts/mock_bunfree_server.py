@@ -0,0 +1,113 @@
+import os
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# c.bunfree.net を模したローカルのHTTPサーバー（クローラーの動作確認とベンチマーク用）。
+#   /c/<イベント>/all/booth → listPage.html（ブース一覧）
+#   /c/<イベント>/<ID>      → boothPage1.html / boothPage2.html（IDの偶奇で交互に返す）
+#   /p/<イベント>/<ID>      → itemPage.html
+#   latencyで1リクエストごとの待ち時間（秒）、error_rateで503を返す割合を指定できる。
+
+FIXTURE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PORT = 8788
+
+def load_fixtures():
+    """scripts/*.html を読み込む"""
+    fixtures = {}
+    for name in ('listPage', 'boothPage1', 'boothPage2', 'itemPage'):
+        with open(os.path.join(FIXTURE_DIR, f'{name}.html'), 'rb') as f:
+            fixtures[name] = f.read()
+    return fixtures
+
+class MockBunfreeServer:
+    """別スレッドで動くモックサーバー"""
+
+    def __init__(self, port=0, latency=0.05, error_rate=0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.fixtures = load_fixtures()
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self.make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def page_for(self, path):
+        """パスから返すページを決める（該当しなければNone）"""
+        parts = [part for part in path.split('?')[0].split('/') if part]
+        if len(parts) >= 3 and parts[0] == 'c' and parts[2] == 'all':
+            return self.fixtures['listPage']
+        if len(parts) == 3 and parts[0] == 'c' and parts[2].isdigit():
+            return self.fixtures['boothPage1' if int(parts[2]) % 2 else 'boothPage2']
+        if len(parts) == 3 and parts[0] == 'p':
+            return self.fixtures['itemPage']
+        return None
+
+    def make_handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with mock.lock:
+                    mock.requests += 1
+                if mock.latency:
+                    time.sleep(mock.latency)
+                if mock.error_rate and random.random() < mock.error_rate:
+                    self.send_error(503)
+                    return
+                body = mock.page_for(self.path)
+                if body is None:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description='c.bunfree.netを模したローカルのHTTPサーバーを起動します（scripts/*.htmlを返す）。')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='待ち受けるポート')
+    parser.add_argument('--latency', type=float, default=0.05, help='1リクエストごとの待ち時間（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='503を返す割合')
+    args = parser.parse_args()
+
+    server = MockBunfreeServer(args.port, args.latency, args.error_rate)
+    print(f"モックサーバーを起動しました: {server.base_url}（BUNFREE_BASE_URL={server.base_url} で各ツールの接続先になります）")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server.server_close()
+        print(f"{server.requests}件のリクエストを処理しました")
+
+if __name__ == "__main__":
+    main()
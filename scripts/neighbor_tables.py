@@ -0,0 +1,284 @@
+import os
+import time
+import array
+import sqlite3
+import hashlib
+import argparse
+import numpy as np
+
+from vector_store import iter_vector_records
+from local_index import normalize_rows, default_vector_file
+
+# 「このブースに似たブース」「このアイテムに似たアイテム」を事前計算して保存する。
+#   全ペアのコサイン類似度をブロックごとの行列積で計算し、各行の上位k件をSQLiteに保存する。
+#   近傍IDはint64、スコアはfloat32のバイト列にまとめて1行に持つので、参照は主キー1回で済む。
+#   ベクトルのハッシュを一緒に保存し、再実行時は変わった行と、その影響を受ける行だけを計算し直す。
+
+DEFAULT_NEIGHBORS_DB = os.path.join("cache", "neighbors.db")
+DEFAULT_TOP_K = 20
+# 1回の行列積で計算する行数（ブロック行数 x 全件数 のスコア行列がメモリに載る）
+BLOCK_ROWS = 1024
+
+def vector_hash(vector):
+    """ベクトル（float32）のハッシュ値を返す"""
+    return hashlib.sha1(np.asarray(vector, dtype=np.float32).tobytes()).hexdigest()[:16]
+
+def pack_neighbors(neighbor_ids, scores):
+    """近傍IDとスコアをバイト列にする"""
+    return array.array('q', neighbor_ids).tobytes(), array.array('f', scores).tobytes()
+
+def unpack_neighbors(id_blob, score_blob):
+    """バイト列から近傍IDとスコアに戻す"""
+    neighbor_ids = array.array('q')
+    neighbor_ids.frombytes(id_blob)
+    scores = array.array('f')
+    scores.frombytes(score_blob)
+    return neighbor_ids.tolist(), scores.tolist()
+
+def fetch_qdrant_vectors(client, collection, page_size=256):
+    """Qdrantのコレクションから全ポイントのIDとベクトルを取得する"""
+    ids = []
+    vectors = []
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection,
+            limit=page_size,
+            offset=offset,
+            with_payload=False,
+            with_vectors=True
+        )
+        for point in points:
+            ids.append(point.id)
+            vectors.append(point.vector)
+        if offset is None:
+            break
+    return ids, vectors
+
+def fetch_file_vectors(collection):
+    """キャッシュ済みのベクトルファイルから全レコードのIDとベクトルを取得する"""
+    ids = []
+    vectors = []
+    for record in iter_vector_records(default_vector_file(collection)):
+        ids.append(record['id'])
+        vectors.append(record['vector'])
+    return ids, vectors
+
+def top_k_rows(matrix, rows, k, block_rows=BLOCK_ROWS):
+    """指定した行について、自分以外の全行との類似度の上位k件を返す（行番号の配列, スコアの配列）"""
+    k = min(k, len(matrix) - 1)
+    top_rows = np.empty((len(rows), max(k, 0)), dtype=np.int64)
+    top_scores = np.empty((len(rows), max(k, 0)), dtype=np.float32)
+    if k <= 0:
+        return top_rows, top_scores
+    for start in range(0, len(rows), block_rows):
+        block = rows[start:start + block_rows]
+        scores = matrix[block] @ matrix.T
+        # 自分自身は除く
+        scores[np.arange(len(block)), block] = -np.inf
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_block_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_block_scores, axis=1)
+        top_rows[start:start + len(block)] = np.take_along_axis(top, order, axis=1)
+        top_scores[start:start + len(block)] = np.take_along_axis(top_block_scores, order, axis=1)
+    return top_rows, top_scores
+
+class NeighborTable:
+    """事前計算した近傍のテーブル"""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.getenv("NEIGHBORS_DB", DEFAULT_NEIGHBORS_DB)
+        directory = os.path.dirname(self.db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS neighbors (
+                collection TEXT NOT NULL,
+                point_id INTEGER NOT NULL,
+                vector_hash TEXT NOT NULL,
+                neighbor_ids BLOB NOT NULL,
+                scores BLOB NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (collection, point_id)
+            ) WITHOUT ROWID
+        ''')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS neighbor_builds (
+                collection TEXT PRIMARY KEY,
+                top_k INTEGER NOT NULL,
+                dimension INTEGER NOT NULL,
+                built_at REAL NOT NULL
+            )
+        ''')
+        self.conn.commit()
+
+    def lookup(self, collection, point_id, limit=None):
+        """指定したポイントの近傍を [(id, score), ...] で返す（未計算ならNone）"""
+        row = self.conn.execute(
+            "SELECT neighbor_ids, scores FROM neighbors WHERE collection = ? AND point_id = ?",
+            (collection, point_id)
+        ).fetchone()
+        if row is None:
+            return None
+        neighbor_ids, scores = unpack_neighbors(*row)
+        pairs = list(zip(neighbor_ids, scores))
+        return pairs[:limit] if limit else pairs
+
+    def build_settings(self, collection):
+        """前回の計算時の設定 (top_k, dimension) を返す"""
+        return self.conn.execute(
+            "SELECT top_k, dimension FROM neighbor_builds WHERE collection = ?", (collection,)
+        ).fetchone()
+
+    def load(self, collection):
+        """保存済みの近傍を {point_id: (vector_hash, neighbor_ids, scores)} で返す"""
+        cursor = self.conn.execute(
+            "SELECT point_id, vector_hash, neighbor_ids, scores FROM neighbors WHERE collection = ?",
+            (collection,)
+        )
+        return {point_id: (hash_, *unpack_neighbors(id_blob, score_blob))
+                for point_id, hash_, id_blob, score_blob in cursor}
+
+    def save(self, collection, rows, deleted_ids, top_k, dimension):
+        """近傍を保存し、消えたポイントの行を削除する（rowsは (point_id, vector_hash, neighbor_ids, scores)）"""
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO neighbors (collection, point_id, vector_hash, neighbor_ids, scores, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(collection, point_id, hash_, *pack_neighbors(neighbor_ids, scores), now)
+             for point_id, hash_, neighbor_ids, scores in rows]
+        )
+        self.conn.executemany(
+            "DELETE FROM neighbors WHERE collection = ? AND point_id = ?",
+            [(collection, point_id) for point_id in deleted_ids]
+        )
+        self.conn.execute(
+            "INSERT OR REPLACE INTO neighbor_builds (collection, top_k, dimension, built_at) VALUES (?, ?, ?, ?)",
+            (collection, top_k, dimension, now)
+        )
+        self.conn.commit()
+
+    def clear(self, collection):
+        """コレクションの近傍をすべて削除する"""
+        self.conn.execute("DELETE FROM neighbors WHERE collection = ?", (collection,))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+def build_neighbors(table, collection, ids, vectors, top_k=DEFAULT_TOP_K, full=False, block_rows=BLOCK_ROWS):
+    """近傍テーブルを計算する。前回と設定が同じなら、ベクトルが変わった行と、
+    近傍に変わった行・消えた行を含む行だけを計算し直し、それ以外の行は変わった行との類似度だけをマージする"""
+    start = time.perf_counter()
+    raw = np.asarray(vectors, dtype=np.float32)
+    matrix = np.ascontiguousarray(normalize_rows(raw))
+    ids = np.asarray(ids, dtype=np.int64)
+    hashes = [vector_hash(vector) for vector in raw]
+    row_of = {int(point_id): row for row, point_id in enumerate(ids)}
+
+    if table.build_settings(collection) != (top_k, matrix.shape[1]):
+        full = True
+    stored = {} if full else table.load(collection)
+
+    changed_rows = [row for row, point_id in enumerate(ids)
+                    if stored.get(int(point_id), (None,))[0] != hashes[row]]
+    deleted_ids = [point_id for point_id in stored if point_id not in row_of]
+    stale_ids = {int(ids[row]) for row in changed_rows} | set(deleted_ids)
+
+    # 近傍に変わった行・消えた行を含む行は、順位が下がった可能性があるので計算し直す
+    recompute_rows = list(changed_rows)
+    merge_rows = []
+    for row, point_id in enumerate(ids):
+        entry = stored.get(int(point_id))
+        if entry is None or entry[0] != hashes[row]:
+            continue
+        if stale_ids.intersection(entry[1]):
+            recompute_rows.append(row)
+        elif changed_rows:
+            merge_rows.append(row)
+
+    updates = []
+    recompute_rows = np.asarray(recompute_rows, dtype=np.int64)
+    top_rows, top_scores = top_k_rows(matrix, recompute_rows, top_k, block_rows)
+    for row, neighbor_rows, scores in zip(recompute_rows, top_rows, top_scores):
+        updates.append((int(ids[row]), hashes[row], ids[neighbor_rows].tolist(), scores.tolist()))
+
+    # それ以外の行は、保存済みの近傍と変わった行の類似度を合わせて上位k件を取り直す
+    if merge_rows:
+        changed = np.asarray(changed_rows, dtype=np.int64)
+        changed_ids = ids[changed]
+        for block_start in range(0, len(merge_rows), block_rows):
+            block = merge_rows[block_start:block_start + block_rows]
+            block_scores = matrix[block] @ matrix[changed].T
+            for row, scores in zip(block, block_scores):
+                point_id = int(ids[row])
+                _, neighbor_ids, neighbor_scores = stored[point_id]
+                candidate_ids = np.concatenate([np.asarray(neighbor_ids, dtype=np.int64), changed_ids])
+                candidate_scores = np.concatenate([np.asarray(neighbor_scores, dtype=np.float32), scores])
+                order = np.argsort(-candidate_scores, kind='stable')[:min(top_k, len(ids) - 1)]
+                new_ids = candidate_ids[order].tolist()
+                if new_ids != neighbor_ids:
+                    updates.append((point_id, hashes[row], new_ids, candidate_scores[order].tolist()))
+
+    if full:
+        table.clear(collection)
+    table.save(collection, updates, deleted_ids, top_k, matrix.shape[1])
+    elapsed = time.perf_counter() - start
+    return {
+        'points': len(ids),
+        'changed': len(changed_rows),
+        'deleted': len(deleted_ids),
+        'recomputed': len(recompute_rows),
+        'merged': len(merge_rows),
+        'written': len(updates),
+        'seconds': elapsed,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='全ブース・アイテムの類似上位k件を事前計算してSQLiteに保存します（2回目以降は変わった行だけ）。')
+    parser.add_argument('--collection', choices=['booths', 'items', 'all'], default='all', help='対象のコレクション')
+    parser.add_argument('--source', choices=['qdrant', 'file'], default='qdrant',
+                        help='ベクトルの取得元（Qdrant、またはキャッシュ済みのベクトルファイル）')
+    parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K, help='1件あたりに保存する近傍の数')
+    parser.add_argument('--full', action='store_true', help='保存済みの近傍を使わずに全件計算し直す')
+    parser.add_argument('--db', help=f'保存先のSQLiteファイル（既定: {DEFAULT_NEIGHBORS_DB}）')
+    parser.add_argument('--lookup', type=int, help='計算せずに、指定したIDの近傍を表示する')
+    args = parser.parse_args()
+
+    table = NeighborTable(args.db)
+    collections = ('booths', 'items') if args.collection == 'all' else (args.collection,)
+    try:
+        if args.lookup is not None:
+            for collection in collections:
+                start = time.perf_counter()
+                neighbors = table.lookup(collection, args.lookup)
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                if neighbors is None:
+                    print(f"{collection}: ID={args.lookup} の近傍は計算されていません")
+                    continue
+                print(f"{collection}: ID={args.lookup} の近傍（{elapsed_ms:.3f}ms）")
+                for neighbor_id, score in neighbors:
+                    print(f"  {score:.4f} ID={neighbor_id}")
+            return
+
+        for collection in collections:
+            if args.source == 'qdrant':
+                from create_vector_db import qdrant
+                ids, vectors = fetch_qdrant_vectors(qdrant, collection)
+            else:
+                ids, vectors = fetch_file_vectors(collection)
+            if not ids:
+                print(f"{collection}: ベクトルがありません")
+                continue
+            result = build_neighbors(table, collection, ids, vectors, args.top_k, args.full)
+            pairs = result['recomputed'] * result['points'] + result['merged'] * result['changed']
+            print(f"{collection}: {result['points']}件中 変更{result['changed']}件・削除{result['deleted']}件, "
+                  f"再計算{result['recomputed']}件・マージ{result['merged']}件, 書き込み{result['written']}件 "
+                  f"（{result['seconds']:.2f}秒, {pairs / result['seconds'] if result['seconds'] else 0:,.0f} ペア/秒）")
+    finally:
+        table.close()
+
+if __name__ == "__main__":
+    main()
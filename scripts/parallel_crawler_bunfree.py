@@ -409,6 +409,10 @@ class ParallelBunfreeCrawler:
         return results
 
 def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='文学フリマのブース一覧からブースとアイテムを並列でクロールしてSQLiteに保存します。')
+    parser.parse_args()
+
     # データベースの作成
     from create_db import create_database
     create_database()
@@ -0,0 +1,195 @@
+import os
+import time
+import random
+import argparse
+import threading
+import concurrent.futures
+from clients import models
+
+from vector_store import iter_vector_records
+
+# デフォルトのバッチサイズと並列数
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_PARALLEL = 4
+MAX_RETRIES = 3
+
+class UploadProgressLog:
+    """アップロード済みIDを追記のみで記録するログ（1行に1バッチ分のIDをカンマ区切りで書く）"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def load(self):
+        """記録済みのIDを読み込む"""
+        uploaded_ids = set()
+        if not os.path.exists(self.path):
+            return uploaded_ids
+        with open(self.path, 'r') as f:
+            for line in f:
+                # 書き込み途中で中断された行（改行なし）は無視する
+                if not line.endswith('\n'):
+                    break
+                uploaded_ids.update(int(point_id) for point_id in line.strip().split(',') if point_id)
+        return uploaded_ids
+
+    def record(self, point_ids):
+        """アップロードに成功したIDを追記する"""
+        line = ','.join(str(point_id) for point_id in point_ids) + '\n'
+        with self.lock:
+            with open(self.path, 'a') as f:
+                f.write(line)
+                f.flush()
+
+def iter_point_batches(records, batch_size, skip_ids=None):
+    """レコードを遅延的に読みながらPointStructのバッチを作る"""
+    batch = []
+    for record in records:
+        if skip_ids and record['id'] in skip_ids:
+            continue
+        batch.append(models.PointStruct(
+            id=record['id'],
+            vector=record['vector'],
+            payload=record['payload']
+        ))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def upsert_with_retry(qdrant, collection_name, points):
+    """バッチをアップサートする（失敗時は待機して再試行）"""
+    for attempt in range(1, MAX_RETRIES + 1):
+        try:
+            qdrant.upsert(collection_name=collection_name, points=points, wait=True)
+            return
+        except Exception as e:
+            if attempt == MAX_RETRIES:
+                raise
+            wait = 2 ** attempt
+            print(f"アップロードエラー（{attempt}回目、{wait}秒後に再試行）: {e}")
+            time.sleep(wait)
+
+def upload_stream(qdrant, collection_name, records, batch_size=DEFAULT_BATCH_SIZE,
+                  parallel=DEFAULT_PARALLEL, progress_log=None, redo_ids=()):
+    """レコードのストリームを複数のワーカーで並列にアップロードする。
+    メモリに載るのは処理中のバッチ（最大でparallelの2倍）だけ。
+    redo_idsのIDはprogress_logに記録済みでもアップロードし直す（内容が古くなったもの）"""
+    skip_ids = (progress_log.load() if progress_log else set()) - set(redo_ids)
+    if skip_ids:
+        print(f"{collection_name}: {len(skip_ids)}件はアップロード済みのためスキップします")
+
+    uploaded = 0
+    failed = 0
+    start = time.perf_counter()
+    max_in_flight = parallel * 2
+
+    def report():
+        elapsed = time.perf_counter() - start
+        rate = uploaded / elapsed if elapsed > 0 else 0.0
+        print(f"{collection_name}: {uploaded}件アップロード済み（{rate:.1f} points/sec）")
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=parallel) as executor:
+        in_flight = {}
+
+        def collect(done_futures):
+            nonlocal uploaded, failed
+            for future in done_futures:
+                point_ids = in_flight.pop(future)
+                try:
+                    future.result()
+                    uploaded += len(point_ids)
+                    if progress_log:
+                        progress_log.record(point_ids)
+                except Exception as e:
+                    failed += len(point_ids)
+                    print(f"{collection_name}: {len(point_ids)}件のアップロードに失敗しました: {e}")
+            report()
+
+        for batch in iter_point_batches(records, batch_size, skip_ids):
+            # 処理中のバッチが多すぎる場合は、どれかが終わるまで待つ（読み込みを先行させすぎない）
+            if len(in_flight) >= max_in_flight:
+                done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                collect(done)
+            future = executor.submit(upsert_with_retry, qdrant, collection_name, batch)
+            in_flight[future] = [point.id for point in batch]
+
+        if in_flight:
+            done, _ = concurrent.futures.wait(in_flight)
+            collect(done)
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        'uploaded': uploaded,
+        'skipped': len(skip_ids),
+        'failed': failed,
+        'seconds': elapsed,
+        'points_per_second': uploaded / elapsed if elapsed > 0 else 0.0,
+    }
+    print(f"{collection_name}: アップロード完了 {uploaded}件 / スキップ{len(skip_ids)}件 / 失敗{failed}件 "
+          f"/ {elapsed:.1f}秒（{stats['points_per_second']:.1f} points/sec）")
+    return stats
+
+def create_upload_client(location=None, prefer_grpc=False):
+    """アップロード用のQdrantクライアントを作成する（location=":memory:"でインメモリのQdrant）"""
+    from qdrant_client import QdrantClient
+    if location == ":memory:":
+        return QdrantClient(location=":memory:")
+    return QdrantClient(
+        url=location or os.getenv("QDRANT_URL"),
+        api_key=os.getenv("QDRANT_API_KEY"),
+        prefer_grpc=prefer_grpc,  # gRPCが使える環境ではこちらの方が高速
+        timeout=300.0
+    )
+
+def generate_random_records(count, dimension):
+    """動作確認用のランダムなレコードを生成する"""
+    for point_id in range(1, count + 1):
+        yield {
+            'id': point_id,
+            'vector': [random.random() for _ in range(dimension)],
+            'payload': {'name': f"test-{point_id}"}
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description='ベクトルファイルをストリーミングしながら並列でQdrantにアップロードします。')
+    parser.add_argument('--file', help='アップロードするベクトルファイル（例: cache/booth_vectors.pkl）')
+    parser.add_argument('--collection', required=True, help='アップロード先のコレクション')
+    parser.add_argument('--location', help='QdrantのURL（":memory:"でインメモリ、省略時はQDRANT_URL）')
+    parser.add_argument('--grpc', action='store_true', help='gRPCで接続する')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='1リクエストのポイント数')
+    parser.add_argument('--parallel', type=int, default=DEFAULT_PARALLEL, help='並列ワーカー数')
+    parser.add_argument('--progress-log', help='アップロード済みIDを記録するログファイル（再開用）')
+    parser.add_argument('--self-test', type=int, metavar='N',
+                        help='ファイルの代わりにN件のランダムなベクトルでアップロード速度を確認する')
+    parser.add_argument('--dimension', type=int, default=2048, help='--self-testで使うベクトルの次元数')
+    args = parser.parse_args()
+
+    qdrant = create_upload_client(args.location, args.grpc)
+
+    if args.self_test:
+        records = generate_random_records(args.self_test, args.dimension)
+        dimension = args.dimension
+    else:
+        if not args.file:
+            parser.error("--file か --self-test のどちらかを指定してください")
+        first = next(iter_vector_records(args.file), None)
+        if first is None:
+            print(f"{args.file} にレコードがありません")
+            return
+        records = iter_vector_records(args.file)
+        dimension = len(first['vector'])
+
+    if not qdrant.collection_exists(collection_name=args.collection):
+        qdrant.create_collection(
+            collection_name=args.collection,
+            vectors_config=models.VectorParams(size=dimension, distance=models.Distance.COSINE)
+        )
+        print(f"コレクション'{args.collection}'を作成しました")
+
+    progress_log = UploadProgressLog(args.progress_log) if args.progress_log else None
+    upload_stream(qdrant, args.collection, records, args.batch_size, args.parallel, progress_log)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+import os
+import time
+import argparse
+from collections import Counter
+from clients import models
+
+# Qdrantのペイロードインデックスの定義。
+#   ペイロードのフィールドはトップレベル（name, twitter, ...）にある（payload_projection.py参照）。
+#   以前は"payload.name"のようなキーで作成していたため、どのフィルターにも使われず全件走査になっていた。
+#   text:    部分一致（MatchText）用。トークナイザーはPAYLOAD_TEXT_TOKENIZER（既定: multilingual）
+#   keyword: 完全一致（MatchValue / MatchAny）用
+#   integer: 完全一致と範囲（Range）用
+# ※instagramはペイロードに含めていないので、部分一致はlexical_index.pyで検索する。
+
+PAYLOAD_INDEXES = {
+    'booths': {
+        'name': 'text',
+        'twitter': 'keyword',
+        'area': 'keyword',
+        'category': 'keyword',
+        'map_number': 'integer',
+    },
+    'items': {
+        'name': 'text',
+        'author': 'keyword',
+        'genre': 'keyword',
+        'booth_id': 'integer',
+        'booth_name': 'keyword',
+        'booth_area': 'keyword',
+        'price': 'integer',
+    },
+}
+
+# ペイロードの値として期待する型（実データとの照合用）
+EXPECTED_TYPES = {
+    'text': (str,),
+    'keyword': (str,),
+    'integer': (int,),
+}
+
+def text_tokenizer():
+    """テキストインデックスのトークナイザー（日本語を分割できるmultilingualを既定にする）"""
+    return models.TokenizerType(os.getenv("PAYLOAD_TEXT_TOKENIZER", "multilingual"))
+
+def field_schema(index_type):
+    """インデックスの種類からQdrantのスキーマを作成する"""
+    if index_type == 'text':
+        return models.TextIndexParams(
+            type=models.TextIndexType.TEXT,
+            tokenizer=text_tokenizer(),
+            min_token_len=1,
+            lowercase=True,
+        )
+    if index_type == 'keyword':
+        return models.PayloadSchemaType.KEYWORD
+    if index_type == 'integer':
+        return models.PayloadSchemaType.INTEGER
+    raise ValueError(f"未対応のインデックスの種類です: {index_type}")
+
+def schema_type_name(schema):
+    """コレクション情報のスキーマから種類の名前（text/keyword/integerなど）を取り出す"""
+    data_type = schema.data_type
+    return getattr(data_type, 'value', data_type)
+
+def plan_payload_indexes(client, collection, alias=None):
+    """定義と現在のインデックスを比べ、作成・作り直し・削除が必要なフィールドを返す"""
+    declared = PAYLOAD_INDEXES[alias or collection]
+    existing = {field: schema_type_name(schema)
+                for field, schema in (client.get_collection(collection_name=collection).payload_schema or {}).items()}
+    create = [field for field in declared if field not in existing]
+    recreate = [field for field in declared if field in existing and existing[field] != declared[field]]
+    drop = [field for field in existing if field not in declared]
+    return {'create': create, 'recreate': recreate, 'drop': drop, 'existing': existing}
+
+def ensure_payload_indexes(client, collection, alias=None, drop_unknown=False, dry_run=False):
+    """定義どおりのペイロードインデックスを作成する（種類が違うものは作り直す。drop_unknownなら定義にないものを削除する）"""
+    declared = PAYLOAD_INDEXES[alias or collection]
+    plan = plan_payload_indexes(client, collection, alias)
+    for field in plan['recreate']:
+        print(f"{collection}: {field} のインデックスを作り直します（{plan['existing'][field]} → {declared[field]}）")
+    for field in plan['create']:
+        print(f"{collection}: {field} に{declared[field]}インデックスを作成します")
+    if drop_unknown:
+        for field in plan['drop']:
+            print(f"{collection}: 定義にないインデックス {field} を削除します")
+    if dry_run:
+        return plan
+
+    for field in plan['recreate'] + (plan['drop'] if drop_unknown else []):
+        client.delete_payload_index(collection_name=collection, field_name=field, wait=True)
+    for field in plan['recreate'] + plan['create']:
+        try:
+            client.create_payload_index(
+                collection_name=collection,
+                field_name=field,
+                field_schema=field_schema(declared[field]),
+                wait=True
+            )
+        except Exception as e:
+            print(f"{collection}: {field} のインデックス作成中にエラーが発生しましたが、処理を続行します: {e}")
+    return plan
+
+def verify_payload_indexes(client, collection, alias=None, sample_size=200):
+    """定義したインデックスを実際のペイロードと照合し、問題の一覧を返す
+    （フィールドがない・型が違う・インデックスが1件も対象にしていない・定義にないインデックスがある）"""
+    declared = PAYLOAD_INDEXES[alias or collection]
+    info = client.get_collection(collection_name=collection)
+    schema = info.payload_schema or {}
+    points, _ = client.scroll(collection_name=collection, limit=sample_size, with_payload=True, with_vectors=False)
+
+    problems = []
+    present = Counter()
+    wrong_type = Counter()
+    for point in points:
+        payload = point.payload or {}
+        for field, index_type in declared.items():
+            if payload.get(field) is None:
+                continue
+            present[field] += 1
+            value = payload[field]
+            if isinstance(value, bool) or not isinstance(value, EXPECTED_TYPES[index_type]):
+                wrong_type[field] += 1
+
+    for field, index_type in declared.items():
+        if field not in schema:
+            problems.append(f"{field}: インデックスがありません（{index_type}）")
+        elif schema_type_name(schema[field]) != index_type:
+            problems.append(f"{field}: インデックスの種類が {schema_type_name(schema[field])} です（定義は{index_type}）")
+        elif points and schema[field].points == 0:
+            problems.append(f"{field}: インデックスの対象が0件です")
+        if points and present[field] == 0:
+            problems.append(f"{field}: サンプル{len(points)}件のペイロードに値がありません")
+        elif wrong_type[field]:
+            problems.append(f"{field}: {wrong_type[field]}件の値の型が{index_type}インデックスに合いません")
+    for field in schema:
+        if field not in declared:
+            problems.append(f"{field}: 定義にないインデックスです（ensureで--drop-unknownを指定すると削除します）")
+
+    print(f"{collection}: サンプル{len(points)}件で照合しました")
+    for field, index_type in declared.items():
+        indexed = schema[field].points if field in schema else '-'
+        print(f"  {field:<12} {index_type:<8} 値あり{present[field]:>4}/{len(points)}件  インデックス対象 {indexed}")
+    for problem in problems:
+        print(f"  ※ {problem}")
+    if not problems:
+        print("  問題はありません")
+    return problems
+
+def sample_filters(records, alias, count=3):
+    """実データのペイロードから、ベンチマーク用のフィルター条件を作る（各フィールドで多い値を使う）"""
+    values = {field: Counter() for field in PAYLOAD_INDEXES[alias]}
+    for record in records:
+        for field in values:
+            value = record['payload'].get(field)
+            if value is None or value == '':
+                continue
+            if PAYLOAD_INDEXES[alias][field] == 'text':
+                value = value[:2]
+            values[field][value] += 1
+
+    filters = []
+    for field, counter in values.items():
+        for value, _ in counter.most_common(count):
+            if PAYLOAD_INDEXES[alias][field] == 'text':
+                match = models.MatchText(text=value)
+            else:
+                match = models.MatchValue(value=value)
+            filters.append((f"{field}={value}", models.Filter(must=[
+                models.FieldCondition(key=field, match=match)
+            ])))
+    return filters
+
+def run_filter_benchmark(collection, limit=10, query_count=20):
+    """ペイロードインデックスの有無で、フィルター付き検索・スクロールのレイテンシを比較する。
+    キャッシュ済みのベクトルファイルから、インデックスなし・ありの2つのベンチマーク用コレクションを作る"""
+    from create_vector_db import qdrant
+    from vector_store import iter_vector_records
+    from local_index import default_vector_file
+    from payload_projection import project_records
+    from index_config import load_index_settings, default_search_params
+    from benchmark_index import (
+        BENCH_PREFIX, load_queries, embed_queries, build_bench_collection, percentile,
+    )
+
+    vectors_file = default_vector_file(collection)
+    records = list(project_records(iter_vector_records(vectors_file), collection))
+    if not records:
+        raise ValueError(f"{vectors_file} にレコードがありません")
+    query_vectors = embed_queries(load_queries()[:query_count])
+    filters = sample_filters(records, collection)
+    settings = load_index_settings()
+
+    variants = {
+        'インデックスなし': f"{BENCH_PREFIX}{collection}_filter_plain",
+        'インデックスあり': f"{BENCH_PREFIX}{collection}_filter_indexed",
+    }
+    for label, name in variants.items():
+        seconds = build_bench_collection(qdrant, name, vectors_file, settings, collection=collection,
+                                         payload_indexes=(label == 'インデックスあり'))
+        print(f"{label}: {name} を作成しました（{seconds:.1f}秒）")
+
+    try:
+        print(f"\n{collection}: {len(records)}件, クエリ{len(query_vectors)}件, フィルター{len(filters)}種類")
+        print(f"{'フィルター':<28} {'条件':<16} {'検索p50':>10} {'検索p95':>10} {'スクロールp50':>14}")
+        for filter_label, query_filter in filters:
+            for label, name in variants.items():
+                search_latencies = []
+                for query_vector in query_vectors:
+                    start = time.perf_counter()
+                    qdrant.search(
+                        collection_name=name,
+                        query_vector=query_vector,
+                        query_filter=query_filter,
+                        limit=limit,
+                        search_params=default_search_params(),
+                        with_payload=False
+                    )
+                    search_latencies.append((time.perf_counter() - start) * 1000)
+                scroll_latencies = []
+                for _ in range(len(query_vectors)):
+                    start = time.perf_counter()
+                    qdrant.scroll(collection_name=name, scroll_filter=query_filter, limit=limit,
+                                  with_payload=False, with_vectors=False)
+                    scroll_latencies.append((time.perf_counter() - start) * 1000)
+                print(f"{filter_label[:28]:<28} {label:<16} {percentile(search_latencies, 50):>8.2f}ms "
+                      f"{percentile(search_latencies, 95):>8.2f}ms {percentile(scroll_latencies, 50):>12.2f}ms")
+    finally:
+        for name in variants.values():
+            qdrant.delete_collection(collection_name=name)
+
+def main():
+    parser = argparse.ArgumentParser(description='Qdrantのペイロードインデックスを定義どおりに作成・照合します。')
+    parser.add_argument('command', choices=['plan', 'ensure', 'verify', 'benchmark'],
+                        help='plan: 差分を表示 / ensure: 作成 / verify: 実データと照合 / benchmark: インデックスの有無で比較')
+    parser.add_argument('--collection', choices=['booths', 'items', 'all'], default='all',
+                        help='対象のコレクション（エイリアス名）')
+    parser.add_argument('--drop-unknown', action='store_true',
+                        help='定義にないインデックス（以前のpayload.nameなど）を削除する')
+    parser.add_argument('--limit', type=int, default=10, help='ベンチマークの検索件数')
+    args = parser.parse_args()
+
+    from create_vector_db import qdrant
+    collections = ('booths', 'items') if args.collection == 'all' else (args.collection,)
+    for collection in collections:
+        if args.command == 'plan':
+            ensure_payload_indexes(qdrant, collection, drop_unknown=args.drop_unknown, dry_run=True)
+        elif args.command == 'ensure':
+            ensure_payload_indexes(qdrant, collection, drop_unknown=args.drop_unknown)
+            verify_payload_indexes(qdrant, collection)
+        elif args.command == 'verify':
+            verify_payload_indexes(qdrant, collection)
+        else:
+            run_filter_benchmark(collection, args.limit)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import json
+import sqlite3
+import argparse
+from change_tracking import TRACKING_COLUMNS
+
+# Qdrantのペイロードには検索API（bunfree-api）とクライアントが読むフィールドとIDだけを入れる。
+# それ以外の詳細はSQLite（bunfree.db）から取得する（hydrate_*を参照）。
+
+# ブースのペイロード（位置情報はクライアントの地図表示、twitter/nameはフィルター検索で使う）
+BOOTH_PAYLOAD_FIELDS = (
+    'id', 'name', 'category', 'area', 'area_number', 'map_number',
+    'position_top', 'position_left', 'twitter', 'website_url', 'url', 'description',
+)
+
+# ブースのペイロードに入れる頒布物（検索APIがブースの検索結果としてLLMに渡すフィールド）
+BOOTH_ITEM_FIELDS = ('id', 'name', 'description', 'author', 'price', 'url', 'page_url', 'page_count')
+
+# アイテムのペイロード
+ITEM_PAYLOAD_FIELDS = (
+    'id', 'booth_id', 'name', 'genre', 'author', 'item_type', 'page_count', 'price',
+    'url', 'page_url', 'description', 'booth_name', 'booth_area', 'booth_area_number',
+)
+
+# アイテムのペイロードに入れる所属ブースの情報（クライアントが地図のマーカー・ブースの詳細・お気に入りに表示する）
+ITEM_BOOTH_FIELDS = (
+    'id', 'name', 'area', 'area_number', 'map_number',
+    'position_top', 'position_left', 'twitter', 'url', 'description',
+)
+
+def project(row, fields):
+    """行（dictまたはsqlite3.Row）から指定したフィールドだけを取り出す"""
+    row = dict(row)
+    return {field: row[field] for field in fields if field in row}
+
+def project_booth_payload(payload):
+    """ブースのペイロードを検索用の最小限のフィールドに絞る（既に絞ったものを渡しても同じ結果になる）"""
+    projected = project(payload, BOOTH_PAYLOAD_FIELDS)
+    projected['items'] = [project(item, BOOTH_ITEM_FIELDS) for item in payload.get('items') or []]
+    return projected
+
+def project_item_payload(payload):
+    """アイテムのペイロードを検索用の最小限のフィールドに絞る（既に絞ったものを渡しても同じ結果になる）"""
+    projected = project(payload, ITEM_PAYLOAD_FIELDS)
+    if payload.get('booth_details'):
+        projected['booth_details'] = project(payload['booth_details'], ITEM_BOOTH_FIELDS)
+    return projected
+
+# コレクションごとのペイロードの絞り込み関数
+PAYLOAD_PROJECTIONS = {
+    'booths': project_booth_payload,
+    'items': project_item_payload,
+}
+
+def project_records(records, collection):
+    """ベクトルのレコードのペイロードを絞り込みながら返す（旧形式のキャッシュを読むとき用）"""
+    projection = PAYLOAD_PROJECTIONS[collection]
+    for record in records:
+        yield {**record, 'payload': projection(record['payload'])}
+
+def fetch_rows_by_ids(conn, table, ids):
+    """指定したIDの行をまとめて取得する（{id: dict}。変更追跡用のカラムは除く）"""
+    rows = {}
+    ids = list(ids)
+    # SQLiteのプレースホルダ数の上限を超えないように分割する
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i+500]
+        placeholders = ','.join('?' * len(chunk))
+        cursor = conn.execute(f"SELECT * FROM {table} WHERE id IN ({placeholders})", chunk)
+        for row in cursor.fetchall():
+            rows[row['id']] = {k: v for k, v in dict(row).items() if k not in TRACKING_COLUMNS}
+    return rows
+
+def hydrate_booths(conn, payloads):
+    """ブースのペイロードにSQLiteの全カラムと全頒布物を補完する"""
+    booth_ids = [payload['id'] for payload in payloads]
+    booths = fetch_rows_by_ids(conn, 'booths', booth_ids)
+    items_by_booth = {booth_id: [] for booth_id in booth_ids}
+    for i in range(0, len(booth_ids), 500):
+        chunk = booth_ids[i:i+500]
+        placeholders = ','.join('?' * len(chunk))
+        cursor = conn.execute(
+            f"SELECT * FROM items WHERE booth_id IN ({placeholders}) ORDER BY id", chunk)
+        for row in cursor.fetchall():
+            items_by_booth[row['booth_id']].append(
+                {k: v for k, v in dict(row).items() if k not in TRACKING_COLUMNS})
+    return [
+        {**payload, **booths.get(payload['id'], {}), 'items': items_by_booth.get(payload['id'], [])}
+        for payload in payloads
+    ]
+
+def hydrate_items(conn, payloads):
+    """アイテムのペイロードにSQLiteの全カラムと所属ブースの全カラムを補完する"""
+    items = fetch_rows_by_ids(conn, 'items', [payload['id'] for payload in payloads])
+    booths = fetch_rows_by_ids(conn, 'booths', {payload['booth_id'] for payload in payloads})
+    hydrated = []
+    for payload in payloads:
+        full = {**payload, **items.get(payload['id'], {})}
+        if payload['booth_id'] in booths:
+            full['booth_details'] = booths[payload['booth_id']]
+        hydrated.append(full)
+    return hydrated
+
+# コレクションごとの補完関数
+PAYLOAD_HYDRATORS = {
+    'booths': hydrate_booths,
+    'items': hydrate_items,
+}
+
+def payload_bytes(payload):
+    """ペイロードのJSONのバイト数"""
+    return len(json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+
+def measure_payloads(conn, limit=10):
+    """SQLiteの全データから、絞り込み前後のペイロードの合計サイズと検索結果1回分のサイズを比較する"""
+    booths = [dict(row) for row in conn.execute("SELECT * FROM booths ORDER BY id")]
+    items = [dict(row) for row in conn.execute('''
+        SELECT i.*, b.name as booth_name, b.area as booth_area, b.area_number as booth_area_number
+        FROM items i JOIN booths b ON i.booth_id = b.id ORDER BY i.id
+    ''')]
+    booths_by_id = {booth['id']: booth for booth in booths}
+    items_by_booth = {}
+    for item in items:
+        items_by_booth.setdefault(item['booth_id'], []).append(item)
+
+    # 絞り込み前: ブースには全頒布物、アイテムにはブースの全カラムを入れていた
+    full_payloads = {
+        'booths': [{**booth, 'items': items_by_booth.get(booth['id'], [])} for booth in booths],
+        'items': [{**item, 'booth_details': booths_by_id.get(item['booth_id'])} for item in items],
+    }
+
+    print(f"{'コレクション':<10} {'件数':>7} {'変更前合計':>12} {'変更後合計':>12} "
+          f"{'変更前/件':>10} {'変更後/件':>10} {f'検索{limit}件(前→後)':>20}")
+    for collection, payloads in full_payloads.items():
+        if not payloads:
+            continue
+        before = sum(payload_bytes(payload) for payload in payloads)
+        after = sum(payload_bytes(PAYLOAD_PROJECTIONS[collection](payload)) for payload in payloads)
+        count = len(payloads)
+        print(f"{collection:<10} {count:>7} {before / 1024 / 1024:>10.1f}MB {after / 1024 / 1024:>10.1f}MB "
+              f"{before / count:>9.0f}B {after / count:>9.0f}B "
+              f"{before / count * limit / 1024:>8.1f}KB→{after / count * limit / 1024:.1f}KB")
+
+def measure_collection(qdrant, collection, sample=1000):
+    """Qdrantのコレクションに実際に入っているペイロードのサイズを計測する（変更前後の比較用）"""
+    points, _ = qdrant.scroll(collection_name=collection, limit=sample, with_payload=True, with_vectors=False)
+    if not points:
+        print(f"{collection}: ポイントがありません")
+        return
+    sizes = [payload_bytes(point.payload) for point in points]
+    count = qdrant.count(collection_name=collection, exact=True).count
+    average = sum(sizes) / len(sizes)
+    print(f"{collection}: {count}件, ペイロード平均{average:.0f}B（{len(sizes)}件から計測）, "
+          f"推定合計{average * count / 1024 / 1024:.1f}MB")
+
+def main():
+    parser = argparse.ArgumentParser(description='ペイロードの絞り込み前後のサイズを比較します。')
+    parser.add_argument('--db', default='bunfree.db', help='SQLiteデータベースのパス')
+    parser.add_argument('--limit', type=int, default=10, help='検索結果1回分のサイズを見積もる件数')
+    parser.add_argument('--live', action='store_true',
+                        help='Qdrantのコレクションに入っている現在のペイロードのサイズも計測する')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    conn.row_factory = sqlite3.Row
+    measure_payloads(conn, args.limit)
+    conn.close()
+
+    if args.live:
+        from create_vector_db import qdrant
+        for collection in PAYLOAD_PROJECTIONS:
+            measure_collection(qdrant, collection)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import os
+import re
+import time
+import array
+import sqlite3
+import threading
+import unicodedata
+
+from lru_cache import LRUCache
+
+# 検索クエリのベクトルのキャッシュ。
+#   1段目: プロセス内のLRU（QUERY_CACHE_SIZE件）
+#   2段目: SQLiteの永続キャッシュ（QUERY_CACHE_DB、"none"で無効）。CLIのようにプロセスが毎回終わる場合にも効く
+# キーは（モデル, 次元数, 正規化したクエリ）なので、モデルや次元数を変えても古いベクトルは使われない。
+
+DEFAULT_CACHE_DB = os.path.join("cache", "query_embeddings.db")
+
+def normalize_query(query):
+    """クエリを正規化する（全角・半角の統一、大文字小文字、前後と連続する空白）"""
+    query = unicodedata.normalize('NFKC', query or '')
+    return re.sub(r'\s+', ' ', query).strip().lower()
+
+def pack_vector(vector):
+    """ベクトルをfloat32のバイト列にする"""
+    return array.array('f', vector).tobytes()
+
+def unpack_vector(blob):
+    """float32のバイト列をベクトルに戻す"""
+    vector = array.array('f')
+    vector.frombytes(blob)
+    return vector.tolist()
+
+class QueryEmbeddingCache:
+    """検索クエリのベクトルをキャッシュし、同じクエリではVoyage APIを呼ばない"""
+
+    def __init__(self, voyage, model, dimension, maxsize=None, db_path=None):
+        self.voyage = voyage
+        self.model = model
+        self.dimension = dimension
+        self.memory = LRUCache(maxsize or int(os.getenv("QUERY_CACHE_SIZE", "1024")))
+        self.lock = threading.Lock()
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.api_seconds = 0.0
+
+        db_path = db_path or os.getenv("QUERY_CACHE_DB", DEFAULT_CACHE_DB)
+        self.conn = None
+        if db_path and db_path.lower() != "none":
+            directory = os.path.dirname(db_path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            self.conn = sqlite3.connect(db_path, check_same_thread=False)
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS query_embeddings (
+                    model TEXT NOT NULL,
+                    dimension INTEGER NOT NULL,
+                    query TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (model, dimension, query)
+                )
+            ''')
+            self.conn.commit()
+
+    def load_persistent(self, query):
+        """永続キャッシュからベクトルを取得する"""
+        if self.conn is None:
+            return None
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT vector FROM query_embeddings WHERE model = ? AND dimension = ? AND query = ?",
+                (self.model, self.dimension, query)
+            ).fetchone()
+        return unpack_vector(row[0]) if row else None
+
+    def save_persistent(self, query, vector):
+        """永続キャッシュにベクトルを保存する"""
+        if self.conn is None:
+            return
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO query_embeddings (model, dimension, query, vector, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (self.model, self.dimension, query, pack_vector(vector), time.time())
+            )
+            self.conn.commit()
+
+    def embed(self, query):
+        """クエリのベクトルを返す（キャッシュになければVoyage APIでベクトル化して保存する）"""
+        key = normalize_query(query)
+        vector = self.memory.get(key)
+        if vector is not None:
+            self.memory_hits += 1
+            return vector
+
+        vector = self.load_persistent(key)
+        if vector is not None:
+            self.persistent_hits += 1
+            self.memory.put(key, vector)
+            return vector
+
+        self.misses += 1
+        start = time.perf_counter()
+        vector = self.voyage.embed(
+            texts=[key],
+            model=self.model,
+            input_type="query",
+            output_dimension=self.dimension,
+            truncation=True
+        ).embeddings[0]
+        self.api_seconds += time.perf_counter() - start
+        self.memory.put(key, vector)
+        self.save_persistent(key, vector)
+        return vector
+
+    def embed_many(self, queries, batch_size=128):
+        """複数のクエリのベクトルをまとめて返す（キャッシュにないものだけを1回のAPI呼び出しでベクトル化する）"""
+        keys = [normalize_query(query) for query in queries]
+        vectors = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            vector = self.memory.get(key)
+            if vector is not None:
+                self.memory_hits += 1
+            else:
+                vector = self.load_persistent(key)
+                if vector is not None:
+                    self.persistent_hits += 1
+                    self.memory.put(key, vector)
+            if vector is None:
+                missing.append(key)
+            else:
+                vectors[key] = vector
+
+        for i in range(0, len(missing), batch_size):
+            batch = missing[i:i+batch_size]
+            self.misses += len(batch)
+            start = time.perf_counter()
+            embeddings = self.voyage.embed(
+                texts=batch,
+                model=self.model,
+                input_type="query",
+                output_dimension=self.dimension,
+                truncation=True
+            ).embeddings
+            self.api_seconds += time.perf_counter() - start
+            for key, vector in zip(batch, embeddings):
+                vectors[key] = vector
+                self.memory.put(key, vector)
+                self.save_persistent(key, vector)
+        return [vectors[key] for key in keys]
+
+    def stats(self):
+        """キャッシュのヒット率などを返す"""
+        total = self.memory_hits + self.persistent_hits + self.misses
+        return {
+            'requests': total,
+            'memory_hits': self.memory_hits,
+            'persistent_hits': self.persistent_hits,
+            'misses': self.misses,
+            'hit_rate': (self.memory_hits + self.persistent_hits) / total if total else 0.0,
+            'api_ms_per_miss': self.api_seconds * 1000 / self.misses if self.misses else 0.0,
+        }
+
+    def describe_stats(self):
+        """キャッシュの統計を1行の文字列で返す"""
+        stats = self.stats()
+        return (f"クエリキャッシュ: {stats['requests']}件中 メモリ{stats['memory_hits']}件 / "
+                f"永続{stats['persistent_hits']}件ヒット（ヒット率{stats['hit_rate']:.0%}）, "
+                f"API呼び出し{stats['misses']}件（平均{stats['api_ms_per_miss']:.0f}ms）")
+
+    def close(self):
+        """永続キャッシュの接続を閉じる"""
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
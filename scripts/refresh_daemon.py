@@ -0,0 +1,253 @@
+import os
+import time
+import json
+import signal
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from crawl_engine import DEFAULT_CONCURRENCY, DEFAULT_RATE
+from tombstones import TOMBSTONE_MAX_RATIO
+
+# 常駐して、ブース・アイテムの差分更新（クロール → 差分 → ベクトル化 → アップサート）を一定間隔で繰り返すデーモン。
+#   item_updater.py・website_url_patch.py・update_qdrant_website_urls.py を毎回別々に実行する代わりに、
+#   SQLite・Qdrantの接続とスクレイパーのセッション（スレッドプール）を保ったまま使い回し、
+#   既存アイテムの一覧（URL → ID・名前）はメモリに持って、毎回itemsテーブルを読み直さない
+#   （REFRESH_FULL_RELOAD_EVERY回に1回だけSQLiteから読み直す）。
+#   WebサイトURLの修正はアイテムの確認と同じブースページで行い、Qdrantへは保存した行だけを差分同期で反映する。
+#   GET /health  … 最後に成功したサイクルからの遅れ。間隔の2倍を超えたら503を返す
+#   GET /metrics … サイクルの回数・所要時間・件数などのメトリクス（Prometheusのテキスト形式）
+#   SIGTERM・SIGINTを受け取ると、処理中のブースを反映・同期してから終了する（残りは次の起動時に再開する）
+
+DEFAULT_INTERVAL = float(os.getenv("REFRESH_INTERVAL", "3600"))
+FULL_RELOAD_EVERY = int(os.getenv("REFRESH_FULL_RELOAD_EVERY", "24"))
+DEFAULT_PORT = 8791
+
+# サイクルごとの件数のうち、累計をメトリクスに出すもの
+SUMMARY_COUNTERS = ('new_items', 'refreshed_items', 'website_urls', 'reembedded', 'payload_updated',
+                    'deleted_booths', 'deleted_items', 'errors')
+
+class RefreshDaemon:
+    """ItemUpdaterを保持したまま、差分更新のサイクルを一定間隔で実行する"""
+
+    def __init__(self, interval=DEFAULT_INTERVAL, concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE,
+                 full_reload_every=FULL_RELOAD_EVERY, options=None, host='127.0.0.1', port=DEFAULT_PORT):
+        from item_updater import ItemUpdater
+        self.updater = ItemUpdater(concurrency=concurrency, rate=rate)
+        self.interval = interval
+        self.full_reload_every = full_reload_every
+        # check_and_update_itemsに渡す引数（refresh_existing, remove_missing, list_url, max_delete_ratio）
+        self.options = options or {}
+        self.stop_event = threading.Event()
+        self.started_at = time.time()
+        self.state = {
+            'cycles': 0,
+            'failed_cycles': 0,
+            'running': False,
+            'last_cycle_started': None,
+            'last_cycle_seconds': None,
+            'last_success_started': None,
+            'last_success_finished': None,
+            'next_cycle_at': None,
+            'last_summary': {},
+            'last_error': None,
+            'totals': {name: 0 for name in SUMMARY_COUNTERS},
+        }
+        self.server = ThreadingHTTPServer((host, port), self.make_handler()) if port is not None else None
+
+    def reload_known_items(self):
+        """既存アイテムの一覧をSQLiteから読み直す"""
+        self.updater.known_items = self.updater.fetch_existing_items_by_booth()
+        print(f"既存アイテムの一覧を読み込みました（{self.known_item_count()}件）")
+
+    def known_item_count(self):
+        known = self.updater.known_items or {}
+        return sum(len(items) for items in known.values())
+
+    def run_cycle(self):
+        """差分更新を1回実行する"""
+        state = self.state
+        cycle = state['cycles'] + 1
+        if self.updater.known_items is None or (self.full_reload_every and cycle % self.full_reload_every == 0):
+            self.reload_known_items()
+
+        print(f"\n===== サイクル{cycle}を開始します =====")
+        started = time.time()
+        state['running'] = True
+        state['last_cycle_started'] = started
+        try:
+            summary = self.updater.check_and_update_items(force_delete=False, **self.options)
+        except Exception as e:
+            print(f"サイクル{cycle}でエラーが発生しました: {e}")
+            state['failed_cycles'] += 1
+            state['last_error'] = str(e)
+            # メモリ上の一覧がSQLiteとずれている可能性があるので、次のサイクルで読み直す
+            self.updater.known_items = None
+            summary = None
+        finally:
+            state['running'] = False
+            state['cycles'] = cycle
+            state['last_cycle_seconds'] = time.time() - started
+
+        if summary is not None:
+            state['last_summary'] = summary
+            for name in SUMMARY_COUNTERS:
+                state['totals'][name] += summary[name]
+            # 途中で止めたサイクルは、すべてのブースを確認できていないので成功として扱わない
+            if not summary['interrupted']:
+                state['last_success_started'] = started
+                state['last_success_finished'] = time.time()
+        print(f"サイクル{cycle}: {state['last_cycle_seconds']:.1f}秒（遅れ{self.lag_seconds():.0f}秒）")
+        return summary
+
+    def lag_seconds(self):
+        """サイトの変更が反映されるまでの遅れ（最後に成功したサイクルを始めてからの秒数。成功がなければ起動からの秒数）"""
+        return time.time() - (self.state['last_success_started'] or self.started_at)
+
+    def health(self):
+        """稼働状況を返す。遅れが間隔の2倍（＋前回のサイクルの所要時間）を超えていたら status=stale"""
+        lag = self.lag_seconds()
+        if self.stop_event.is_set():
+            status = 'stopping'
+        elif lag > self.interval * 2 + (self.state['last_cycle_seconds'] or 0):
+            status = 'stale'
+        else:
+            status = 'ok'
+        return {
+            'status': status,
+            'lag_seconds': round(lag, 1),
+            'interval_seconds': self.interval,
+            'running': self.state['running'],
+            'cycles': self.state['cycles'],
+            'failed_cycles': self.state['failed_cycles'],
+            'last_cycle_seconds': self.state['last_cycle_seconds'],
+            'next_cycle_in_seconds': (round(max(0.0, self.state['next_cycle_at'] - time.time()), 1)
+                                      if self.state['next_cycle_at'] and not self.state['running'] else None),
+            'last_summary': self.state['last_summary'],
+            'last_error': self.state['last_error'],
+        }
+
+    def metrics_text(self):
+        """メトリクスをPrometheusのテキスト形式で返す"""
+        state = self.state
+        engine_stats = self.updater.engine.stats
+        metrics = [
+            ('bunfree_refresh_cycles_total', 'counter', state['cycles']),
+            ('bunfree_refresh_failed_cycles_total', 'counter', state['failed_cycles']),
+            ('bunfree_refresh_running', 'gauge', int(state['running'])),
+            ('bunfree_refresh_lag_seconds', 'gauge', round(self.lag_seconds(), 3)),
+            ('bunfree_refresh_last_cycle_seconds', 'gauge', round(state['last_cycle_seconds'] or 0, 3)),
+            ('bunfree_refresh_known_items', 'gauge', self.known_item_count()),
+            ('bunfree_crawl_requests_total', 'counter', engine_stats['requests']),
+            ('bunfree_crawl_retries_total', 'counter', engine_stats['retries']),
+            ('bunfree_crawl_failures_total', 'counter', engine_stats['failures']),
+        ]
+        metrics += [(f"bunfree_refresh_{name}_total", 'counter', value) for name, value in state['totals'].items()]
+        lines = []
+        for name, metric_type, value in metrics:
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.append(f"{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def make_handler(self):
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def send_body(self, status, data, content_type):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path == '/health':
+                    health = daemon.health()
+                    self.send_body(200 if health['status'] == 'ok' else 503,
+                                   json.dumps(health, ensure_ascii=False).encode('utf-8'),
+                                   'application/json; charset=utf-8')
+                elif self.path == '/metrics':
+                    self.send_body(200, daemon.metrics_text().encode('utf-8'), 'text/plain; version=0.0.4')
+                else:
+                    self.send_body(404, b'{"error": "not found"}', 'application/json; charset=utf-8')
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def request_stop(self, signum=None, frame=None):
+        """停止を受け付ける（処理中のブースを反映してから終了する）。2回目のCtrl+Cはすぐに中断する"""
+        if self.stop_event.is_set():
+            raise KeyboardInterrupt
+        print("\n停止を受け付けました。処理中のブースを反映してから終了します")
+        self.stop_event.set()
+        self.updater.engine.stop()
+
+    def run(self, once=False):
+        """サイクルを一定間隔で繰り返す（前のサイクルの開始からintervalごと。長引いた場合はすぐに次を始める）"""
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+        if self.server:
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+            host, port = self.server.server_address[:2]
+            print(f"ヘルスチェック: http://{host}:{port}/health  メトリクス: http://{host}:{port}/metrics")
+        print(f"{self.interval:.0f}秒ごとに差分更新を実行します")
+        try:
+            while not self.stop_event.is_set():
+                started = time.monotonic()
+                self.run_cycle()
+                if once:
+                    break
+                wait = max(0.0, self.interval - (time.monotonic() - started))
+                self.state['next_cycle_at'] = time.time() + wait
+                if not self.stop_event.is_set():
+                    print(f"次のサイクルまで{wait:.0f}秒待ちます")
+                self.stop_event.wait(wait)
+        finally:
+            self.close()
+
+    def close(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        self.updater.close()
+        print(f"終了しました（サイクル{self.state['cycles']}回, 失敗{self.state['failed_cycles']}回）")
+
+def main():
+    from item_updater import BOOTH_LIST_URL
+    parser = argparse.ArgumentParser(
+        description='常駐して、新しいアイテムの追加・既存アイテムとWebサイトURLの更新・消えたものの削除を一定間隔で行います。')
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL, help='サイクルの間隔（秒）')
+    parser.add_argument('--once', action='store_true', help='1回だけ実行して終了する')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help='ページを同時に取得する数')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE, help='1秒あたりのリクエスト数の上限（0で無制限）')
+    parser.add_argument('--full-reload-every', type=int, default=FULL_RELOAD_EVERY,
+                        help='この回数ごとに既存アイテムの一覧をSQLiteから読み直す（0で読み直さない）')
+    parser.add_argument('--new-only', action='store_true', help='既存のアイテムのページは読み直さない')
+    parser.add_argument('--keep-missing', action='store_true', help='サイトから消えたブース・アイテムを削除しない')
+    parser.add_argument('--list-url', default=BOOTH_LIST_URL, help='掲載中のブースの一覧ページ')
+    parser.add_argument('--max-delete-ratio', type=float, default=TOMBSTONE_MAX_RATIO,
+                        help='これより多くの割合が消えている場合は削除しない')
+    parser.add_argument('--host', default='127.0.0.1', help='ヘルスチェック・メトリクスを待ち受けるアドレス')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='ヘルスチェック・メトリクスを待ち受けるポート')
+    args = parser.parse_args()
+
+    daemon = RefreshDaemon(
+        interval=args.interval,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        full_reload_every=args.full_reload_every,
+        options={
+            'refresh_existing': not args.new_only,
+            'remove_missing': not args.keep_missing,
+            'list_url': args.list_url,
+            'max_delete_ratio': args.max_delete_ratio,
+        },
+        host=args.host,
+        port=args.port,
+    )
+    daemon.run(once=args.once)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import os
+import copy
+import json
+import time
+import threading
+
+from lru_cache import LRUCache
+from data_version import get_data_version
+from query_embedding_cache import normalize_query
+
+# 検索結果のキャッシュ。キーは（検索タイプ, コレクション, 正規化したクエリ, フィルター, 件数）。
+# Qdrantに記録したデータバージョン（data_version.py）が変わったらキャッシュをすべて捨てる。
+# バージョンの確認はVERSION_CHECK_INTERVAL秒に1回だけ行う。
+
+VERSION_CHECK_INTERVAL = float(os.getenv("SEARCH_CACHE_VERSION_CHECK_INTERVAL", "30"))
+
+def make_cache_key(query_type, collection, query, query_filter=None, limit=10):
+    """キャッシュのキーを作成する（フィルターはキーの順序によらず同じキーになる）"""
+    filter_key = json.dumps(query_filter, sort_keys=True, ensure_ascii=False) if query_filter else ""
+    return (query_type, collection, normalize_query(query), filter_key, limit)
+
+class SearchResultCache:
+    """検索結果をデータバージョンごとにキャッシュする"""
+
+    def __init__(self, qdrant, maxsize=None, check_interval=VERSION_CHECK_INTERVAL, dependent_caches=()):
+        self.qdrant = qdrant
+        # データバージョンが変わったときに一緒に捨てるキャッシュ（補完済みのブースなど）
+        self.dependent_caches = list(dependent_caches)
+        self.entries = LRUCache(maxsize or int(os.getenv("SEARCH_CACHE_SIZE", "1024")))
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.data_version = None
+        self.checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.saved_ms = 0.0
+
+    def current_version(self):
+        """データバージョンを確認し、変わっていればキャッシュを捨てる"""
+        now = time.monotonic()
+        with self.lock:
+            if self.data_version is not None and now - self.checked_at < self.check_interval:
+                return self.data_version
+            self.checked_at = now
+        try:
+            version = get_data_version(self.qdrant)
+        except Exception as e:
+            # バージョンが取れない間はキャッシュを使わない
+            print(f"データバージョンの取得に失敗しました（キャッシュを使いません）: {e}")
+            self.entries.clear()
+            with self.lock:
+                self.data_version = None
+            return None
+        with self.lock:
+            if self.data_version is not None and version != self.data_version:
+                self.entries.clear()
+                for cache in self.dependent_caches:
+                    cache.clear()
+                self.invalidations += 1
+            self.data_version = version
+        return version
+
+    def get_or_search(self, key, search_func):
+        """キャッシュにあれば結果のコピーを返し、なければsearch_funcを実行して保存する"""
+        version = self.current_version()
+        if version is not None:
+            entry = self.entries.get(key)
+            if entry is not None and entry['version'] == version:
+                self.hits += 1
+                self.saved_ms += entry['elapsed_ms']
+                return copy.deepcopy(entry['results'])
+
+        self.misses += 1
+        start = time.perf_counter()
+        results = search_func()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if version is not None:
+            self.entries.put(key, {
+                'version': version,
+                'results': copy.deepcopy(results),
+                'elapsed_ms': elapsed_ms,
+            })
+        return results
+
+    def stats(self):
+        """ヒット率と、キャッシュで省けた検索時間の合計を返す"""
+        total = self.hits + self.misses
+        return {
+            'requests': total,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'saved_ms': self.saved_ms,
+            'invalidations': self.invalidations,
+            'data_version': self.data_version,
+            'size': len(self.entries),
+        }
+
+    def describe_stats(self):
+        """統計を1行の文字列で返す"""
+        stats = self.stats()
+        return (f"検索結果キャッシュ: {stats['requests']}件中{stats['hits']}件ヒット（ヒット率{stats['hit_rate']:.0%}）, "
+                f"省けた時間{stats['saved_ms']:.0f}ms, データバージョン{stats['data_version']}")
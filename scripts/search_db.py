@@ -1,23 +1,42 @@
 import os
 import json
-from dotenv import load_dotenv
-from qdrant_client import QdrantClient
-from qdrant_client.http import models
-import voyageai
 import sqlite3
+import sys
+import time
+import concurrent.futures
+from index_config import default_search_params
+from db_pool import ReadOnlyConnectionPool
+from lru_cache import LRUCache
+from payload_projection import hydrate_booths, hydrate_items, fetch_rows_by_ids
+from query_embedding_cache import QueryEmbeddingCache
+from search_cache import SearchResultCache, make_cache_key
+from local_index import get_local_index, local_search_enabled
+from neighbor_tables import NeighborTable
+from lexical_index import get_lexical_index, rrf_fuse
+from payload_indexes import PAYLOAD_INDEXES
+from clients import Lazy, qdrant, voyage, models
 
-# 環境変数の読み込み
-load_dotenv()
+# QdrantとVoyageAIのクライアントは最初に使うときに作られる（clients.py）
 
-# API KEYの取得
-QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
-VOYAGE_API_KEY = os.getenv("VOYAGE_API_KEY")
+# 使用するモデルとディメンションの設定（コレクション作成時と同じものを使う）
+EMBEDDING_MODEL = "voyage-3-large"
+EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", "2048"))
 
-# Qdrantクライアントの初期化
-qdrant = QdrantClient(api_key=QDRANT_API_KEY)
+# 検索クエリのベクトルのキャッシュ（同じクエリではAPIを呼ばない）
+query_cache = Lazy(lambda: QueryEmbeddingCache(voyage, EMBEDDING_MODEL, EMBEDDING_DIMENSION), "QueryEmbeddingCache")
 
-# VoyageAIクライアントの初期化
-voyage = voyageai.Client(api_key=VOYAGE_API_KEY)
+# 検索結果の補完に使う読み取り専用の接続プールと、補完済みブースのキャッシュ
+read_pool = ReadOnlyConnectionPool('bunfree.db')
+booth_cache = LRUCache(maxsize=int(os.getenv("BOOTH_CACHE_SIZE", "2048")))
+
+# 検索結果のキャッシュ（アップロードや同期でデータバージョンが変わると無効になる）
+result_cache = SearchResultCache(qdrant, dependent_caches=[booth_cache])
+
+# ブースとアイテムを同時に検索するためのスレッド
+combined_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+
+# 事前計算した「似ているブース・アイテム」の近傍テーブル（neighbor_tables.py）
+neighbor_table = Lazy(NeighborTable, "NeighborTable")
 
 def get_database_connection():
     """データベース接続を取得する"""
@@ -27,67 +46,248 @@ def get_database_connection():
 
 def get_booth_items(booth_id):
     """指定したブースのアイテムを取得する"""
-    conn = get_database_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT * FROM items WHERE booth_id = ?
-    ''', (booth_id,))
-    items = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return items
+    with read_pool.connection() as conn:
+        cursor = conn.execute('''
+            SELECT * FROM items WHERE booth_id = ? ORDER BY id
+        ''', (booth_id,))
+        return [dict(row) for row in cursor.fetchall()]
 
 def get_booth_by_id(booth_id):
     """指定したIDのブースを取得する"""
-    conn = get_database_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT * FROM booths WHERE id = ?
-    ''', (booth_id,))
-    booth = dict(cursor.fetchone()) if cursor.fetchone() else None
-    conn.close()
-    return booth
-
-def search_by_vector(query, collection="booths", limit=10):
-    """ベクトル検索を実行する"""
-    # クエリをベクトル化
-    query_vector = voyage.embed(texts=[query], model="voyage-large-2").embeddings[0]
-    
-    # ベクトル検索の実行
-    search_result = qdrant.search(
+    with read_pool.connection() as conn:
+        row = conn.execute('''
+            SELECT * FROM booths WHERE id = ?
+        ''', (booth_id,)).fetchone()
+        return dict(row) if row else None
+
+def hydrate_results(collection, payloads):
+    """検索結果のペイロードにSQLiteの詳細を補完する（1ページにつき接続1つ・IN句のクエリでまとめて取得）。
+    ブースは補完済みのものをLRUキャッシュから返す"""
+    if collection == "booths":
+        booths = {payload['id']: booth_cache.get(payload['id']) for payload in payloads}
+        missing = [payload for payload in payloads if booths[payload['id']] is None]
+        if missing:
+            with read_pool.connection() as conn:
+                for booth in hydrate_booths(conn, missing):
+                    booth_cache.put(booth['id'], booth)
+                    booths[booth['id']] = booth
+        return [{**payload, **(booths[payload['id']] or {})} for payload in payloads]
+
+    with read_pool.connection() as conn:
+        return hydrate_items(conn, payloads)
+
+def hydrate_results_per_hit(collection, payloads):
+    """以前の補完方法（1件ごとに接続を開いて取得する）。--timingでの比較用"""
+    hydrated = []
+    for payload in payloads:
+        conn = get_database_connection()
+        item = dict(payload)
+        if collection == "booths":
+            item['items'] = [dict(row) for row in conn.execute(
+                "SELECT * FROM items WHERE booth_id = ? ORDER BY id", (item['id'],))]
+        elif 'booth_id' in item:
+            row = conn.execute("SELECT * FROM booths WHERE id = ?", (item['booth_id'],)).fetchone()
+            if row:
+                item['booth_details'] = dict(row)
+        conn.close()
+        hydrated.append(item)
+    return hydrated
+
+def search_vector_hits(collection, query_vector, limit):
+    """ベクトルでコレクションを検索する（LOCAL_INDEX=trueならQdrantに問い合わせずメモリ上で全件探索）"""
+    if local_search_enabled():
+        return get_local_index(collection).search(query_vector, limit)
+    return qdrant.search(
         collection_name=collection,
         query_vector=query_vector,
-        limit=limit
+        limit=limit,
+        search_params=default_search_params()  # hnsw_efや量子化時の再スコアリング（index_config.py参照）
     )
+
+def search_by_vector(query, collection="booths", limit=10, timing=None):
+    """ベクトル検索を実行する（timingにdictを渡すと各段階の所要時間(ms)を記録する）"""
+    start = time.perf_counter()
+    # クエリをベクトル化（キャッシュにあればAPIを呼ばない）
+    query_vector = query_cache.embed(query)
+    embedded = time.perf_counter()
     
-    results = []
-    for hit in search_result:
-        item = hit.payload
+    # ベクトル検索の実行
+    search_result = search_vector_hits(collection, query_vector, limit)
+    searched = time.perf_counter()
+    
+    # ブースは全アイテム、アイテムは所属ブースの全カラムをSQLiteから補完する
+    results = hydrate_results(collection, [hit.payload for hit in search_result])
+    for item, hit in zip(results, search_result):
         item['score'] = hit.score
-        
-        # ブースコレクションの場合、アイテム情報を追加
-        if collection == "booths":
-            items = get_booth_items(item['id'])
-            item['items'] = items
-        
-        # アイテムコレクションの場合、ブース情報を追加（既に含まれている場合は不要）
-        if collection == "items" and 'booth_id' in item:
-            if 'booth_name' not in item:  # 結合クエリで取得していない場合
-                booth = get_booth_by_id(item['booth_id'])
-                if booth:
-                    item['booth'] = booth
-        
-        results.append(item)
     
+    if timing is not None:
+        timing['embed_ms'] = (embedded - start) * 1000
+        timing['search_ms'] = (searched - embedded) * 1000
+        timing['hydrate_ms'] = (time.perf_counter() - searched) * 1000
+        timing['payloads'] = [hit.payload for hit in search_result]
+    return results
+
+def search_combined(query, booth_limit=3, item_limit=3, timing=None):
+    """ブースとアイテムを1回のベクトル化で同時に検索する。
+    戻り値は {'booths': [...], 'items': [...], 'merged': [...]}（mergedはmerge_combined_resultsを参照）"""
+    start = time.perf_counter()
+    query_vector = query_cache.embed(query)
+    embedded = time.perf_counter()
+
+    # 2つのコレクションへの検索を並行して実行する
+    booth_future = combined_executor.submit(search_vector_hits, "booths", query_vector, booth_limit)
+    item_future = combined_executor.submit(search_vector_hits, "items", query_vector, item_limit)
+    booth_hits = booth_future.result()
+    item_hits = item_future.result()
+    searched = time.perf_counter()
+
+    booths = hydrate_results("booths", [hit.payload for hit in booth_hits])
+    for booth, hit in zip(booths, booth_hits):
+        booth['score'] = hit.score
+    items = hydrate_results("items", [hit.payload for hit in item_hits])
+    for item, hit in zip(items, item_hits):
+        item['score'] = hit.score
+
+    if timing is not None:
+        timing['embed_ms'] = (embedded - start) * 1000
+        timing['search_ms'] = (searched - embedded) * 1000
+        timing['hydrate_ms'] = (time.perf_counter() - searched) * 1000
+    return {'booths': booths, 'items': items, 'merged': merge_combined_results(booths, items)}
+
+def merge_combined_results(booths, items):
+    """ブースとアイテムの結果をスコア順の1つのリストにまとめる。
+    ヒットしたブースに属するアイテムは別の結果にせず、そのブースのmatched_itemsに入れる（同じブースが重複しない）"""
+    merged = []
+    booth_entries = {}
+    for booth in booths:
+        entry = {'type': 'booth', 'id': booth['id'], 'score': booth['score'], 'result': booth, 'matched_items': []}
+        booth_entries[booth['id']] = entry
+        merged.append(entry)
+    for item in items:
+        entry = booth_entries.get(item.get('booth_id'))
+        if entry is not None:
+            entry['matched_items'].append(item)
+            entry['score'] = max(entry['score'], item['score'])
+        else:
+            merged.append({'type': 'item', 'id': item['id'], 'score': item['score'], 'result': item})
+    merged.sort(key=lambda entry: -entry['score'])
+    return merged
+
+def search_batch(queries, collection="booths", limit=10, batch_size=64, timing=None):
+    """複数のクエリをまとめてベクトル検索する（ベクトル化はAPI呼び出し1回、検索はQdrantのバッチ検索か行列積1回）。
+    クエリと同じ順で結果のリストを返す。timingにdictを渡すと各段階の所要時間(ms)を記録する"""
+    start = time.perf_counter()
+    query_vectors = query_cache.embed_many(queries)
+    embedded = time.perf_counter()
+
+    if local_search_enabled():
+        pages = get_local_index(collection).search_batch(query_vectors, limit)
+    else:
+        pages = []
+        for i in range(0, len(query_vectors), batch_size):
+            pages.extend(qdrant.search_batch(
+                collection_name=collection,
+                requests=[
+                    models.SearchRequest(
+                        vector=vector,
+                        limit=limit,
+                        params=default_search_params(),
+                        with_payload=True
+                    )
+                    for vector in query_vectors[i:i+batch_size]
+                ]
+            ))
+    searched = time.perf_counter()
+
+    # 全クエリの結果をまとめて1回で補完してから、クエリごとに分け直す
+    hydrated = hydrate_results(collection, [hit.payload for page in pages for hit in page])
+    results = []
+    offset = 0
+    for page in pages:
+        page_results = hydrated[offset:offset + len(page)]
+        for item, hit in zip(page_results, page):
+            item['score'] = hit.score
+        results.append(page_results)
+        offset += len(page)
+
+    if timing is not None:
+        timing['embed_ms'] = (embedded - start) * 1000
+        timing['search_ms'] = (searched - embedded) * 1000
+        timing['hydrate_ms'] = (time.perf_counter() - searched) * 1000
+        timing['total_ms'] = (time.perf_counter() - start) * 1000
+    return results
+
+def print_batch_timing(count, timing):
+    """バッチ検索の各段階の所要時間とスループットを標準エラーに表示する"""
+    total_seconds = timing['total_ms'] / 1000
+    print(f"{count}件のクエリ: ベクトル化 {timing['embed_ms']:.1f}ms, 検索 {timing['search_ms']:.1f}ms, "
+          f"補完 {timing['hydrate_ms']:.1f}ms, 合計 {timing['total_ms']:.1f}ms"
+          f"（{count / total_seconds if total_seconds else 0:.1f} queries/秒）", file=sys.stderr)
+    print(query_cache.describe_stats(), file=sys.stderr)
+
+def search_similar(point_id, collection="booths", limit=10):
+    """指定したブース・アイテムに似たものを返す。
+    neighbor_tables.pyで事前計算した近傍があればそれを使い、なければQdrantのrecommendで検索する"""
+    neighbors = neighbor_table.lookup(collection, point_id, limit)
+    if neighbors is not None:
+        with read_pool.connection() as conn:
+            payloads = fetch_rows_by_ids(conn, collection, [neighbor_id for neighbor_id, _ in neighbors])
+        scored = [(payloads[neighbor_id], score) for neighbor_id, score in neighbors if neighbor_id in payloads]
+    else:
+        hits = qdrant.recommend(
+            collection_name=collection,
+            positive=[point_id],
+            limit=limit,
+            search_params=default_search_params()
+        )
+        scored = [(hit.payload, hit.score) for hit in hits]
+
+    results = hydrate_results(collection, [payload for payload, _ in scored])
+    for item, (_, score) in zip(results, scored):
+        item['score'] = score
+    return results
+
+def search_hybrid(query, collection="booths", limit=10, candidates=50):
+    """ベクトル検索と名前・読み・作者・SNSアカウントの部分一致検索（lexical_index.py）の順位をRRFで統合する。
+    サークル名の一部のように意味では近くならないクエリでも上位に出せる"""
+    query_vector = query_cache.embed(query)
+    if local_search_enabled():
+        vector_hits = get_local_index(collection).search(query_vector, candidates)
+    else:
+        vector_hits = qdrant.search(
+            collection_name=collection,
+            query_vector=query_vector,
+            limit=candidates,
+            search_params=default_search_params(),
+            with_payload=False
+        )
+    with read_pool.connection() as conn:
+        lexical_hits = get_lexical_index(collection, conn).search(query, candidates)
+    fused = rrf_fuse([
+        [hit.id for hit in vector_hits],
+        [doc_id for doc_id, _ in lexical_hits],
+    ])[:limit]
+
+    with read_pool.connection() as conn:
+        rows = fetch_rows_by_ids(conn, collection, [doc_id for doc_id, _ in fused])
+    scored = [(rows[doc_id], score) for doc_id, score in fused if doc_id in rows]
+    results = hydrate_results(collection, [row for row, _ in scored])
+    for item, (_, score) in zip(results, scored):
+        item['score'] = score
     return results
 
 def search_by_text(field, value, collection="booths", limit=10):
     """テキスト検索を実行する"""
-    # フィルター条件の設定
+    # フィルター条件の設定（ペイロードのフィールドはトップレベル。textインデックスのフィールドは部分一致）
+    if PAYLOAD_INDEXES[collection].get(field) == 'text':
+        match = models.MatchText(text=value)
+    else:
+        match = models.MatchValue(value=value)
     filter_condition = models.Filter(
         must=[
             models.FieldCondition(
-                key=f"payload.{field}",
-                match=models.MatchValue(value=value)
+                key=field,
+                match=match
             )
         ]
     )
@@ -99,54 +299,94 @@ def search_by_text(field, value, collection="booths", limit=10):
         limit=limit
     )
     
-    results = []
-    for hit in search_result[0]:
-        item = hit.payload
-        
-        # ブースコレクションの場合、アイテム情報を追加
-        if collection == "booths":
-            items = get_booth_items(item['id'])
-            item['items'] = items
-        
-        # アイテムコレクションの場合、ブース情報を追加（既に含まれている場合は不要）
-        if collection == "items" and 'booth_id' in item:
-            if 'booth_name' not in item:  # 結合クエリで取得していない場合
-                booth = get_booth_by_id(item['booth_id'])
-                if booth:
-                    item['booth'] = booth
-        
-        results.append(item)
-    
-    return results
+    return hydrate_results(collection, [hit.payload for hit in search_result[0]])
+
+def print_timing(collection, timing):
+    """検索の各段階の所要時間と、1件ずつ補完した場合との比較を標準エラーに表示する"""
+    payloads = timing['payloads']
+    opened_before = read_pool.opened
+    start = time.perf_counter()
+    hydrate_results(collection, payloads)
+    cached_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    hydrate_results_per_hit(collection, payloads)
+    per_hit_ms = (time.perf_counter() - start) * 1000
 
-def search(query_type, query, collection="booths", field=None, limit=10):
-    """検索を実行する"""
+    print(f"ベクトル化: {timing['embed_ms']:.1f}ms, 検索: {timing['search_ms']:.1f}ms, "
+          f"補完: {timing['hydrate_ms']:.2f}ms（{len(payloads)}件, 接続{read_pool.opened}つ）", file=sys.stderr)
+    print(f"補完（2回目）: {cached_ms:.2f}ms（新しい接続{read_pool.opened - opened_before}つ, "
+          f"ブースキャッシュ: {booth_cache.stats()}）", file=sys.stderr)
+    print(f"比較: 1件ずつ補完した場合 {per_hit_ms:.2f}ms（接続{len(payloads)}つ）", file=sys.stderr)
+    print(query_cache.describe_stats(), file=sys.stderr)
+
+def search(query_type, query, collection="booths", field=None, limit=10, use_cache=True):
+    """検索を実行する（同じ検索の結果はキャッシュから返す）"""
     if query_type == "vector":
-        return search_by_vector(query, collection, limit)
+        search_func = lambda: search_by_vector(query, collection, limit)
+        query_filter = None
+    elif query_type == "combined":
+        search_func = lambda: search_combined(query, limit, limit)
+        query_filter = None
+    elif query_type == "hybrid":
+        search_func = lambda: search_hybrid(query, collection, limit)
+        query_filter = None
     elif query_type == "text":
         if not field:
             raise ValueError("テキスト検索にはフィールド名が必要です")
-        return search_by_text(field, query, collection, limit)
+        search_func = lambda: search_by_text(field, query, collection, limit)
+        query_filter = {field: query}
     else:
-        raise ValueError("無効な検索タイプです：vector または text を指定してください")
+        raise ValueError("無効な検索タイプです：vector・combined・hybrid・text のいずれかを指定してください")
+    
+    if not use_cache:
+        return search_func()
+    key = make_cache_key(query_type, collection, query, query_filter, limit)
+    return result_cache.get_or_search(key, search_func)
 
 def main():
     # コマンドライン引数を使用した簡単な例
     import argparse
     
     parser = argparse.ArgumentParser(description='Qdrantでベクトル検索やテキスト検索を実行します。')
-    parser.add_argument('--type', choices=['vector', 'text'], default='vector',
-                        help='検索タイプ (vector または text)')
+    parser.add_argument('--type', choices=['vector', 'combined', 'hybrid', 'text'], default='vector',
+                        help='検索タイプ (vector、combined（ブースとアイテムを同時に）、hybrid（ベクトル＋名前などの部分一致）、または text)')
     parser.add_argument('--collection', choices=['booths', 'items'], default='booths',
                         help='検索するコレクション (booths または items)')
-    parser.add_argument('--query', required=True, help='検索クエリ')
-    parser.add_argument('--field', help='テキスト検索に使用するフィールド名 (例: name, twitter, instagram, author)')
+    parser.add_argument('--query', help='検索クエリ')
+    parser.add_argument('--queries-file',
+                        help='1行1クエリのファイルを指定すると、まとめてベクトル検索して全結果とqueries/秒を出力する')
+    parser.add_argument('--field', help='テキスト検索に使用するフィールド名 (例: name, twitter, area, author, booth_name)')
     parser.add_argument('--limit', type=int, default=10, help='結果の最大数')
+    parser.add_argument('--similar-to', type=int,
+                        help='指定したIDのブース・アイテムに似たものを返す（事前計算した近傍があればそれを使う）')
+    parser.add_argument('--timing', action='store_true',
+                        help='ベクトル検索の所要時間（補完のコストを含む）を標準エラーに表示する')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='同じ検索を繰り返す回数（検索結果キャッシュのヒット率と省けた時間を標準エラーに表示する）')
     
     args = parser.parse_args()
+    if not args.query and not args.queries_file and args.similar_to is None:
+        parser.error("--query・--queries-file・--similar-to のいずれかを指定してください")
     
     try:
-        results = search(args.type, args.query, args.collection, args.field, args.limit)
+        if args.similar_to is not None:
+            results = search_similar(args.similar_to, args.collection, args.limit)
+        elif args.queries_file:
+            with open(args.queries_file, encoding='utf-8') as f:
+                queries = [line.strip() for line in f if line.strip()]
+            timing = {}
+            pages = search_batch(queries, args.collection, args.limit, timing=timing)
+            results = [{'query': query, 'results': page} for query, page in zip(queries, pages)]
+            print_batch_timing(len(queries), timing)
+        elif args.timing and args.type == "vector":
+            timing = {}
+            results = search_by_vector(args.query, args.collection, args.limit, timing=timing)
+            print_timing(args.collection, timing)
+        else:
+            for _ in range(max(1, args.repeat)):
+                results = search(args.type, args.query, args.collection, args.field, args.limit)
+            if args.repeat > 1:
+                print(result_cache.describe_stats(), file=sys.stderr)
         print(json.dumps(results, ensure_ascii=False, indent=2))
     except Exception as e:
         print(f"エラーが発生しました: {e}")
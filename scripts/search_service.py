@@ -0,0 +1,143 @@
+import json
+import time
+import argparse
+import concurrent.futures
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import search_db
+from search_cache import make_cache_key
+
+# ブースとアイテムの同時検索（search_db.search_combined）を返す小さなHTTPサービス。
+#   GET /search?q=...&booths=3&items=3  … {'booths': [...], 'items': [...], 'merged': [...]}
+#   GET /health                          … 稼働確認と、クエリキャッシュ・検索結果キャッシュの統計
+# クエリのベクトル化は1回だけで、2つのコレクションへの検索は並行して行う。
+
+DEFAULT_PORT = 8787
+MAX_LIMIT = 50
+
+class SearchHandler(BaseHTTPRequestHandler):
+    """検索APIのリクエストハンドラー"""
+
+    def send_json(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        if url.path == '/health':
+            self.send_json(200, {
+                'status': 'ok',
+                'query_cache': search_db.query_cache.stats(),
+                'result_cache': search_db.result_cache.stats(),
+            })
+            return
+        if url.path != '/search':
+            self.send_json(404, {'error': 'not found'})
+            return
+
+        query = (params.get('q') or [''])[0].strip()
+        if not query:
+            self.send_json(400, {'error': 'q を指定してください'})
+            return
+        try:
+            booth_limit = min(int((params.get('booths') or ['3'])[0]), MAX_LIMIT)
+            item_limit = min(int((params.get('items') or ['3'])[0]), MAX_LIMIT)
+        except ValueError:
+            self.send_json(400, {'error': 'booths/items は整数で指定してください'})
+            return
+
+        start = time.perf_counter()
+        try:
+            key = make_cache_key('combined', 'booths+items', query, None, (booth_limit, item_limit))
+            result = search_db.result_cache.get_or_search(
+                key, lambda: search_db.search_combined(query, booth_limit, item_limit))
+        except Exception as e:
+            print(f"検索中にエラーが発生しました: {e}")
+            self.send_json(500, {'error': str(e)})
+            return
+        result['elapsed_ms'] = (time.perf_counter() - start) * 1000
+        self.send_json(200, result)
+
+    def log_message(self, format, *args):
+        print(f"{self.address_string()} {format % args}")
+
+def embed_uncached(query):
+    """キャッシュを使わずにクエリをベクトル化する（ベンチマーク用）"""
+    return search_db.voyage.embed(
+        texts=[query],
+        model=search_db.EMBEDDING_MODEL,
+        input_type="query",
+        output_dimension=search_db.EMBEDDING_DIMENSION,
+        truncation=True
+    ).embeddings[0]
+
+def run_benchmark(queries, booth_limit=3, item_limit=3):
+    """チャット1回分の検索について、別々の検索（ベクトル化2回・順番に検索）と
+    同時検索（ベクトル化1回・並行して検索）のレイテンシとベクトル化の回数を比較する"""
+    from benchmark_index import percentile
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+
+    def separate(query):
+        booth_hits = search_db.search_vector_hits("booths", embed_uncached(query), booth_limit)
+        item_hits = search_db.search_vector_hits("items", embed_uncached(query), item_limit)
+        return 2, booth_hits, item_hits
+
+    def combined(query):
+        query_vector = embed_uncached(query)
+        booth_future = executor.submit(search_db.search_vector_hits, "booths", query_vector, booth_limit)
+        item_future = executor.submit(search_db.search_vector_hits, "items", query_vector, item_limit)
+        return 1, booth_future.result(), item_future.result()
+
+    print(f"{len(queries)}件のクエリで比較します（ブース{booth_limit}件 + アイテム{item_limit}件）")
+    results = {}
+    for label, func in (('別々に検索', separate), ('同時に検索', combined)):
+        latencies = []
+        embed_calls = 0
+        for query in queries:
+            start = time.perf_counter()
+            calls, booth_hits, item_hits = func(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+            embed_calls += calls
+            results.setdefault(query, []).append(([hit.id for hit in booth_hits], [hit.id for hit in item_hits]))
+        print(f"{label}: p50={percentile(latencies, 50):.1f}ms  p95={percentile(latencies, 95):.1f}ms  "
+              f"ベクトル化 {embed_calls / len(queries):.1f}回/クエリ")
+    executor.shutdown()
+
+    mismatched = [query for query, (a, b) in results.items() if a != b]
+    if mismatched:
+        print(f"※ {len(mismatched)}件のクエリで結果が一致しませんでした: {mismatched[:3]}")
+    else:
+        print("両方の方法で検索結果は一致しました")
+
+def main():
+    parser = argparse.ArgumentParser(description='ブースとアイテムを同時に検索するHTTPサービスを起動します。')
+    parser.add_argument('--host', default='127.0.0.1', help='待ち受けるアドレス')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='待ち受けるポート')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='サービスを起動せずに、別々の検索と同時検索のレイテンシを比較する')
+    parser.add_argument('--queries-file', help='ベンチマーク用のクエリファイル（1行1クエリ）')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        from benchmark_index import DEFAULT_QUERIES_FILE, load_queries
+        run_benchmark(load_queries(args.queries_file or DEFAULT_QUERIES_FILE))
+        return
+
+    server = ThreadingHTTPServer((args.host, args.port), SearchHandler)
+    print(f"検索サービスを起動しました: http://{args.host}:{args.port}/search?q=...")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(search_db.query_cache.describe_stats())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+import argparse
+from clients import models
+
+from create_vector_db import (
+    qdrant,
+    get_database_connection,
+    build_booth_text,
+    build_item_text,
+    build_booth_payload,
+    build_item_payload,
+    embed_texts,
+)
+from change_tracking import (
+    refresh_all,
+    fetch_by_ids,
+    hash_value,
+    get_sync_state,
+    record_synced,
+    forget_synced,
+)
+from data_version import bump_data_version
+
+# 一度にQdrantへ送るポイント数
+UPSERT_BATCH_SIZE = 200
+DELETE_BATCH_SIZE = 1000
+
+def find_changed_booth_ids(conn):
+    """前回の同期以降に変更されたブース（またはそのアイテム）のIDを取得する。
+    アイテムの削除・追加・移動はトリガーでブースのupdated_atを進めるので、ここで拾える（create_db.py参照）"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT b.id FROM booths b
+        LEFT JOIN vector_sync_state s ON s.collection = 'booths' AND s.point_id = b.id
+        WHERE s.point_id IS NULL
+           OR b.updated_at > s.synced_at
+           OR EXISTS (
+               SELECT 1 FROM items i WHERE i.booth_id = b.id AND i.updated_at > s.synced_at
+           )
+    ''')
+    return [row[0] for row in cursor.fetchall()]
+
+def find_changed_item_ids(conn):
+    """前回の同期以降に変更されたアイテム（または所属ブース）のIDを取得する"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT i.id FROM items i
+        LEFT JOIN booths b ON b.id = i.booth_id
+        LEFT JOIN vector_sync_state s ON s.collection = 'items' AND s.point_id = i.id
+        WHERE s.point_id IS NULL
+           OR i.updated_at > s.synced_at
+           OR b.updated_at > s.synced_at
+    ''')
+    return [row[0] for row in cursor.fetchall()]
+
+def load_booth_documents(conn, booth_ids=None):
+    """ブースのベクトル化用テキストとペイロードを {id: (text, payload)} で返す"""
+    cursor = conn.cursor()
+    if booth_ids is None:
+        booths = [dict(row) for row in cursor.execute("SELECT * FROM booths ORDER BY id").fetchall()]
+        item_rows = cursor.execute("SELECT * FROM items ORDER BY id").fetchall()
+    else:
+        # 対象のブースとそのアイテムだけを読み込む
+        booths = sorted((dict(row) for row in fetch_by_ids(conn, "SELECT * FROM booths WHERE id IN ({ids})", booth_ids)),
+                        key=lambda booth: booth['id'])
+        item_rows = sorted(fetch_by_ids(conn, "SELECT * FROM items WHERE booth_id IN ({ids})", booth_ids),
+                           key=lambda row: row['id'])
+
+    # アイテムはブースごとにまとめて一度だけ読み込む
+    items_by_booth = {}
+    for row in item_rows:
+        items_by_booth.setdefault(row['booth_id'], []).append(dict(row))
+
+    documents = {}
+    for booth in booths:
+        booth_items = items_by_booth.get(booth['id'], [])
+        documents[booth['id']] = (
+            build_booth_text(booth, booth_items),
+            build_booth_payload(booth, booth_items),
+        )
+    return documents
+
+def load_item_documents(conn, item_ids=None):
+    """アイテムのベクトル化用テキストとペイロードを {id: (text, payload)} で返す"""
+    query = '''
+        SELECT i.*, b.name as booth_name, b.area as booth_area, b.area_number as booth_area_number
+        FROM items i
+        JOIN booths b ON i.booth_id = b.id
+    '''
+    if item_ids is None:
+        items = [dict(row) for row in conn.execute(f"{query} ORDER BY i.id").fetchall()]
+        booth_rows = conn.execute("SELECT * FROM booths").fetchall()
+    else:
+        # 対象のアイテムと所属ブースだけを読み込む
+        items = sorted((dict(row) for row in fetch_by_ids(conn, f"{query} WHERE i.id IN ({{ids}})", item_ids)),
+                       key=lambda item: item['id'])
+        booth_rows = fetch_by_ids(conn, "SELECT * FROM booths WHERE id IN ({ids})", {item['booth_id'] for item in items})
+    booths = {row['id']: dict(row) for row in booth_rows}
+
+    documents = {}
+    for item in items:
+        documents[item['id']] = (
+            build_item_text(item),
+            build_item_payload(item, booths.get(item['booth_id'])),
+        )
+    return documents
+
+DOCUMENT_LOADERS = {
+    'booths': load_booth_documents,
+    'items': load_item_documents,
+}
+
+CHANGE_FINDERS = {
+    'booths': find_changed_booth_ids,
+    'items': find_changed_item_ids,
+}
+
+def fetch_qdrant_point_ids(collection):
+    """Qdrantのコレクションに存在するポイントIDをすべて取得する（ペイロード・ベクトルなし）"""
+    point_ids = set()
+    offset = None
+    while True:
+        points, offset = qdrant.scroll(
+            collection_name=collection,
+            limit=1000,
+            offset=offset,
+            with_payload=False,
+            with_vectors=False
+        )
+        point_ids.update(point.id for point in points)
+        if offset is None:
+            break
+    return point_ids
+
+def fetch_sqlite_ids(conn, collection):
+    """SQLiteに存在するIDをすべて取得する"""
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT id FROM {collection}")
+    return {row[0] for row in cursor.fetchall()}
+
+def delete_points(conn, collection, point_ids):
+    """ポイントをまとめてQdrantから削除し、同期状態も削除する"""
+    point_ids = sorted(point_ids)
+    for i in range(0, len(point_ids), DELETE_BATCH_SIZE):
+        batch_ids = point_ids[i:i+DELETE_BATCH_SIZE]
+        qdrant.delete(
+            collection_name=collection,
+            points_selector=models.PointIdsList(points=batch_ids),
+            wait=True
+        )
+        forget_synced(conn, collection, batch_ids)
+
+def delete_removed_points(conn, collection, dry_run=False):
+    """SQLiteから消えた行に対応するポイントをQdrantから削除する"""
+    removed_ids = sorted(fetch_qdrant_point_ids(collection) - fetch_sqlite_ids(conn, collection))
+    if not removed_ids:
+        return 0
+
+    print(f"{collection}: {len(removed_ids)}件のポイントを削除します")
+    if dry_run:
+        return len(removed_ids)
+
+    delete_points(conn, collection, removed_ids)
+    return len(removed_ids)
+
+def sync_collection(conn, collection, full=False, dry_run=False, ids=None):
+    """変更のあった行だけを再ベクトル化・アップサートする。
+    テキストが変わった行は埋め込みからやり直し、ペイロードだけが変わった行はペイロードのみ上書きする"""
+    if ids is not None:
+        candidate_ids = ids
+    elif full:
+        candidate_ids = None
+    else:
+        candidate_ids = CHANGE_FINDERS[collection](conn)
+        if not candidate_ids:
+            print(f"{collection}: 変更はありません")
+            return {'embedded': 0, 'payload_updated': 0, 'unchanged': 0}
+
+    documents = DOCUMENT_LOADERS[collection](conn, candidate_ids)
+    sync_state = get_sync_state(conn, collection, None if candidate_ids is None else list(documents))
+
+    to_embed = []
+    to_update_payload = []
+    unchanged = []
+    for point_id, (text, payload) in documents.items():
+        text_hash = hash_value(text)
+        payload_hash = hash_value(payload)
+        synced_text_hash, synced_payload_hash, _ = sync_state.get(point_id, (None, None, None))
+        if text_hash != synced_text_hash:
+            to_embed.append((point_id, text, payload, text_hash, payload_hash))
+        elif payload_hash != synced_payload_hash:
+            to_update_payload.append((point_id, payload, text_hash, payload_hash))
+        else:
+            unchanged.append((point_id, text_hash, payload_hash))
+
+    print(f"{collection}: 候補{len(documents)}件 / 再ベクトル化{len(to_embed)}件 / "
+          f"ペイロード更新{len(to_update_payload)}件 / 変更なし{len(unchanged)}件")
+
+    if dry_run:
+        return {'embedded': len(to_embed), 'payload_updated': len(to_update_payload), 'unchanged': len(unchanged)}
+
+    # 変更がなかった候補も同期時刻を更新して、次回の候補から外す
+    record_synced(conn, collection, unchanged)
+
+    # テキストが変わった行をバッチでベクトル化してアップサート（1バッチでAPI呼び出し1回）
+    for i in range(0, len(to_embed), UPSERT_BATCH_SIZE):
+        batch = to_embed[i:i+UPSERT_BATCH_SIZE]
+        vectors = embed_texts([text for _, text, _, _, _ in batch], batch_size=UPSERT_BATCH_SIZE)
+        qdrant.upsert(
+            collection_name=collection,
+            points=[
+                models.PointStruct(id=point_id, vector=vector, payload=payload)
+                for (point_id, _, payload, _, _), vector in zip(batch, vectors)
+            ],
+            wait=True
+        )
+        record_synced(conn, collection, [
+            (point_id, text_hash, payload_hash) for point_id, _, _, text_hash, payload_hash in batch
+        ])
+        print(f"{collection}: {min(i+UPSERT_BATCH_SIZE, len(to_embed))}/{len(to_embed)}件をアップサートしました")
+
+    # ペイロードだけが変わった行はベクトルを送らずに上書き
+    for i in range(0, len(to_update_payload), UPSERT_BATCH_SIZE):
+        batch = to_update_payload[i:i+UPSERT_BATCH_SIZE]
+        qdrant.batch_update_points(
+            collection_name=collection,
+            update_operations=[
+                models.OverwritePayloadOperation(
+                    overwrite_payload=models.SetPayload(payload=payload, points=[point_id])
+                )
+                for point_id, payload, _, _ in batch
+            ],
+            wait=True
+        )
+        record_synced(conn, collection, [
+            (point_id, text_hash, payload_hash) for point_id, _, text_hash, payload_hash in batch
+        ])
+
+    return {'embedded': len(to_embed), 'payload_updated': len(to_update_payload), 'unchanged': len(unchanged)}
+
+def mark_collection_synced(conn, collection):
+    """現在のSQLiteの内容がQdrantに反映済みであると記録する（フルアップロード直後に使う）"""
+    documents = DOCUMENT_LOADERS[collection](conn)
+    record_synced(conn, collection, [
+        (point_id, hash_value(text), hash_value(payload))
+        for point_id, (text, payload) in documents.items()
+    ])
+    print(f"{collection}: {len(documents)}件を同期済みとして記録しました")
+
+def sync_all(collections=('booths', 'items'), full=False, dry_run=False, mark_synced=False):
+    """変更追跡情報を更新し、各コレクションを差分同期する"""
+    conn = get_database_connection()
+    try:
+        changed_booths, changed_items = refresh_all(conn)
+        print(f"変更を検出: ブース{len(changed_booths)}件, アイテム{len(changed_items)}件")
+
+        changed_collections = []
+        for collection in collections:
+            if mark_synced:
+                mark_collection_synced(conn, collection)
+                continue
+            result = sync_collection(conn, collection, full=full, dry_run=dry_run)
+            deleted = delete_removed_points(conn, collection, dry_run=dry_run)
+            print(f"{collection}: 再ベクトル化{result['embedded']}件, "
+                  f"ペイロード更新{result['payload_updated']}件, 削除{deleted}件")
+            if not dry_run and (result['embedded'] or result['payload_updated'] or deleted):
+                changed_collections.append(collection)
+
+        # Qdrantの内容が変わった場合は検索結果のキャッシュを無効にする
+        if changed_collections:
+            bump_data_version(qdrant, f"差分同期: {', '.join(changed_collections)}")
+    finally:
+        conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='SQLiteの変更分だけをQdrantに同期します（コレクションは作り直しません）。')
+    parser.add_argument('--collection', choices=['booths', 'items', 'all'], default='all',
+                        help='同期するコレクション')
+    parser.add_argument('--full', action='store_true',
+                        help='変更追跡に関係なく全行のハッシュを比較する')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Qdrantを更新せずに差分だけを表示する')
+    parser.add_argument('--mark-synced', action='store_true',
+                        help='現在のSQLiteの内容を同期済みとして記録する（フルアップロード直後の初期化用）')
+    args = parser.parse_args()
+
+    collections = ('booths', 'items') if args.collection == 'all' else (args.collection,)
+    sync_all(collections, full=args.full, dry_run=args.dry_run, mark_synced=args.mark_synced)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import item_updater
+from create_db import create_database
+from crawl_engine import CrawlEngine
+from item_updater import ItemUpdater
+
+# item_updater.pyの差分更新のテスト（ページの取得・Qdrantへの反映・削除の反映・データバージョンの更新は差し替える）
+#   python -m unittest test_item_updater
+
+BOOTH_URL = "https://c.bunfree.net/c/tokyo40/{}"
+ITEM_URL = "https://c.bunfree.net/p/tokyo40/{}"
+
+class MovedItemTest(unittest.TestCase):
+    """別のブースに移ったアイテムを、元のブースのページから消えたものとして削除しない"""
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmpdir.name)
+        create_database()
+        conn = sqlite3.connect('bunfree.db')
+        for booth_id in (1, 2, 3):
+            conn.execute("INSERT INTO booths (id, name, url) VALUES (?, ?, ?)",
+                         (booth_id, f"ブース{booth_id}", BOOTH_URL.format(booth_id)))
+        # アイテム2はブース1からブース2に移り、アイテム3はサイトから消えた
+        for item_id, booth_id in ((1, 1), (2, 1), (3, 1), (4, 2), (5, 3)):
+            conn.execute("INSERT INTO items (id, booth_id, name, page_url) VALUES (?, ?, ?, ?)",
+                         (item_id, booth_id, f"アイテム{item_id}", ITEM_URL.format(item_id)))
+        conn.commit()
+        conn.close()
+        self.site = {
+            BOOTH_URL.format(1): [ITEM_URL.format(1)],
+            BOOTH_URL.format(2): [ITEM_URL.format(4), ITEM_URL.format(2)],
+            BOOTH_URL.format(3): [ITEM_URL.format(5)],
+        }
+        self.updater = self.make_updater()
+
+    def tearDown(self):
+        self.updater.close()
+        os.chdir(self.cwd)
+        self.tmpdir.cleanup()
+
+    def make_updater(self):
+        """SQLiteだけに接続し、ページの取得を固定のサイトに差し替えたItemUpdaterを作る"""
+        updater = ItemUpdater(db_path=None, engine=CrawlEngine(concurrency=1, rate=0))
+        updater.conn = sqlite3.connect('bunfree.db')
+        updater.conn.row_factory = sqlite3.Row
+        updater.cursor = updater.conn.cursor()
+        updater.qdrant = None
+        updater.get_soup = lambda url: url
+        updater.get_item_links = lambda soup: list(self.site[soup])
+        updater.get_booth_links = lambda list_url: list(self.site)
+        updater.extract_website_url = lambda soup: None
+        updater.parse_item_page = lambda url, booth_id: {
+            'booth_id': booth_id, 'name': f"アイテム{url.rsplit('/', 1)[1]}", 'yomi': None, 'genre': None,
+            'author': None, 'item_type': None, 'page_count': None, 'release_date': None, 'price': None,
+            'item_url': None, 'page_url': url, 'description': None,
+        }
+        updater.synced = []
+        updater.sync_updated_vectors = lambda item_ids, booth_ids: updater.synced.append((item_ids, booth_ids)) or {}
+        return updater
+
+    def run_update(self, **options):
+        with mock.patch.object(item_updater, 'apply_tombstones',
+                               return_value={'booths': set(), 'items': {3}}) as apply_tombstones, \
+                mock.patch.object(item_updater, 'bump_data_version'):
+            summary = self.updater.check_and_update_items(**options)
+        return summary, apply_tombstones
+
+    def assert_moved(self, apply_tombstones):
+        # 削除するのは消えたアイテム3だけで、移ったアイテム2はブース2の所属として残し、同期する
+        removed_booth_ids, removed_item_ids = apply_tombstones.call_args.args[1:3]
+        self.assertEqual(removed_booth_ids, set())
+        self.assertEqual(removed_item_ids, {3})
+        row = self.updater.conn.execute("SELECT booth_id FROM items WHERE id = 2").fetchone()
+        self.assertEqual(row['booth_id'], 2)
+        item_ids, booth_ids = self.updater.synced[-1]
+        self.assertIn(2, item_ids)
+        self.assertTrue({1, 2} <= booth_ids)
+
+    def test_refresh_existing(self):
+        summary, apply_tombstones = self.run_update()
+        self.assert_moved(apply_tombstones)
+        self.assertEqual(summary['deleted_items'], 1)
+
+    def test_new_only(self):
+        # 既存のアイテムのページを読み直さない場合も、所属ブースを付け替える
+        self.updater.known_items = self.updater.fetch_existing_items_by_booth()
+        summary, apply_tombstones = self.run_update(refresh_existing=False)
+        self.assert_moved(apply_tombstones)
+        self.assertEqual(summary['refreshed_items'], 1)
+        # 常駐している場合のメモリ上の一覧でも、移ったアイテムは新しいブースの所属になる
+        self.assertNotIn(ITEM_URL.format(2), self.updater.known_items[1])
+        self.assertEqual(self.updater.known_items[2][ITEM_URL.format(2)], (2, "アイテム2"))
+
+if __name__ == "__main__":
+    unittest.main()
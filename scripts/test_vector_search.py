@@ -1,48 +1,41 @@
 import os
-from dotenv import load_dotenv
-from qdrant_client import QdrantClient
-from qdrant_client.http import models
-import voyageai
+from index_config import default_search_params
+from query_embedding_cache import QueryEmbeddingCache
+from local_index import get_local_index, local_search_enabled
+from clients import Lazy, voyage, create_qdrant_client
 
-# 環境変数の読み込み
-load_dotenv()
-
-# API KEYの取得
-QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
-VOYAGE_API_KEY = os.getenv("VOYAGE_API_KEY")
-
-# Qdrantクライアントの初期化
-qdrant = QdrantClient(
-    url="https://0302bb4c-aef5-4d84-8669-259bd1cdfaa0.eu-west-2-0.aws.cloud.qdrant.io",
-    api_key=QDRANT_API_KEY,
-    timeout=60.0  # タイムアウトを1分に設定
+# 検索テスト用のQdrant（QDRANT_URLが未設定ならクラウドのクラスタ）。クライアントは最初に使うときに作られる
+DEFAULT_QDRANT_URL = "https://0302bb4c-aef5-4d84-8669-259bd1cdfaa0.eu-west-2-0.aws.cloud.qdrant.io"
+qdrant = Lazy(
+    lambda: create_qdrant_client(url=os.getenv("QDRANT_URL", DEFAULT_QDRANT_URL), timeout=60.0),  # タイムアウトは1分
+    "QdrantClient"
 )
 
-# VoyageAIクライアントの初期化
-voyage = voyageai.Client(api_key=VOYAGE_API_KEY)
-
 # 使用するモデルとディメンションの設定
 EMBEDDING_MODEL = "voyage-3-large"
-EMBEDDING_DIMENSION = 2048
+EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", "2048"))  # コレクションの次元数と合わせる
 
-def search_booths(query_text, limit=5):
-    """ブースをベクトル検索する"""
+# 検索クエリのベクトルのキャッシュ（同じクエリではAPIを呼ばない）
+query_cache = Lazy(lambda: QueryEmbeddingCache(voyage, EMBEDDING_MODEL, EMBEDDING_DIMENSION), "QueryEmbeddingCache")
+
+def search_booths(query_text, limit=5, query_vector=None):
+    """ブースをベクトル検索する（query_vectorを渡すとベクトル化を省く）"""
     print(f"\n【ブース検索】クエリ: '{query_text}'")
     
-    # クエリをベクトル化
-    query_vector = voyage.embed(
-        texts=[query_text],
-        model=EMBEDDING_MODEL,
-        output_dimension=EMBEDDING_DIMENSION,
-        truncation=True
-    ).embeddings[0]
+    # クエリをベクトル化（キャッシュにあればAPIを呼ばない）
+    if query_vector is None:
+        query_vector = query_cache.embed(query_text)
     
-    # ベクトル検索を実行
-    search_result = qdrant.search(
-        collection_name="booths",
-        query_vector=query_vector,
-        limit=limit
-    )
+    # ベクトル検索を実行（LOCAL_INDEX=trueならメモリ上で全件探索）
+    if local_search_enabled():
+        search_result = get_local_index("booths").search(query_vector, limit)
+    else:
+        search_result = qdrant.search(
+            collection_name="booths",
+            query_vector=query_vector,
+            limit=limit,
+            search_params=default_search_params()
+        )
     
     print(f"\n検索結果（{len(search_result)}件）:")
     for i, hit in enumerate(search_result, 1):
@@ -67,24 +60,24 @@ def search_booths(query_text, limit=5):
     
     return search_result
 
-def search_items(query_text, limit=5):
-    """アイテムをベクトル検索する"""
+def search_items(query_text, limit=5, query_vector=None):
+    """アイテムをベクトル検索する（query_vectorを渡すとベクトル化を省く）"""
     print(f"\n【アイテム検索】クエリ: '{query_text}'")
     
-    # クエリをベクトル化
-    query_vector = voyage.embed(
-        texts=[query_text],
-        model=EMBEDDING_MODEL,
-        output_dimension=EMBEDDING_DIMENSION,
-        truncation=True
-    ).embeddings[0]
+    # クエリをベクトル化（キャッシュにあればAPIを呼ばない）
+    if query_vector is None:
+        query_vector = query_cache.embed(query_text)
     
-    # ベクトル検索を実行
-    search_result = qdrant.search(
-        collection_name="items",
-        query_vector=query_vector,
-        limit=limit
-    )
+    # ベクトル検索を実行（LOCAL_INDEX=trueならメモリ上で全件探索）
+    if local_search_enabled():
+        search_result = get_local_index("items").search(query_vector, limit)
+    else:
+        search_result = qdrant.search(
+            collection_name="items",
+            query_vector=query_vector,
+            limit=limit,
+            search_params=default_search_params()
+        )
     
     print(f"\n検索結果（{len(search_result)}件）:")
     for i, hit in enumerate(search_result, 1):
@@ -106,8 +99,17 @@ def search_items(query_text, limit=5):
     
     return search_result
 
+def search_booths_and_items(query_text, limit=5):
+    """ブースとアイテムを1回のベクトル化で検索する"""
+    query_vector = query_cache.embed(query_text)
+    return search_booths(query_text, limit, query_vector), search_items(query_text, limit, query_vector)
+
 def main():
     """メイン関数"""
+    import argparse
+    parser = argparse.ArgumentParser(description='対話形式でブース・アイテムのベクトル検索を試します。')
+    parser.parse_args()
+
     print("Qdrantベクトル検索テスト")
     
     try:
@@ -128,11 +130,13 @@ def main():
             print("検索タイプを選択してください:")
             print("1: ブース検索")
             print("2: アイテム検索")
+            print("3: ブースとアイテムを同時に検索")
             print("q: 終了")
             
-            choice = input("\n選択 (1/2/q): ").strip().lower()
+            choice = input("\n選択 (1/2/3/q): ").strip().lower()
             
             if choice == 'q':
+                print(query_cache.describe_stats())
                 break
             
             query = input("検索クエリを入力してください: ")
@@ -152,6 +156,8 @@ def main():
                 search_booths(query, limit)
             elif choice == '2':
                 search_items(query, limit)
+            elif choice == '3':
+                search_booths_and_items(query, limit)
             else:
                 print("不正な選択です。もう一度選択してください。")
     
@@ -0,0 +1,152 @@
+import os
+import json
+import sqlite3
+import argparse
+
+from create_db import migrate_tombstones
+from change_tracking import now_iso
+
+# サイト（c.bunfree.net）から消えたブース・アイテムの検出と削除。
+#   最新の一覧にあるURLとSQLiteのURLの差分を「消えたもの」とし、
+#   SQLiteからは行を削除してtombstonesテーブルに元の行を残し、Qdrantからはポイントをまとめて削除する。
+#   クロールが途中で失敗すると一覧が欠けて大量の行が消えたように見えるため、
+#   削除する割合がTOMBSTONE_MAX_RATIOを超えるときは何もしない（--force-deleteで強制）。
+
+TOMBSTONE_MAX_RATIO = float(os.getenv("TOMBSTONE_MAX_RATIO", "0.05"))
+
+# テーブルごとのページURLのカラム
+URL_COLUMNS = {'booths': 'url', 'items': 'page_url'}
+
+def find_removed(conn, table, listed_urls, where='', params=()):
+    """SQLiteにあって最新の一覧にないURLの行を {id: url} で返す（whereで対象を絞れる）"""
+    url_column = URL_COLUMNS[table]
+    cursor = conn.execute(f"SELECT id, {url_column} FROM {table} {where}", params)
+    listed_urls = set(listed_urls)
+    return {row[0]: row[1] for row in cursor if row[1] and row[1] not in listed_urls}
+
+def find_booth_items(conn, booth_ids):
+    """ブースに所属するアイテムのIDを返す（ブースと一緒に削除する）"""
+    item_ids = set()
+    booth_ids = list(booth_ids)
+    for i in range(0, len(booth_ids), 500):
+        chunk = booth_ids[i:i+500]
+        placeholders = ','.join('?' * len(chunk))
+        cursor = conn.execute(f"SELECT id FROM items WHERE booth_id IN ({placeholders})", chunk)
+        item_ids.update(row[0] for row in cursor)
+    return item_ids
+
+def count_rows(conn, table):
+    return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+def check_delete_ratio(conn, removed, max_ratio=TOMBSTONE_MAX_RATIO):
+    """削除する割合が上限を超えていないかを確認する。超えているテーブルのメッセージのリストを返す"""
+    problems = []
+    for table, ids in removed.items():
+        total = count_rows(conn, table)
+        if total and len(ids) / total > max_ratio:
+            problems.append(f"{table}: {total}件中{len(ids)}件（{len(ids) / total:.1%}）が消えています"
+                            f"（上限{max_ratio:.0%}）")
+    return problems
+
+def tombstone_rows(conn, table, ids):
+    """行をtombstonesテーブルに記録してから削除する"""
+    migrate_tombstones(conn)
+    conn.row_factory = sqlite3.Row
+    ids = sorted(ids)
+    timestamp = now_iso()
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i+500]
+        placeholders = ','.join('?' * len(chunk))
+        rows = conn.execute(f"SELECT * FROM {table} WHERE id IN ({placeholders})", chunk).fetchall()
+        conn.executemany('''
+            INSERT OR REPLACE INTO tombstones (table_name, row_id, url, row_json, deleted_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(table, row['id'], row[URL_COLUMNS[table]], json.dumps(dict(row), ensure_ascii=False), timestamp)
+              for row in rows])
+        conn.execute(f"DELETE FROM {table} WHERE id IN ({placeholders})", chunk)
+    conn.commit()
+
+def apply_tombstones(conn, removed_booth_ids=(), removed_item_ids=(), max_ratio=TOMBSTONE_MAX_RATIO,
+                     force=False, dry_run=False):
+    """消えたブース（と所属アイテム）・アイテムをSQLiteとQdrantから削除する。
+    削除する割合が上限を超える場合はforceでなければ何もしない。削除したIDを {table: set} で返す"""
+    removed = {
+        'booths': set(removed_booth_ids),
+        'items': set(removed_item_ids) | find_booth_items(conn, removed_booth_ids),
+    }
+    if not any(removed.values()):
+        return {'booths': set(), 'items': set()}
+
+    print(f"サイトから消えたもの: ブース{len(removed['booths'])}件, アイテム{len(removed['items'])}件")
+    problems = check_delete_ratio(conn, removed, max_ratio)
+    if problems:
+        for problem in problems:
+            print(f"  ※ {problem}")
+        if not force:
+            print("  クロールが途中で失敗した可能性があるため削除しません（削除するには--force-deleteを指定）")
+            return {'booths': set(), 'items': set()}
+    if dry_run:
+        return removed
+
+    from sync_vectors import delete_points
+    for table in ('items', 'booths'):
+        if removed[table]:
+            delete_points(conn, table, removed[table])
+            tombstone_rows(conn, table, removed[table])
+            print(f"{table}: {len(removed[table])}件をQdrantとSQLiteから削除しました")
+    return removed
+
+def list_tombstones(conn, limit=20):
+    """最近削除したものを表示する"""
+    migrate_tombstones(conn)
+    cursor = conn.execute('''
+        SELECT table_name, row_id, url, row_json, deleted_at FROM tombstones
+        ORDER BY deleted_at DESC LIMIT ?
+    ''', (limit,))
+    for table, row_id, url, row_json, deleted_at in cursor:
+        name = json.loads(row_json).get('name') if row_json else None
+        print(f"{deleted_at}  {table:<6} ID={row_id}  {name}  {url}")
+
+def restore_tombstones(conn, urls):
+    """削除した行をSQLiteに戻す（Qdrantにはsync_vectors.pyの差分同期で再登録される）"""
+    migrate_tombstones(conn)
+    restored = 0
+    # ブースを先に戻す（アイテムのbooth_idが指す先）
+    for table in ('booths', 'items'):
+        placeholders = ','.join('?' * len(urls))
+        rows = conn.execute(f'''
+            SELECT row_id, row_json FROM tombstones
+            WHERE table_name = ? AND url IN ({placeholders})
+        ''', (table, *urls)).fetchall()
+        for row_id, row_json in rows:
+            row = json.loads(row_json)
+            columns = ', '.join(row)
+            conn.execute(f"INSERT OR REPLACE INTO {table} ({columns}) VALUES ({','.join('?' * len(row))})",
+                         list(row.values()))
+            conn.execute("DELETE FROM tombstones WHERE table_name = ? AND row_id = ?", (table, row_id))
+            restored += 1
+    conn.commit()
+    print(f"{restored}件を戻しました（Qdrantへの反映は sync_vectors.py を実行してください）")
+    return restored
+
+def main():
+    parser = argparse.ArgumentParser(description='サイトから消えたとして削除したブース・アイテムの確認と復元を行います。')
+    parser.add_argument('command', choices=['list', 'restore'], help='list: 最近削除したもの / restore: URLを指定して戻す')
+    parser.add_argument('urls', nargs='*', help='restoreで戻すブース・アイテムのページURL')
+    parser.add_argument('--limit', type=int, default=20, help='listで表示する件数')
+    parser.add_argument('--db', default='bunfree.db', help='SQLiteデータベースのパス')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        if args.command == 'list':
+            list_tombstones(conn, args.limit)
+        else:
+            if not args.urls:
+                parser.error("戻すURLを指定してください")
+            restore_tombstones(conn, args.urls)
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
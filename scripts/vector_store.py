@@ -0,0 +1,63 @@
+import os
+import pickle
+
+# ベクトルファイルの形式:
+#   {"id": ..., "vector": [...], "payload": {...}} を1件ずつpickleで追記したストリーム。
+#   旧形式（全件のリストを1回でpickleしたもの）も読み込める。
+#   追記のみなので、途中保存のたびに全件を書き直す必要がなく、読み込みも1件ずつ遅延して行える。
+
+# voyage-3-largeの最大次元数（この次元数のファイルには次元数を付けない）
+FULL_EMBEDDING_DIMENSION = 2048
+
+def vector_file_for(kind, dimension=FULL_EMBEDDING_DIMENSION, cache_dir="cache"):
+    """ベクトルファイルのパスを返す（kindはbooth/item。既定以外の次元数ではファイルを分ける）"""
+    if dimension == FULL_EMBEDDING_DIMENSION:
+        return os.path.join(cache_dir, f'{kind}_vectors.pkl')
+    return os.path.join(cache_dir, f'{kind}_vectors_{dimension}.pkl')
+
+def append_vector_records(path, records):
+    """ベクトルのレコードをファイルに追記する"""
+    with open(path, 'ab') as f:
+        for record in records:
+            pickle.dump(record, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def iter_vector_records(path):
+    """ベクトルのレコードをファイルから1件ずつ読み込む（ファイルがなければ何も返さない）"""
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                obj = pickle.load(f)
+            except EOFError:
+                break
+            except pickle.UnpicklingError as e:
+                # 書き込み途中で中断された末尾のレコードは無視する
+                print(f"ベクトルファイルの末尾が壊れています（以降を無視します）: {e}")
+                break
+            if isinstance(obj, list):
+                # 旧形式: 全件のリスト
+                yield from obj
+            else:
+                yield obj
+
+def load_vector_ids(path):
+    """ファイルに保存済みのレコードのIDを取得する"""
+    return {record['id'] for record in iter_vector_records(path)}
+
+def first_vector_record(path):
+    """先頭のレコードを返す（検証用のサンプルクエリに使う）"""
+    return next(iter_vector_records(path), None)
+
+def truncate_vector(vector, dimension):
+    """ベクトルを先頭のdimension次元に切り詰めて正規化し直す（Matryoshka埋め込み用）"""
+    truncated = vector[:dimension]
+    norm = sum(value * value for value in truncated) ** 0.5
+    if norm == 0:
+        return list(truncated)
+    return [value / norm for value in truncated]
+
+def iter_truncated_records(path, dimension):
+    """ベクトルを切り詰めながらレコードを1件ずつ読み込む（再ベクトル化なしで小さい次元を試す）"""
+    for record in iter_vector_records(path):
+        yield {**record, 'vector': truncate_vector(record['vector'], dimension)}
@@ -1,15 +1,14 @@
 import sqlite3
-import cloudscraper
-from bs4 import BeautifulSoup
-import time
-from qdrant_client import QdrantClient
-from qdrant_client import models
+import argparse
 import os
+from data_version import bump_data_version
+from clients import create_qdrant_client
+from crawl_engine import CrawlEngine, CrawlProgress, DEFAULT_CONCURRENCY, DEFAULT_RATE
 
 class WebsiteURLPatcher:
-    def __init__(self):
-        # CloudScraperの設定
-        self.scraper = cloudscraper.create_scraper()
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE):
+        # ブースページは並列に取得する（並列数とリクエスト数の上限はcrawl_engine.py参照）
+        self.engine = CrawlEngine(concurrency=concurrency, rate=rate)
         self.base_url = "https://c.bunfree.net"
         
         # データベース接続
@@ -18,19 +17,13 @@ class WebsiteURLPatcher:
         self.conn.row_factory = sqlite3.Row
         self.cursor = self.conn.cursor()
         
-        # Qdrant接続設定
-        self.qdrant_host = os.environ.get("QDRANT_HOST", "localhost")
-        self.qdrant_port = int(os.environ.get("QDRANT_PORT", 6333))
-        self.qdrant = QdrantClient(host=self.qdrant_host, port=self.qdrant_port)
+        # Qdrant接続設定（ペイロードの更新はsync_vectors.pyの差分同期でまとめて行う）
+        self.qdrant_url = os.environ.get("QDRANT_URL")
+        self.qdrant = create_qdrant_client(url=self.qdrant_url, timeout=300.0)
     
     def get_soup(self, url):
         """URLからBeautifulSoupオブジェクトを取得"""
-        try:
-            response = self.scraper.get(url)
-            return BeautifulSoup(response.text, 'html.parser')
-        except Exception as e:
-            print(f"Error fetching {url}: {e}")
-            return None
+        return self.engine.get_soup(url)
     
     def extract_website_url(self, soup):
         """WebサイトURLをhref属性から抽出する"""
@@ -53,82 +46,102 @@ class WebsiteURLPatcher:
         return self.cursor.fetchall()
     
     def update_booth_website_url(self, booth_id, website_url):
-        """ブースのWebサイトURLを更新"""
+        """ブースのWebサイトURLをSQLiteで更新する（Qdrantへは最後にsync_updated_boothsでまとめて反映する）"""
         try:
-            # SQLiteの更新
             self.cursor.execute(
                 "UPDATE booths SET website_url = ? WHERE id = ?",
                 (website_url, booth_id)
             )
             self.conn.commit()
-            
-            # Qdrantの更新
-            self.qdrant.set_payload(
-                collection_name="booths",
-                payload={"website_url": website_url},
-                points=[booth_id]
-            )
-            
             return True
         except Exception as e:
             print(f"Error updating booth {booth_id}: {e}")
             return False
     
-    def patch_website_urls(self):
-        """全ブースのWebサイトURLを修正する"""
+    def sync_updated_booths(self, booth_ids):
+        """WebサイトURLを更新したブースを差分同期でQdrantに反映し、変わったポイント数を返す"""
+        from change_tracking import refresh_all
+        from sync_vectors import sync_collection
+        refresh_all(self.conn, booth_ids=booth_ids, item_ids=[])
+        result = sync_collection(self.conn, 'booths', ids=sorted(booth_ids))
+        return result['embedded'] + result['payload_updated']
+    
+    def scan_booth(self, booth_url):
+        """ブースページからWebサイトURLを抽出する（ワーカースレッドで実行するので、DBには書き込まない）"""
+        soup = self.get_soup(booth_url)
+        if not soup:
+            raise RuntimeError("ブースページを取得できませんでした")
+        return self.extract_website_url(soup)
+    
+    def apply_website_url(self, booth, new_website_url):
+        """URLが変わっていればSQLiteを更新する（呼び出し元のスレッドだけで実行する）。
+        'updated' / 'unchanged' を返す（更新に失敗した場合は例外にして、再実行時にやり直す）"""
+        booth_id, current_website_url = booth['id'], booth['website_url']
+        if not new_website_url or new_website_url == current_website_url:
+            return 'unchanged'
+        print(f"Updating website URL for booth {booth_id}:")
+        print(f"  Old: {current_website_url}")
+        print(f"  New: {new_website_url}")
+        if not self.update_booth_website_url(booth_id, new_website_url):
+            raise RuntimeError("WebサイトURLを更新できませんでした")
+        return 'updated'
+    
+    def patch_website_urls(self, restart=False):
+        """全ブースのWebサイトURLを修正する（ページの取得は並列に行い、更新はこのスレッドだけで行う）。
+        途中で中断した場合は、次の実行で確認済みのブースを飛ばして続きから再開する（restartなら最初から）"""
+        progress = CrawlProgress(self.conn, 'website_url_patch')
+        if restart:
+            progress.clear()
         booths = self.fetch_booths()
         print(f"Found {len(booths)} booths to check")
         
-        updated_count = 0
-        error_count = 0
-        
-        for i, booth in enumerate(booths):
-            booth_id = booth['id']
-            booth_url = booth['url']
-            current_website_url = booth['website_url']
-            
-            print(f"Processing booth {i+1}/{len(booths)}: ID={booth_id}")
-            
-            # ブースページのHTMLを取得
-            soup = self.get_soup(booth_url)
-            if not soup:
-                print(f"Could not fetch booth page for ID={booth_id}")
+        results = self.engine.run(
+            [(booth['id'], booth) for booth in booths],
+            lambda booth: self.scan_booth(booth['url']),
+            lambda booth_id, booth, website_url: self.apply_website_url(booth, website_url),
+            progress=progress,
+            desc="ブース確認中",
+        )
+        # 前回の実行で更新した分も含めて、Qdrantにまとめて反映する
+        updated_ids = [int(booth_id) for booth_id, result in results.items() if result == 'updated']
+        updated_count = len(updated_ids)
+        error_count = self.engine.stats['task_errors']
+        if updated_ids:
+            try:
+                changed_points = self.sync_updated_booths(updated_ids)
+            except Exception as e:
+                print(f"Qdrantへの反映でエラー（再実行すると反映し直します）: {e}")
                 error_count += 1
-                continue
-            
-            # WebサイトURLを抽出
-            new_website_url = self.extract_website_url(soup)
-            
-            # URLが変わっていれば更新
-            if new_website_url and new_website_url != current_website_url:
-                print(f"Updating website URL for booth {booth_id}:")
-                print(f"  Old: {current_website_url}")
-                print(f"  New: {new_website_url}")
-                
-                if self.update_booth_website_url(booth_id, new_website_url):
-                    updated_count += 1
-                else:
-                    error_count += 1
-            
-            # レート制限対策
-            if (i + 1) % 10 == 0:
-                print(f"Processed {i+1} booths, taking a short break...")
-                time.sleep(0.1)
+            else:
+                # Qdrantの内容を変えた場合は検索結果のキャッシュを無効にする
+                if changed_points:
+                    bump_data_version(self.qdrant, f"WebサイトURLの更新: ブース{updated_count}件")
+        # 全件を確認してQdrantにも反映できたら進捗の記録を消す
+        if not error_count:
+            progress.clear()
     
         print("\n===== パッチ完了 =====")
         print(f"確認したブース数: {len(booths)}")
         print(f"更新したブース数: {updated_count}")
         print(f"エラーのあったブース数: {error_count}")
+        print(f"取得: {self.engine.describe_stats()}, {self.engine.stats.get('seconds', 0):.1f}秒")
     
     def close(self):
         """リソースをクローズ"""
+        self.engine.close()
         if self.conn:
             self.conn.close()
 
 def main():
-    patcher = WebsiteURLPatcher()
+    parser = argparse.ArgumentParser(description='ブースページからWebサイトURLを取り直し、変わったものをSQLiteとQdrantに反映します。')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help='ページを同時に取得する数')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE, help='1秒あたりのリクエスト数の上限（0で無制限）')
+    parser.add_argument('--restart', action='store_true', help='前回中断した実行の続きからではなく、最初から確認する')
+    args = parser.parse_args()
+
+    patcher = WebsiteURLPatcher(concurrency=args.concurrency, rate=args.rate)
     try:
-        patcher.patch_website_urls()
+        patcher.patch_website_urls(restart=args.restart)
     finally:
         patcher.close()
 